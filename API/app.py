@@ -1,15 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 import numpy as np
 import random
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
 import os
 import datetime
-import google.generativeai as genai
 import uuid
-import numpy as np
-from collections import defaultdict
+import atexit
+import bisect
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sqlite3
+import glob
+import threading
+import time
+import weakref
+from collections import defaultdict, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 # app.py (add these imports at the top)
 from functools import wraps
@@ -17,12 +30,86 @@ from flask import g, jsonify, request
 import firebase_admin
 from firebase_admin import auth, firestore, credentials
 
-# Initialize Firebase before creating the Flask app
-cred = credentials.Certificate('your-file.json')
-firebase_admin.initialize_app(cred)
+# LEARNSMART_OFFLINE=1 imports the module without Firebase, the model or Gemini so the
+# quiz engine can be driven by tools such as simulate.py, which install their own fakes
+OFFLINE = os.environ.get('LEARNSMART_OFFLINE') == '1'
+
+# Structured logging for the API. Records go through a queue so request threads never block
+# on the handler's I/O; a single listener thread formats and writes them.
+#   LOG_LEVEL=INFO                      default level for every subsystem
+#   LOG_LEVELS=grading=DEBUG,rl=WARNING per-subsystem overrides (startup, store, grading, quiz, rl, api)
+#   LOG_FORMAT=text|json                json emits one object per line with the structured fields
+#   LOG_FILE=path                       default stderr
+#   LOG_ANSWER_SAMPLE_RATE=0.01         share of per-answer debug records (answers, feedback) kept
+class JsonLogFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextLogFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class SampledRecordFilter(logging.Filter):
+    """Drops all but a random share of records logged with extra={'sampled': True}"""
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return not getattr(record, 'sampled', False) or random.random() < self.rate
+
+def configure_logging():
+    root = logging.getLogger('learnsmart')
+    if root.handlers:
+        return root
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    root.propagate = False
+    for override in filter(None, os.environ.get('LOG_LEVELS', '').split(',')):
+        name, _, level = override.partition('=')
+        logging.getLogger(f"learnsmart.{name.strip()}").setLevel(level.strip().upper())
+
+    log_file = os.environ.get('LOG_FILE')
+    handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    if os.environ.get('LOG_FORMAT', 'text') == 'json':
+        handler.setFormatter(JsonLogFormatter())
+    else:
+        handler.setFormatter(TextLogFormatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Filtered before the record is queued, so dropped samples cost no formatting or I/O
+    queue_handler.addFilter(SampledRecordFilter(float(os.environ.get('LOG_ANSWER_SAMPLE_RATE', 0.01))))
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return root
 
-# Initialize Firestore
-db = firestore.client()
+configure_logging()
+startup_logger = logging.getLogger('learnsmart.startup')
+store_logger = logging.getLogger('learnsmart.store')
+grading_logger = logging.getLogger('learnsmart.grading')
+audit_logger = logging.getLogger('learnsmart.grading.audit')
+answer_logger = logging.getLogger('learnsmart.grading.answers')
+quiz_logger = logging.getLogger('learnsmart.quiz')
+rl_logger = logging.getLogger('learnsmart.rl')
+api_logger = logging.getLogger('learnsmart.api')
+
+# Firestore client; set by load_firebase() once the background startup gets to it
+db = None
 
 app = Flask(__name__)
 CORS(app, resources={
@@ -35,23 +122,762 @@ CORS(app, resources={
     }
 })
 
+def quantized_model_path(model_path):
+    """Where quantize-model.py writes the int8 export of a model directory"""
+    return model_path.rstrip('/\\') + '-int8.pt'
+
+def model_version(model_path):
+    """Fingerprint of a model's files, so weights retrained in place get a new model name"""
+    paths = [model_path] if os.path.isfile(model_path) else sorted(
+        os.path.join(root, name) for root, _, files in os.walk(model_path) for name in files
+    )
+    digest = hashlib.blake2b(digest_size=6)
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, model_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def quantize_model(model):
+    """Dynamic int8 quantization of every Linear layer, for CPU-only inference"""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def load_quantized_model(model_path):
+    """
+    The int8 export of a model directory. The export is only a state_dict, loaded with
+    weights_only=True so that reading it cannot run code; the architecture is rebuilt from
+    the fp32 model directory and quantized before the int8 weights are put in place.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    model = quantize_model(SentenceTransformer(model_path, device='cpu'))
+    state = torch.load(quantized_model_path(model_path), map_location='cpu', weights_only=True)
+    model.load_state_dict(state)
+    return model
+
+def local_tier(positive_sim, negative_sim, accept, reject, min_margin):
+    """
+    The local grading rule: 1 accept, -1 reject, 0 escalate to Gemini. Works elementwise on
+    arrays, so quantize-model.py checks parity with the same rule that grades students.
+    """
+    positive_sim = np.asarray(positive_sim)
+    margin = positive_sim - np.asarray(negative_sim)
+    accepted = (positive_sim >= accept) & (margin >= min_margin)
+    rejected = (positive_sim <= reject) | (margin <= -min_margin)
+    return np.where(accepted, 1, np.where(rejected, -1, 0))
+
 class StudentAnswerEvaluator:
-    def __init__(self, model_path, dataset_path):
+    def __init__(self, model_path, dataset_path, bank_path='./questions.db', index_dir='./embedding_index', grading_mode='gemini',
+                 accept_threshold=0.75, reject_threshold=0.45, min_margin=0.1, grading_cache=None,
+                 feedback_broker=None, gemini_batch_size=10, quantize=False, verdict_log=None,
+                 duplicate_threshold=0.9, duplicate_policy='warn', question_store=None):
+        # Imported here so that importing the app does not pay for torch up front
+        from sentence_transformers import SentenceTransformer
+
+        # Seconds spent on each part of initialization, reported by /readyz
+        self.load_timings = {}
+        start = time.perf_counter()
         try:
-            if os.path.exists(model_path):
+            if quantize and os.path.exists(model_path) and os.path.exists(quantized_model_path(model_path)):
+                # Prebuilt int8 export, whose weights passed quantize-model.py's parity check
+                self.model = load_quantized_model(model_path)
+                self.model_name = f"{model_path}@{model_version(quantized_model_path(model_path))}+int8"
+                quantize = False
+                startup_logger.info("Quantized model loaded successfully")
+            elif os.path.exists(model_path):
                 self.model = SentenceTransformer(model_path)
-                print("Trained model loaded successfully")
+                self.model_name = f"{model_path}@{model_version(model_path)}"
+                startup_logger.info("Trained model loaded successfully")
             else:
                 self.model = SentenceTransformer('all-MiniLM-L6-v2')
-                print("Using default SentenceTransformer model")
+                self.model_name = 'all-MiniLM-L6-v2'
+                startup_logger.info("Using default SentenceTransformer model")
         except Exception as e:
-            print(f"Error loading model: {str(e)}")
+            startup_logger.error(f"Error loading model: {str(e)}")
             self.model = SentenceTransformer('all-MiniLM-L6-v2')
-            
+            self.model_name = 'all-MiniLM-L6-v2'
+        if quantize:
+            self.model = quantize_model(self.model)
+            # Reference vectors from the fp32 model are not reused for the int8 one
+            self.model_name = f"{self.model_name}+int8"
+            startup_logger.info("Model quantized to int8")
+        self.load_timings['model'] = time.perf_counter() - start
+
+        start = time.perf_counter()
         try:
-            self.df = pd.read_excel(dataset_path)
+            # The xlsx is only read the first time, to seed the SQLite question bank. A store passed
+            # in is shared with earlier evaluators, so re-initializing opens no second connection.
+            self.question_store = question_store or QuestionBankStore(bank_path, seed_excel_path=dataset_path)
+            # The published bank: an immutable snapshot that readers use without locking.
+            # Edits build the next snapshot and swap it in; quiz sessions pin the one they started on.
+            self.bank = QuestionBankSnapshot(0, self.question_store.load_dataframe())
         except Exception as e:
             raise ValueError(f"Could not load dataset: {str(e)}")
+        self.load_timings['question_bank'] = time.perf_counter() - start
+
+        # Serializes writers; readers never take it. The epoch keeps /api/questions ETags from
+        # an earlier process matching after a restart, when versions start over at 0.
+        self._bank_write_lock = threading.Lock()
+        self.bank_epoch = uuid.uuid4().hex[:8]
+        self.question_list_cache = QuestionListCache()
+        # Every snapshot still referenced by the evaluator, a quiz session or a request
+        self._live_banks = weakref.WeakSet([self.bank])
+        self._compaction_timer = None
+        self._compaction_lock = threading.Lock()
+
+        # Reference answers never change between requests, so encode them once up front
+        start = time.perf_counter()
+        self.answer_index = AnswerEmbeddingIndex(index_dir, self.model, self.model_name)
+        try:
+            if self.answer_index.sync(self.bank.frame(), pinned=self.pinned_banks):
+                self.answer_index.save()
+        except Exception as e:
+            store_logger.error(f"Error building answer embedding index: {str(e)}")
+        self.load_timings['answer_index'] = time.perf_counter() - start
+
+        # Question texts, for rejecting or flagging paraphrases of existing questions
+        start = time.perf_counter()
+        self.question_text_index = QuestionTextIndex(self.model, index_dir, self.model_name)
+        try:
+            if self.question_text_index.sync(self.bank.frame()):
+                self.question_text_index.save()
+        except Exception as e:
+            store_logger.error(f"Error building question text index: {str(e)}")
+        self.load_timings['question_text_index'] = time.perf_counter() - start
+        # New questions at or above this text similarity to an existing one are near-duplicates;
+        # the policy says whether they are created with a warning ('warn') or refused ('reject')
+        self.duplicate_threshold = duplicate_threshold
+        self.duplicate_policy = duplicate_policy
+
+        # 'gemini' sends every answer to Gemini; 'tiered' decides clear cases locally and
+        # only escalates answers whose similarity falls inside the uncertainty band
+        self.grading_mode = grading_mode
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.min_margin = min_margin
+        self.grading_stats = GradingStats()
+        # Identical answers to the same question reuse the earlier Gemini verdict
+        self.grading_cache = grading_cache if grading_cache is not None else GradingCache()
+        self.feedback_broker = feedback_broker if feedback_broker is not None else FeedbackBroker()
+        # Batch grading sends escalated answers to Gemini this many per request
+        self.gemini_batch_size = gemini_batch_size
+        # Fresh Gemini verdicts are recorded as training data for the local model (see distill.py)
+        self.verdict_log = verdict_log
+
+    @property
+    def question_index(self):
+        """Index of the currently published bank"""
+        return self.bank.index
+
+    def live_questions(self):
+        """Frame of the currently published bank"""
+        return self.bank.frame()
+
+    def bank_version_tag(self, bank=None):
+        return f"{self.bank_epoch}-{(bank or self.bank).version}"
+
+    def publish(self, bank):
+        """Swap in a new snapshot; a single reference assignment, so readers see old or new, never a mix"""
+        self.bank = bank
+        self._live_banks.add(bank)
+        store_logger.debug("Published question bank version %d (%d questions)", bank.version, len(bank))
+
+    def pinned_banks(self):
+        """Snapshots still in use, whose reference vectors the answer index has to keep"""
+        with self._bank_write_lock:
+            return list(self._live_banks)
+
+    def publish_changes(self, upserts=None, deletes=()):
+        with self._bank_write_lock:
+            self.publish(self.bank.with_changes(upserts=upserts, deletes=deletes))
+
+    def add_question(self, record, text_vector=None):
+        """Insert a question and publish a bank that contains it; returns its Unique ID"""
+        with metrics.time('learnsmart_question_store_duration_seconds', op='insert'):
+            question_uid = self.question_store.insert(record)
+        record = dict(record, **{'Unique ID': question_uid})
+        self.question_text_index.upsert(question_uid, record.get('Anchor'), text_vector)
+        # Reference vectors first, so the question is gradeable locally the moment it is visible
+        self.answer_index.upsert(question_uid, record,
+                                 publish=lambda: self.publish_changes(upserts={question_uid: record}))
+        self.schedule_compaction()
+        return question_uid
+
+    def update_question(self, question_id, record):
+        with metrics.time('learnsmart_question_store_duration_seconds', op='update'):
+            self.question_store.update(question_id, record)
+        self.question_text_index.upsert(question_id, record.get('Anchor'))
+        self.answer_index.upsert(question_id, record,
+                                 publish=lambda: self.publish_changes(upserts={question_id: record}))
+        self.schedule_compaction()
+
+    def delete_question(self, question_id):
+        """Remove a question from new quizzes; sessions that already drew it keep grading it from their snapshot"""
+        with metrics.time('learnsmart_question_store_duration_seconds', op='delete'):
+            self.question_store.delete(question_id)
+        self.publish_changes(deletes=[question_id])
+        self.question_text_index.remove(question_id)
+        self.schedule_compaction()
+
+    def reload_bank(self, encoded_texts=None):
+        """Publish a fresh snapshot of the whole bank from the store, e.g. after an import"""
+        while True:
+            # Like compact(): the store is read outside the lock, and the result is only
+            # published if no edit was published meanwhile; otherwise read again so it is kept
+            current = self.bank
+            with metrics.time('learnsmart_question_store_duration_seconds', op='reload'):
+                df = self.question_store.load_dataframe()
+            # Encode new reference answers before the questions become visible
+            if self.answer_index.sync(df, pinned=self.pinned_banks):
+                self.answer_index.schedule_save()
+            if self.question_text_index.sync(df, encoded=encoded_texts):
+                self.question_text_index.schedule_save()
+            with self._bank_write_lock:
+                if self.bank is current:
+                    bank = QuestionBankSnapshot(current.version + 1, df)
+                    self.publish(bank)
+                    return bank
+            store_logger.debug("Question bank changed during reload; reading it again")
+
+    def duplicate_matches(self, vectors, exclude_ids=None, k=3):
+        """
+        For each question-text vector, the indexed questions at or above duplicate_threshold,
+        best first, as {'id', 'text', 'similarity'}. exclude_ids[i] (if given) is the question's
+        own ID, which never counts as its own duplicate.
+        """
+        ids, similarities = self.question_text_index.nearest(vectors, k=k + 1)
+        index = self.bank.index
+        matches = []
+        for row, (row_ids, row_sims) in enumerate(zip(ids, similarities)):
+            own = exclude_ids[row] if exclude_ids is not None else None
+            found = []
+            for question_id, similarity in zip(row_ids, row_sims):
+                record = index.get(int(question_id))
+                if similarity < self.duplicate_threshold or record is None or question_id == own:
+                    continue
+                found.append({
+                    'id': str(question_id),
+                    'text': record['Anchor'],
+                    'similarity': round(float(similarity), 3)
+                })
+            matches.append(found[:k])
+        return matches
+
+    def search_questions(self, query, k=10, topic=None, difficulty=None):
+        """Up to k (question ID, record, similarity) triples, ranked by similarity of the question text to query"""
+        bank = self.bank
+        allowed = None
+        if topic or difficulty:
+            buckets = [
+                ids for (bucket_topic, bucket_difficulty), ids in bank.index.buckets.items()
+                if (not topic or bucket_topic == topic) and (not difficulty or bucket_difficulty == difficulty)
+            ]
+            allowed = np.concatenate(buckets) if buckets else np.zeros(0, dtype=np.int64)
+        vector = self.question_text_index.encode([query])[0]
+        ids, similarities = self.question_text_index.nearest(vector, k=k, allowed=allowed)
+        results = []
+        for question_id, similarity in zip(ids[0], similarities[0]):
+            # The text index can briefly run ahead of the published snapshot during an edit
+            record = bank.index.get(int(question_id))
+            if record is not None:
+                results.append((int(question_id), record, float(similarity)))
+        return results
+
+    def import_questions(self, path, replace=False, on_duplicate='warn'):
+        """
+        Bulk-import an xlsx file with near-duplicate detection against the bank and within
+        the file itself. With on_duplicate='reject' duplicate rows are skipped; with 'warn'
+        they are imported. Returns (imported count, duplicate reports, published bank).
+        """
+        df = pd.read_excel(path)
+        QuestionBankStore.check_columns(df)
+        duplicates = []
+        encoded = {}
+        if on_duplicate != 'allow' and len(df):
+            vectors = self.question_text_index.encode(df['Anchor'].tolist())
+            encoded = {self.question_text_index.fingerprint(text): vector
+                       for text, vector in zip(df['Anchor'].tolist(), vectors)}
+            uids = df['Unique ID'].tolist() if 'Unique ID' in df.columns else [None] * len(df)
+            own_ids = [int(uid) if uid is not None and not pd.isna(uid) else None for uid in uids]
+            # Replacing the bank makes its current questions irrelevant
+            bank_matches = [[]] * len(df) if replace else self.duplicate_matches(vectors, exclude_ids=own_ids)
+            # Paraphrases within the file: compare each row with the rows above it, in blocks
+            file_matches = [None] * len(df)
+            for start in range(0, len(df), 1024):
+                block = vectors[start:start + 1024] @ vectors[:start + 1024].T
+                rows = np.arange(start, start + len(block))
+                block[np.arange(block.shape[1])[None, :] >= rows[:, None]] = -np.inf
+                best = block.argmax(axis=1)
+                for offset, earlier in enumerate(best):
+                    if block[offset, earlier] >= self.duplicate_threshold:
+                        file_matches[start + offset] = (int(earlier), float(block[offset, earlier]))
+            for row in range(len(df)):
+                if not bank_matches[row] and file_matches[row] is None:
+                    continue
+                report = {'row': row + 2, 'text': df['Anchor'].iloc[row], 'matches': bank_matches[row]}
+                if file_matches[row] is not None:
+                    earlier, similarity = file_matches[row]
+                    report['matches'] = report['matches'] + [{
+                        'row': earlier + 2,
+                        'text': df['Anchor'].iloc[earlier],
+                        'similarity': round(similarity, 3)
+                    }]
+                duplicates.append(report)
+            if on_duplicate == 'reject' and duplicates:
+                df = df.drop(index=df.index[[report['row'] - 2 for report in duplicates]])
+
+        with metrics.time('learnsmart_question_store_duration_seconds', op='import_xlsx'):
+            imported = self.question_store.import_frame(df, replace=replace)
+        return imported, duplicates, self.reload_bank(encoded_texts=encoded)
+
+    def schedule_compaction(self, delay=5.0):
+        with self._compaction_lock:
+            if self._compaction_timer is not None:
+                self._compaction_timer.cancel()
+            self._compaction_timer = threading.Timer(delay, self.compact)
+            self._compaction_timer.daemon = True
+            self._compaction_timer.start()
+
+    def compact(self):
+        """Fold the published snapshot's pending edits into a new base frame, off the request path"""
+        try:
+            bank = self.bank
+            if bank.overlay:
+                # Built outside the lock; only published if no edit landed in the meantime
+                folded = bank.folded()
+                with self._bank_write_lock:
+                    if self.bank is bank:
+                        self.publish(folded)
+                    else:
+                        self.schedule_compaction()
+                        return
+            if self.answer_index.sync(self.bank.frame(), pinned=self.pinned_banks):
+                self.answer_index.schedule_save()
+            if self.question_text_index.sync(self.bank.frame()):
+                self.question_text_index.schedule_save()
+        except Exception as e:
+            store_logger.error(f"Error compacting question bank: {str(e)}")
+
+    def encode_answer(self, text):
+        """Encode a single answer as a unit-length vector"""
+        with metrics.time('learnsmart_model_encode_duration_seconds', kind='single'):
+            return self.model.encode(
+                text,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).astype(np.float32)
+
+    def encode_answers(self, texts):
+        """Encode many answers in one batched call, one unit-length row per answer"""
+        with metrics.time('learnsmart_model_encode_duration_seconds', kind='batch'):
+            return self.model.encode(
+                list(texts),
+                batch_size=32,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).astype(np.float32)
+
+    def similarity_fallback(self, question_idx, student_answer, correct_answer, student_embed=None, row=None):
+        """Verdict from similarity to the reference answer, used when Gemini cannot be reached"""
+        metrics.inc('learnsmart_grading_fallback_total')
+        if student_embed is None:
+            student_embed = self.encode_answer(student_answer)
+        references = self.answer_index.get(question_idx, row) if question_idx is not None else None
+        if references is not None:
+            correct_embed = references[0]
+        else:
+            correct_embed = self.encode_answer(correct_answer)
+        correct_sim = float(np.dot(student_embed, correct_embed))
+        return {
+            'correct': correct_sim >= 0.6,
+            'score': correct_sim * 100,
+            'feedback': 'Automatic evaluation: ' + ('Correct' if correct_sim >= 0.6 else 'In c'),
+            'improvements': ['Ensure answer matches key concepts'],
+            'correct_answer': correct_answer,
+            'tier': 'fallback'
+        }
+
+    def feedback_with_gemini(self, question, student_answer, correct_answer, incorrect_answer, question_idx=None,
+                             row=None):
+        """Feedback using Gemini"""
+        try:
+            prompt = f"""Act as a tutoring assistant. Analyze this response:
+            Question: {question}
+            Correct Answer: {correct_answer}
+            Common Mistake: {incorrect_answer}
+            Student Answer: {student_answer}
+
+            Provide:
+            1. Correctness (True/False)
+            2. Confidence Score (0-100)
+            3. Brief Feedback
+            4. Key Improvement Areas
+
+            Use this format:
+            Correct: [True/False]
+            Score: [number]
+            Feedback: [2-3 sentence explanation]
+            Improvements: [comma-separated key areas]"""
+
+            with metrics.time('learnsmart_gemini_request_duration_seconds', kind='single'):
+                response = gemini_model.generate_content(prompt)
+            response_text = response.text.strip()
+            
+            # Parse the response
+            result = {
+                'correct': False,
+                'score': 0,
+                'feedback': 'No feedback generated',
+                'improvements': [],
+                'correct_answer': correct_answer
+            }
+
+            # Parse each line
+            for line in response_text.split('\n'):
+                if 'Correct:' in line:
+                    result['correct'] = 'true' in line.lower()
+                elif 'Score:' in line:
+                    result['score'] = float(line.split(':')[1].strip())
+                elif 'Feedback:' in line:
+                    result['feedback'] = line.split(':', 1)[1].strip()
+                elif 'Improvements:' in line:
+                    result['improvements'] = [i.strip() for i in line.split(':', 1)[1].split(',')]
+
+            return result
+            
+        except Exception as e:
+            grading_logger.warning(f"Gemini evaluation failed: {str(e)}")
+            # Fallback to similarity score against the precomputed reference embedding
+            return self.similarity_fallback(question_idx, student_answer, correct_answer, row=row)
+
+    def feedback_with_gemini_batch(self, items):
+        """
+        Grade several answers with a single structured Gemini request. items are
+        (question, student_answer, correct_answer, incorrect_answer) tuples; the result has
+        one entry per item, None where the response held no usable verdict for it.
+        """
+        blocks = []
+        for number, (question, student_answer, correct_answer, incorrect_answer) in enumerate(items, 1):
+            blocks.append(f"""Item {number}:
+            Question: {question}
+            Correct Answer: {correct_answer}
+            Common Mistake: {incorrect_answer}
+            Student Answer: {student_answer}""")
+
+        prompt = f"""Act as a tutoring assistant. Analyze each of these {len(items)} responses independently:
+
+            {chr(10).join(blocks)}
+
+            For every item provide its correctness, a confidence score (0-100), brief feedback
+            (2-3 sentences) and key improvement areas. Respond with a JSON array holding one
+            object per item:
+            [{{"item": 1, "correct": true, "score": 85, "feedback": "...", "improvements": ["..."]}}]"""
+
+        with metrics.time('learnsmart_gemini_request_duration_seconds', kind='batch'):
+            response = gemini_model.generate_content(
+                prompt,
+                generation_config={'response_mime_type': 'application/json'}
+            )
+        response_text = response.text.strip()
+        # Tolerate a fenced or prefixed reply by reading only the outermost JSON array
+        match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        parsed = json.loads(match.group(0) if match else response_text)
+
+        results = [None] * len(items)
+        for position, entry in enumerate(parsed if isinstance(parsed, list) else []):
+            if not isinstance(entry, dict):
+                continue
+            try:
+                number = int(entry.get('item', position + 1)) - 1
+                if not 0 <= number < len(items) or results[number] is not None:
+                    continue
+                improvements = entry.get('improvements') or []
+                if isinstance(improvements, str):
+                    improvements = [i.strip() for i in improvements.split(',')]
+                correct = entry.get('correct')
+                results[number] = {
+                    'correct': correct is True or str(correct).lower() == 'true',
+                    'score': float(entry.get('score', 0)),
+                    'feedback': str(entry.get('feedback') or 'No feedback generated'),
+                    'improvements': [str(i).strip() for i in improvements],
+                    'correct_answer': items[number][2]
+                }
+            except (TypeError, ValueError):
+                continue
+        return results
+
+    def local_verdict(self, question_idx, student_answer, correct_answer, student_embed=None, row=None):
+        """
+        Score the answer against the Positive and Negative reference embeddings.
+        Returns an evaluation when the verdict is clear, or None when it falls inside
+        the uncertainty band and should be escalated to Gemini.
+        """
+        references = self.answer_index.get(question_idx, row)
+        if references is None:
+            return None
+
+        if student_embed is None:
+            student_embed = self.encode_answer(student_answer)
+        similarities = references @ student_embed
+        positive_sim = float(similarities[0])
+        # Blank negatives are stored as zero vectors and would always score 0
+        negatives = [float(sim) for sim, ref in zip(similarities[1:], references[1:]) if ref.any()]
+        negative_sim = max(negatives) if negatives else 0.0
+        margin = positive_sim - negative_sim
+
+        decision = local_tier(positive_sim, negative_sim, self.accept_threshold, self.reject_threshold, self.min_margin)
+        if decision == 0:
+            return None
+        correct = bool(decision > 0)
+
+        return {
+            'correct': correct,
+            'score': max(0.0, min(100.0, positive_sim * 100)),
+            'feedback': ('Your answer covers the key concepts of the expected answer.' if correct else
+                         'Your answer does not match the key concepts of the expected answer.'),
+            'improvements': [] if correct else ['Ensure answer matches key concepts'],
+            'correct_answer': correct_answer,
+            'tier': 'local',
+            'margin': margin
+        }
+
+    def gemini_evaluation(self, question_idx, row, student_answer_processed):
+        """Full Gemini evaluation, served from the grading cache when possible"""
+        cache_key = self.grading_cache.make_key(question_idx, row, student_answer_processed)
+        evaluation = self.grading_cache.get(cache_key)
+        if evaluation is not None:
+            evaluation['tier'] = 'cache'
+            return evaluation
+
+        start = time.perf_counter()
+        evaluation = self.feedback_with_gemini(
+            row['Anchor'],
+            student_answer_processed,
+            str(row['Positive']),
+            str(row['Negative']),
+            question_idx=question_idx,
+            row=row
+        )
+        evaluation.setdefault('tier', 'gemini')
+        self.grading_stats.record_stage(evaluation['tier'], time.perf_counter() - start)
+        # Fallback verdicts come from a failed call, so they are not worth keeping
+        if evaluation['tier'] == 'gemini':
+            self.grading_cache.put(cache_key, evaluation)
+            if self.verdict_log is not None:
+                self.verdict_log.record(question_idx, row, student_answer_processed, evaluation)
+        return evaluation
+
+    def gemini_evaluation_batch(self, entries):
+        """
+        Gemini evaluations for many answers at once. entries are (question_idx, row,
+        student_answer_processed, student_embed) tuples; cache hits are served directly and
+        the misses go out gemini_batch_size per request, with the requests run in parallel.
+        """
+        evaluations = [None] * len(entries)
+        misses = []
+        for position, (question_idx, row, answer, _) in enumerate(entries):
+            cache_key = self.grading_cache.make_key(question_idx, row, answer)
+            evaluation = self.grading_cache.get(cache_key)
+            if evaluation is not None:
+                evaluation['tier'] = 'cache'
+                evaluations[position] = evaluation
+            else:
+                misses.append((position, cache_key))
+        if not misses:
+            return evaluations
+
+        chunks = [misses[i:i + self.gemini_batch_size] for i in range(0, len(misses), self.gemini_batch_size)]
+
+        def grade_chunk(chunk):
+            items = []
+            for position, _ in chunk:
+                _, row, answer, _ = entries[position]
+                items.append((row['Anchor'], answer, str(row['Positive']), str(row['Negative'])))
+            start = time.perf_counter()
+            try:
+                results = self.feedback_with_gemini_batch(items)
+            except Exception as e:
+                grading_logger.warning(f"Gemini batch evaluation failed: {str(e)}")
+                results = [None] * len(chunk)
+            self.grading_stats.record_stage('gemini_batch', time.perf_counter() - start)
+            return results
+
+        if len(chunks) == 1:
+            chunk_results = [grade_chunk(chunks[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+                chunk_results = list(pool.map(grade_chunk, chunks))
+
+        failed = []
+        for chunk, results in zip(chunks, chunk_results):
+            for (position, cache_key), evaluation in zip(chunk, results):
+                if evaluation is None:
+                    failed.append(position)
+                    continue
+                evaluation['tier'] = 'gemini'
+                self.grading_cache.put(cache_key, evaluation)
+                if self.verdict_log is not None:
+                    question_idx, row, answer, _ = entries[position]
+                    self.verdict_log.record(question_idx, row, answer, evaluation)
+                evaluations[position] = evaluation
+
+        # Items Gemini did not answer fall back to similarity, encoding any missing vectors together
+        unencoded = [position for position in failed if entries[position][3] is None]
+        vectors = dict(zip(unencoded, self.encode_answers([entries[p][2] for p in unencoded]))) if unencoded else {}
+        for position in failed:
+            question_idx, row, answer, student_embed = entries[position]
+            evaluations[position] = self.similarity_fallback(
+                question_idx, answer, str(row['Positive']),
+                student_embed=student_embed if student_embed is not None else vectors[position],
+                row=row
+            )
+        return evaluations
+
+    def grade_answer(self, question_idx, student_answer, defer_feedback=False, bank=None):
+        """
+        Grade a single answer without touching any student's quiz state.
+        With defer_feedback, a clear local verdict is returned immediately and the detailed
+        Gemini feedback is delivered later through the feedback broker under 'answer_id'.
+        The question is looked up in bank (the session's pinned snapshot) or the published bank.
+        """
+        row = (bank or self.bank).index.get(question_idx)
+        if row is None:
+            return None, {'error': 'Invalid question'}
+
+        correct_answer = str(row['Positive'])
+        question_text = row['Anchor']
+        student_answer_processed = student_answer.lower().strip()
+
+        evaluation = None
+        tried_local = self.grading_mode == 'tiered' or defer_feedback
+        if tried_local:
+            start = time.perf_counter()
+            evaluation = self.local_verdict(question_idx, student_answer_processed, correct_answer, row=row)
+            self.grading_stats.record_stage('local', time.perf_counter() - start)
+
+        # Only ambiguous answers (or every answer in 'gemini' mode) pay for the LLM round trip
+        if evaluation is None:
+            evaluation = self.gemini_evaluation(question_idx, row, student_answer_processed)
+        elif defer_feedback:
+            # The verdict is settled; fetch the detailed explanation off the request path
+            evaluation['answer_id'] = self.feedback_broker.submit(
+                self.deferred_feedback, question_idx, row, student_answer_processed,
+                evaluation['correct'], evaluation['tier']
+            )
+            evaluation['feedback_pending'] = True
+
+        if defer_feedback and 'answer_id' not in evaluation:
+            # Feedback is already complete, but streaming clients still get an ID to collect it
+            evaluation['answer_id'] = self.feedback_broker.publish(evaluation)
+            evaluation['feedback_pending'] = False
+
+        self.grading_stats.record_decision(evaluation['tier'], escalated=(
+            tried_local and evaluation['tier'] != 'local'
+        ))
+
+        self.log_evaluation(question_idx, question_text, student_answer, correct_answer, evaluation)
+        return row, evaluation
+
+    def deferred_feedback(self, question_idx, row, student_answer_processed, correct, tier):
+        """
+        Gemini feedback for an answer whose verdict was already returned and recorded by tier.
+        That verdict stands; if Gemini reaches the other one, the feedback is flagged as
+        superseded so the client can say it was written for a different verdict.
+        """
+        feedback = self.gemini_evaluation(question_idx, row, student_answer_processed)
+        result = dict(feedback, correct=correct, grading_path=[tier, feedback['tier']])
+        result['feedback_superseded'] = feedback.get('correct') != correct
+        if result['feedback_superseded']:
+            metrics.inc('learnsmart_grading_disagreement_total', tier=tier)
+            grading_logger.info("Deferred %s feedback disagrees with the %s verdict for question %s",
+                                feedback['tier'], tier, question_idx)
+        return result
+
+    def grade_answers(self, answers, bank=None):
+        """
+        Grade many (question_idx, student_answer) pairs together, e.g. a whole exam: one
+        batched encode for the local tier and batched Gemini requests for the rest.
+        Returns (row, evaluation) pairs in input order, as grade_answer would.
+        """
+        index = (bank or self.bank).index
+        graded = [None] * len(answers)
+        pending = []  # (position, question_idx, row, processed answer)
+        for position, (question_idx, student_answer) in enumerate(answers):
+            row = index.get(question_idx)
+            if row is None:
+                graded[position] = (None, {'error': 'Invalid question'})
+            else:
+                pending.append((position, question_idx, row, student_answer.lower().strip()))
+
+        tried_local = self.grading_mode == 'tiered'
+        vectors = {}
+        escalated = pending
+        if tried_local and pending:
+            start = time.perf_counter()
+            embeddings = self.encode_answers([answer for _, _, _, answer in pending])
+            escalated = []
+            for entry, student_embed in zip(pending, embeddings):
+                position, question_idx, row, answer = entry
+                vectors[position] = student_embed
+                evaluation = self.local_verdict(question_idx, answer, str(row['Positive']),
+                                                student_embed=student_embed, row=row)
+                if evaluation is None:
+                    escalated.append(entry)
+                else:
+                    graded[position] = (row, evaluation)
+            self.grading_stats.record_stage('local_batch', time.perf_counter() - start)
+
+        evaluations = self.gemini_evaluation_batch([
+            (question_idx, row, answer, vectors.get(position))
+            for position, question_idx, row, answer in escalated
+        ])
+        for (position, _, row, _), evaluation in zip(escalated, evaluations):
+            graded[position] = (row, evaluation)
+
+        for position, _, row, _ in pending:
+            evaluation = graded[position][1]
+            self.grading_stats.record_decision(evaluation['tier'], escalated=(
+                tried_local and evaluation['tier'] != 'local'
+            ))
+            self.log_evaluation(answers[position][0], row['Anchor'], answers[position][1], str(row['Positive']), evaluation)
+        return graded
+
+    def log_evaluation(self, question_idx, question_text, student_answer, correct_answer, evaluation):
+        """One structured audit record per graded answer, plus sampled debug detail with the feedback"""
+        if audit_logger.isEnabledFor(logging.INFO):
+            audit_logger.info(
+                "Graded question %s: %s (score %.1f%%, tier %s)",
+                question_idx, 'CORRECT' if evaluation['correct'] else 'INCORRECT',
+                evaluation['score'], evaluation.get('tier'),
+                extra={'fields': {
+                    'question_id': question_idx,
+                    'correct': evaluation['correct'],
+                    'score': round(float(evaluation['score']), 1),
+                    'tier': evaluation.get('tier')
+                }}
+            )
+        if answer_logger.isEnabledFor(logging.DEBUG):
+            answer_logger.debug(
+                "Question: %s | Student answer: %s | Correct answer: %s | Feedback: %s | Improvement areas: %s",
+                question_text, student_answer, correct_answer, evaluation['feedback'],
+                ', '.join(evaluation.get('improvements', [])),
+                extra={'sampled': True}
+            )
+
+class QuizSession:
+    """Quiz state for a single student; the model and question bank live on the shared evaluator"""
+    def __init__(self, evaluator, session_id):
+        self.evaluator = evaluator
+        self.session_id = session_id
+        # Bank snapshot this session draws and grades from; refreshed when a new quiz starts,
+        # so edits made mid-quiz never change the questions a student is answering
+        self.bank = evaluator.bank
+
+        # Requests for the same session are serialized; different sessions run in parallel
+        self.lock = threading.RLock()
+        self.last_access = time.monotonic()
 
         # Track all questions that have been attempted at each difficulty level
         self.attempted_questions = {
@@ -104,17 +930,20 @@ class StudentAnswerEvaluator:
         self.exam_mode = False
         self.quiz_questions = []
         self.current_quiz_index = 0
+        # Positions in quiz_questions already graded in this exam
+        self.answered_positions = set()
         self.level_question_count = {'Easy': 3, 'Medium': 3, 'Hard': 3}
         self.level_questions_asked = 0
         self.level_questions_correct = 0
         # Initialize RL-based level manager
         self.level_manager = RLLevelManager()
+        self.saved_rl_version = self.level_manager.version
 
     def update_difficulty_level(self, topic, new_difficulty):
         """
         Track when a student changes difficulty levels to determine if they're dropping back
         to a previous level after going up.
-        ""
+        """
         difficulty_ranks = {'Easy': 0, 'Medium': 1, 'Hard': 2}
 
         # Store the previous level before updating
@@ -140,16 +969,11 @@ class StudentAnswerEvaluator:
           prioritize previously failed questions that haven't been reasked yet
         2. Otherwise, select a question that hasn't been attempted yet
         """
-        # Create base filter conditions
-        filtered_df = self.df.copy()
-        if topic is not None:
-            filtered_df = filtered_df[filtered_df['Topic'] == topic]
-        if difficulty is not None:
-            filtered_df = filtered_df[filtered_df['Difficulty Level'] == difficulty]
+        index = self.bank.index
 
         # Get all possible questions for this filter
-        all_possible_questions = set(filtered_df.index)
-        if not all_possible_questions:
+        all_possible_questions = index.ids(topic, difficulty)
+        if len(all_possible_questions) == 0:
             return None, None, False
 
         # If this level has been reset (student went up and came back down)
@@ -157,121 +981,100 @@ class StudentAnswerEvaluator:
         if self.level_reset[difficulty]:
             # Questions that have been failed but not yet reasked
             not_yet_reasked = self.failed_questions[difficulty] - self.reasked_questions[difficulty]
-            available_failed_questions = list(not_yet_reasked.intersection(all_possible_questions))
+            available_failed_questions = [
+                idx for idx in not_yet_reasked if index.matches(idx, topic, difficulty)
+            ]
 
             if available_failed_questions:
                 question_idx = random.choice(available_failed_questions)
                 # Mark as reasked, but keep in failed_questions in case student fails again
                 self.reasked_questions[difficulty].add(question_idx)
-                return question_idx, filtered_df.loc[question_idx]['Anchor'], True  # True indicates this is a retry
-
-        # Find questions that haven't been attempted yet at this difficulty level
-        available_questions = list(all_possible_questions - self.attempted_questions[difficulty])
-
-        # If no new questions available, allow repeats by selecting from all possible questions
-        if not available_questions:
-            available_questions = list(all_possible_questions)
+                return question_idx, index.records[question_idx]['Anchor'], True  # True indicates this is a retry
 
-        # Choose a question randomly from the available ones
-        question_idx = random.choice(available_questions)
+        # Prefer a question that hasn't been attempted yet at this difficulty level,
+        # otherwise allow repeats by selecting from all possible questions
+        question_idx = index.sample(topic, difficulty, 1, exclude=self.attempted_questions[difficulty])[0]
 
         # Mark this question as attempted for this difficulty level
         self.attempted_questions[difficulty].add(question_idx)
 
-        return question_idx, filtered_df.loc[question_idx]['Anchor'], False
+        return question_idx, index.records[question_idx]['Anchor'], False
 
-    def feedback_with_gemini(self, question, student_answer, correct_answer, incorrect_answer):
-        """Feedback using Gemini"""
-        try:
-            prompt = f"""Act as a tutoring assistant. Analyze this response:
-            Question: {question}
-            Correct Answer: {correct_answer}
-            Common Mistake: {incorrect_answer}
-            Student Answer: {student_answer}
+    def evaluate_answer(self, question_idx, student_answer, is_retry=False, threshold=60, is_exam=False,
+                        defer_feedback=False):
+        """Updated evaluation method returning full feedback"""
+        row, evaluation = self.evaluator.grade_answer(question_idx, student_answer, defer_feedback=defer_feedback,
+                                                      bank=self.bank)
+        if row is None:
+            return evaluation
+        return self.record_evaluation(question_idx, row, evaluation, is_retry=is_retry, is_exam=is_exam)
 
-            Provide:
-            1. Correctness (True/False)
-            2. Confidence Score (0-100)
-            3. Brief Feedback
-            4. Key Improvement Areas
+    def evaluate_exam_answers(self, answers):
+        """
+        Grade a whole exam submission in one go. answers are (question_id, answer) pairs for
+        questions of the current exam; returns one result per pair, in the same order.
+        Each drawn question is graded once: repeats and already answered questions are rejected.
+        """
+        results = [None] * len(answers)
+        positions = []
+        slots = []
+        for position, (question_id, answer) in enumerate(answers):
+            error = self.exam_answer_error(question_id)
+            if error is None and (not isinstance(answer, str) or not answer.strip()):
+                error = 'Missing answer'
+            if error is not None:
+                results[position] = {'question_id': question_id, 'error': error}
+                continue
+            # Claim the slot now so a repeat later in the same batch is rejected
+            slot = self.unanswered_exam_slot(question_id)
+            self.answered_positions.add(slot)
+            positions.append(position)
+            slots.append(slot)
 
-            Use this format:
-            Correct: [True/False]
-            Score: [number]
-            Feedback: [2-3 sentence explanation]
-            Improvements: [comma-separated key areas]"""
+        graded = self.evaluator.grade_answers([answers[position] for position in positions], bank=self.bank)
+        for position, slot, (row, evaluation) in zip(positions, slots, graded):
+            question_id = answers[position][0]
+            if row is None:
+                self.answered_positions.discard(slot)
+                results[position] = {'question_id': question_id, 'error': evaluation['error']}
+                continue
+            result = self.record_evaluation(question_id, row, evaluation, is_exam=True)
+            result['question_id'] = question_id
+            results[position] = result
 
-            response = gemini_model.generate_content(prompt)
-            response_text = response.text.strip()
-            
-            # Parse the response
-            result = {
-                'correct': False,
-                'score': 0,
-                'feedback': 'No feedback generated',
-                'improvements': [],
-                'correct_answer': correct_answer
-            }
+        self.advance_exam_index()
+        return results
 
-            # Parse each line
-            for line in response_text.split('\n'):
-                if 'Correct:' in line:
-                    result['correct'] = 'true' in line.lower()
-                elif 'Score:' in line:
-                    result['score'] = float(line.split(':')[1].strip())
-                elif 'Feedback:' in line:
-                    result['feedback'] = line.split(':', 1)[1].strip()
-                elif 'Improvements:' in line:
-                    result['improvements'] = [i.strip() for i in line.split(':', 1)[1].split(',')]
+    def unanswered_exam_slot(self, question_id):
+        """Position of the first not yet answered exam question with this ID, or None"""
+        for position, question in enumerate(self.quiz_questions):
+            if question['id'] == question_id and position not in self.answered_positions:
+                return position
+        return None
 
-            return result
-            
-        except Exception as e:
-            print(f"Gemini evaluation failed: {str(e)}")
-            # Fallback to similarity score
-            student_embed = self.model.encode(student_answer)
-            correct_embed = self.model.encode(correct_answer)
-            correct_sim = util.pytorch_cos_sim(student_embed, correct_embed)[0][0].item()
-            return {
-                'correct': correct_sim >= 0.6,
-                'score': correct_sim * 100,
-                'feedback': 'Automatic evaluation: ' + ('Correct' if correct_sim >= 0.6 else 'In c'),
-                'improvements': ['Ensure answer matches key concepts'],
-                'correct_answer': correct_answer
-            }
-    
-    def evaluate_answer(self, question_idx, student_answer, is_retry=False, threshold=60, is_exam=False):
-        """Updated evaluation method returning full feedback"""
-        if question_idx not in self.df.index:
-            return {'error': 'Invalid question'}
+    def exam_answer_error(self, question_id):
+        """Why an answer for question_id cannot be accepted in this exam, or None"""
+        if not any(question['id'] == question_id for question in self.quiz_questions):
+            return 'Question not found'
+        if self.unanswered_exam_slot(question_id) is None:
+            return 'Question already answered'
+        return None
+
+    def mark_exam_answered(self, question_id):
+        """Record a graded exam answer and move past every answered question"""
+        self.answered_positions.add(self.unanswered_exam_slot(question_id))
+        self.advance_exam_index()
+
+    def advance_exam_index(self):
+        while (self.current_quiz_index < len(self.quiz_questions)
+               and self.current_quiz_index in self.answered_positions):
+            self.current_quiz_index += 1
 
-        row = self.df.loc[question_idx]
+    def record_evaluation(self, question_idx, row, evaluation, is_retry=False, is_exam=False):
+        """Apply a graded answer to this student's exam or topic performance"""
         correct_answer = str(row['Positive'])
-        incorrect_answer = str(row['Negative']).lower().strip()
-        question_text = row['Anchor']
         difficulty = row['Difficulty Level']
         topic = row['Topic']
-        student_answer_processed = student_answer.lower().strip()
-
-        # Always use Gemini evaluation
-        evaluation = self.feedback_with_gemini(
-            question_text,
-            student_answer_processed,
-            correct_answer,
-            str(row['Negative'])
-        )
-
-        # Log feedback for both correct and incorrect answers
-        print(f"\n--- Question: {question_text} ---")
-        print(f"Student Answer: {student_answer}")
-        print(f"Evaluation: {'CORRECT' if evaluation['correct'] else 'INCORRECT'}")
-        print(f"Score: {evaluation['score']:.1f}%")
-        print(f"Feedback: {evaluation['feedback']}")
-        if not evaluation['correct']:
-            print(f"Correct Answer: {correct_answer}")
-            if 'improvements' in evaluation:
-                print(f"Improvement Areas: {', '.join(evaluation['improvements'])}")
-        print("---\n")
 
         passed = evaluation['correct']
         confidence = evaluation['score']
@@ -328,13 +1131,18 @@ class StudentAnswerEvaluator:
                 if not is_retry:
                     self.failed_questions[difficulty].add(question_idx)
 
-        return {
+        result = {
             'is_correct': passed,
             'confidence': confidence,
             'feedback': feedback,
             'correct_answer': correct_answer,
-            'improvements': improvements
+            'improvements': improvements,
+            'topic': topic
         }
+        if 'answer_id' in evaluation:
+            result['answer_id'] = evaluation['answer_id']
+            result['feedback_pending'] = evaluation['feedback_pending']
+        return result
 
     def calculate_exam_score(self):
         """Calculate the exam score on a 100-point scale with weighted difficulty levels"""
@@ -351,9 +1159,11 @@ class StudentAnswerEvaluator:
 
     def init_comprehensive_exam(self, selected_topics=None):
         """Initialize exam state with proper question selection"""
+        self.bank = self.evaluator.bank
         self.exam_mode = True
         self.quiz_questions = []
         self.current_quiz_index = 0
+        self.answered_positions = set()
         
         # Clear previous exam data
         self.exam_performance = {
@@ -369,25 +1179,20 @@ class StudentAnswerEvaluator:
 
         # Prepare exam questions
         target_counts = {'Easy': 3, 'Medium': 3, 'Hard': 4}
+        index = self.bank.index
         
         for diff, count in target_counts.items():
-            filtered = self.df[self.df['Difficulty Level'] == diff]
-            if selected_topics:
-                filtered = filtered[filtered['Topic'].isin(selected_topics)]
+            # Get available questions (allow repeats if needed)
+            selected = index.sample_with_replacement(diff, count, topics=selected_topics)
             
-            if not filtered.empty:
-                # Get available questions (allow repeats if needed)
-                available_questions = filtered.index.tolist()
-                selected = random.choices(available_questions, k=count)
-                
-                for idx in selected:
-                    question = filtered.loc[idx]
-                    self.quiz_questions.append({
-                        'id': idx,
-                        'text': question['Anchor'],
-                        'topic': question['Topic'],
-                        'difficulty': diff
-                    })
+            for idx in selected:
+                question = index.records[idx]
+                self.quiz_questions.append({
+                    'id': idx,
+                    'text': question['Anchor'],
+                    'topic': question['Topic'],
+                    'difficulty': diff
+                })
 
         random.shuffle(self.quiz_questions)  # Shuffle all questions
         return len(self.quiz_questions)
@@ -395,6 +1200,7 @@ class StudentAnswerEvaluator:
     # Updated init_topic_quiz method in StudentAnswerEvaluator class
     def init_topic_quiz(self, topic, user_id):
         """Initialize quiz with user's saved progress"""
+        self.bank = self.evaluator.bank
         try:
             # First load RL model state if available
             self.load_rl_model_state(user_id)
@@ -402,21 +1208,23 @@ class StudentAnswerEvaluator:
             # Fetch user's current level from Firestore
             if user_id and user_id != "default_user":
                 user_ref = db.collection('users').document(user_id)
-                user_doc = user_ref.get()
+                with metrics.time('learnsmart_firestore_duration_seconds', op='read'):
+                    user_doc = user_ref.get()
                 
                 if user_doc.exists:
                     user_data = user_doc.to_dict()
                     topic_data = user_data.get('topicsMastery', {}).get(topic, {})
                     current_level = topic_data.get('currentLevel', 'Easy')
-                    print(f"Loaded user level for {topic}: {current_level}")
+                    quiz_logger.debug("Loaded user level for %s: %s", topic, current_level)
                 else:
                     current_level = 'Easy'
-                    print(f"User document not found. Using default level: {current_level}")
+                    quiz_logger.debug("User document not found. Using default level: %s", current_level)
             else:
                 current_level = 'Easy'
-                print(f"No valid user ID. Using default level: {current_level}")
+                quiz_logger.debug("No valid user ID. Using default level: %s", current_level)
 
             # Set the current level
+            self.exam_mode = False
             self.current_topic_levels[topic] = current_level
             self.previous_topic_levels[topic] = None
         
@@ -429,24 +1237,24 @@ class StudentAnswerEvaluator:
             
             # If no questions available for the topic at the current level, try other levels
             if num_questions == 0:
-                print(f"No questions found for topic '{topic}' at level '{current_level}'. Trying other levels.")
+                quiz_logger.warning(f"No questions found for topic '{topic}' at level '{current_level}'. Trying other levels.")
                 fallback_levels = ['Easy', 'Medium', 'Hard']
                 for level in fallback_levels:
                     if level != current_level:
                         num_questions = self.prepare_level_questions(topic, level)
                         if num_questions > 0:
                             self.current_topic_levels[topic] = level
-                            print(f"Using fallback level '{level}' for topic '{topic}'")
+                            quiz_logger.info(f"Using fallback level '{level}' for topic '{topic}'")
                             break
                 
                 # If still no questions, return 0
                 if num_questions == 0:
-                    print(f"No questions available for topic '{topic}' at any difficulty level")
+                    quiz_logger.warning(f"No questions available for topic '{topic}' at any difficulty level")
                     return 0
                     
             return num_questions
         except Exception as e:
-            print(f"Error initializing quiz: {str(e)}")
+            quiz_logger.error(f"Error initializing quiz: {str(e)}")
             # Fallback to Easy level if there's an error
             self.current_topic_levels[topic] = 'Easy'
             self.previous_topic_levels[topic] = None
@@ -456,87 +1264,61 @@ class StudentAnswerEvaluator:
         """Prepare a set of questions for the current topic and difficulty level"""
         self.quiz_questions = []
         self.current_quiz_index = 0
+        index = self.bank.index
         
         # Reset level question counters since we're starting a new set
         self.level_questions_asked = 0
         self.level_questions_correct = 0
         
-        # Track if we've tried to reask any previously failed questions
-        retry_added = False
-        
         # If this level has been reset, try to find failed questions to retry first
         if self.level_reset[difficulty]:
             not_yet_reasked = self.failed_questions[difficulty] - self.reasked_questions[difficulty]
             
             # Get failed questions for this topic and difficulty
-            filtered_df = self.df[
-                (self.df.index.isin(not_yet_reasked)) & 
-                (self.df['Topic'] == topic) & 
-                (self.df['Difficulty Level'] == difficulty)
-            ]
+            retry_candidates = sorted(
+                idx for idx in not_yet_reasked if index.matches(idx, topic, difficulty)
+            )
             
-            # Add retry questions to the quiz
-            for idx, row in filtered_df.iterrows():
+            # We only need one retry question to start
+            for idx in retry_candidates[:1]:
                 self.quiz_questions.append({
                     'id': idx,
-                    'text': row['Anchor'],
+                    'text': index.records[idx]['Anchor'],
                     'topic': topic,
                     'difficulty': difficulty,
                     'is_retry': True
                 })
                 self.reasked_questions[difficulty].add(idx)
-                retry_added = True
-                
-                # We only need one retry question to start
-                if len(self.quiz_questions) >= 1:
-                    break
         
         # Get more questions up to the target count for this difficulty
         target_count = self.level_question_count[difficulty]
         num_needed = target_count - len(self.quiz_questions)
         
         if num_needed > 0:
-            # Get questions for this topic and difficulty
-            filtered_df = self.df[
-                (self.df['Topic'] == topic) & 
-                (self.df['Difficulty Level'] == difficulty)
-            ]
-            
-            if filtered_df.empty:
-                print(f"Warning: No questions found for topic '{topic}' with difficulty '{difficulty}'")
+            if len(index.ids(topic, difficulty)) == 0:
+                quiz_logger.warning(f"Warning: No questions found for topic '{topic}' with difficulty '{difficulty}'")
                 return 0
                 
-            # Prioritize questions that haven't been attempted yet
-            unasked = [idx for idx in filtered_df.index if idx not in self.attempted_questions[difficulty]]
-            
-            # If not enough unasked questions, allow repeats
-            if len(unasked) < num_needed:
-                all_available = filtered_df.index.tolist()
-                # Shuffle to get random order
-                random.shuffle(all_available)
-                question_indices = all_available[:num_needed]
-            else:
-                # Shuffle unasked questions and select needed number
-                random.shuffle(unasked)
-                question_indices = unasked[:num_needed]
+            # Prioritize questions that haven't been attempted yet, allowing repeats if there aren't enough
+            question_indices = index.sample(
+                topic, difficulty, num_needed, exclude=self.attempted_questions[difficulty]
+            )
                 
             # Add selected questions to quiz
             for idx in question_indices:
-                if idx in filtered_df.index:
-                    row = filtered_df.loc[idx]
-                    self.quiz_questions.append({
-                        'id': idx,
-                        'text': row['Anchor'],
-                        'topic': topic,
-                        'difficulty': difficulty,
-                        'is_retry': False
-                    })
-                    self.attempted_questions[difficulty].add(idx)
-        
-        print(f"Prepared {len(self.quiz_questions)} questions for topic '{topic}' with difficulty '{difficulty}'")
-        return len(self.quiz_questions)
-    
-    def get_next_quiz_question(self):
+                self.quiz_questions.append({
+                    'id': idx,
+                    'text': index.records[idx]['Anchor'],
+                    'topic': topic,
+                    'difficulty': difficulty,
+                    'is_retry': False
+                })
+                self.attempted_questions[difficulty].add(idx)
+        
+        quiz_logger.debug("Prepared %d questions for topic '%s' with difficulty '%s'", len(self.quiz_questions), topic, difficulty)
+        return len(self.quiz_questions)
+    
+    def get_next_quiz_question(self):
         """Get the next quiz question"""
         if self.current_quiz_index < len(self.quiz_questions):
             question = self.quiz_questions[self.current_quiz_index]
@@ -544,7 +1326,7 @@ class StudentAnswerEvaluator:
             return question
         return None
     
-    def process_answer_and_advance(self, question_id, answer):
+    def process_answer_and_advance(self, question_id, answer, defer_feedback=False):
         """Process an answer and determine if we should advance to next question or level"""
         # Find the question in our quiz questions
         question_info = next((q for q in self.quiz_questions if q['id'] == question_id), None)
@@ -560,7 +1342,8 @@ class StudentAnswerEvaluator:
             question_id, 
             answer, 
             is_retry=is_retry, 
-            is_exam=self.exam_mode
+            is_exam=self.exam_mode,
+            defer_feedback=defer_feedback
         )
         
         # Extract is_correct from evaluation result
@@ -579,14 +1362,14 @@ class StudentAnswerEvaluator:
         if not self.exam_mode and next_question is None:
             level_complete = True
             
-            print(f"Level {difficulty} complete: {self.level_questions_correct}/{self.level_questions_asked} correct")
+            quiz_logger.info("Level %s complete: %d/%d correct", difficulty, self.level_questions_correct, self.level_questions_asked)
             
             # Check for quiz completion based on your rules
             correct_ratio = self.level_questions_correct / self.level_questions_asked if self.level_questions_asked > 0 else 0
             
             if difficulty == 'Hard' and correct_ratio >= 0.67:  # 2/3+ correct at Hard level
                 quiz_complete = True
-                print("Quiz completed: Good performance at Hard level (2/3+ correct)")
+                quiz_logger.info("Quiz completed: Good performance at Hard level (2/3+ correct)")
             else:
                 # Get recommended level from RL model
                 new_level = self.level_manager.get_recommended_level(
@@ -613,7 +1396,7 @@ class StudentAnswerEvaluator:
                         next_question = self.get_next_quiz_question()
                     else:
                         quiz_complete = True  # No more questions available
-                        print("Quiz completed: No more questions available")
+                        quiz_logger.info("Quiz completed: No more questions available")
         
         # Return the complete evaluation result along with other information
         return {
@@ -626,77 +1409,86 @@ class StudentAnswerEvaluator:
         }, next_question, quiz_complete
         
     def save_rl_model_state(self, user_id):
-        """Save RL model state to Firestore for persistence"""
+        """Save RL model state to Firestore for persistence; returns True if anything was written"""
         if not user_id or user_id == "default_user":
-            return
+            return False
+
+        # Snapshot under the session lock, then write without holding it
+        with self.lock:
+            version = self.level_manager.version
+            if version == self.saved_rl_version:
+                return False
+
+            # The whole policy travels as one compressed binary blob
+            policy_blob = self.level_manager.to_blob()
        
         try:
-            # Convert Q-values to a serializable format
-            serialized_q_values = {}
-            for (state_key, action), value in self.level_manager.q_values.items():
-                # Convert tuple keys to strings
-                key_str = f"{state_key[0]}:{state_key[1]}:{action}"
-                serialized_q_values[key_str] = value
-            
-            # Convert performance history to serializable format
-            serialized_history = {}
-            for (topic, level), values in self.level_manager.performance_history.items():
-                key_str = f"{topic}:{level}"
-                serialized_history[key_str] = values
-            
-            # Save to Firestore
+            # Save to Firestore, dropping the legacy per-key fields if present
             rl_model_ref = db.collection('rl_models').document(user_id)
-            rl_model_ref.set({
-                'q_values': serialized_q_values,
-                'performance_history': serialized_history,
-                'updated_at': firestore.SERVER_TIMESTAMP
-            }, merge=True)
+            with metrics.time('learnsmart_firestore_duration_seconds', op='write'):
+                rl_model_ref.set({
+                    'policy': policy_blob,
+                    'q_values': firestore.DELETE_FIELD,
+                    'performance_history': firestore.DELETE_FIELD,
+                    'updated_at': firestore.SERVER_TIMESTAMP
+                }, merge=True)
+            self.saved_rl_version = version
+            return True
         
         except Exception as e:
-            print(f"Error saving RL model state: {str(e)}")
+            rl_logger.error(f"Error saving RL model state: {str(e)}")
+            return False
             
     def load_rl_model_state(self, user_id):
         """Load RL model state from Firestore"""
         if not user_id or user_id == "default_user":
             return
         
+        # Updates still waiting for the write-behind flush are newer than the stored copy;
+        # reloading would drop them and leave nothing for the next save to write
+        if self.level_manager.version != self.saved_rl_version:
+            rl_logger.debug("Keeping unsaved RL model state for user %s", user_id)
+            return
+        
         try:
             # Get RL model data from Firestore
             rl_model_ref = db.collection('rl_models').document(user_id)
-            rl_model_doc = rl_model_ref.get()
+            with metrics.time('learnsmart_firestore_duration_seconds', op='read'):
+                rl_model_doc = rl_model_ref.get()
             
             if rl_model_doc.exists:
                 data = rl_model_doc.to_dict()
                 
-                # Deserialize Q-values
-                q_values = data.get('q_values', {})
-                for key_str, value in q_values.items():
-                    # Parse key string back to tuple components
-                    topic, level, action = key_str.split(':')
-                    action = int(action)  # Convert action back to int
+                if data.get('policy'):
+                    self.level_manager.load_blob(data['policy'])
+                else:
+                    # Legacy documents store one "topic:level:action" key per Q-value;
+                    # split from the right so topics containing ':' survive. Start from an
+                    # empty policy so loading twice does not replay the history twice.
+                    self.level_manager.reset()
+                    for key_str, value in data.get('q_values', {}).items():
+                        topic, level, action = key_str.rsplit(':', 2)
+                        self.level_manager.set_q_value(topic, level, int(action), value)
                     
-                    # Restore the Q-value
-                    self.level_manager.q_values[(topic, level), action] = value
+                    for key_str, values in data.get('performance_history', {}).items():
+                        topic, level = key_str.rsplit(':', 1)
+                        for ratio in values:
+                            self.level_manager.record_performance(topic, level, ratio)
                 
-                # Deserialize performance history
-                performance_history = data.get('performance_history', {})
-                for key_str, values in performance_history.items():
-                    # Parse key string back to tuple components
-                    topic, level = key_str.split(':')
-                    
-                    # Restore the performance history
-                    self.level_manager.performance_history[(topic, level)] = values
+                # What was just loaded is already persisted
+                self.saved_rl_version = self.level_manager.version
                     
-                print(f"Loaded RL model state for user {user_id}")
+                rl_logger.info(f"Loaded RL model state for user {user_id}")
         
         except Exception as e:
-            print(f"Error loading RL model state: {str(e)}")
+            rl_logger.error(f"Error loading RL model state: {str(e)}")
 
 class RLLevelManager:
     """Reinforcement Learning-based Level Manager for adaptive difficulty adjustment"""
+    # Number of recent correct ratios kept per (topic, level)
+    HISTORY_SIZE = 32
+
     def __init__(self, learning_rate=0.1, discount_factor=0.9, exploration_rate=0.15):
-        # Q-values dictionary: (topic, current_level, action) -> value
-        self.q_values = defaultdict(float)
         self.learning_rate = learning_rate        # Alpha: how much to update Q-values
         self.discount_factor = discount_factor    # Gamma: importance of future rewards
         self.exploration_rate = exploration_rate  # Epsilon: exploration vs exploitation (reduced for more predictable behavior)
@@ -704,9 +1496,111 @@ class RLLevelManager:
         self.level_indices = {'Easy': 0, 'Medium': 1, 'Hard': 2}
         self.index_to_level = {0: 'Easy', 1: 'Medium', 2: 'Hard'}
         
-        self.performance_history = defaultdict(list)
-        
         self.actions = [-1, 0, 1]  
+        # Valid actions per level, indexed [level_idx, action + 1]
+        self.action_mask = np.array([
+            [False, True, True],   # Easy cannot move down
+            [True, True, True],
+            [True, True, False],   # Hard cannot move up
+        ])
+        
+        self.reset()
+        # Bumped on every learning update so unchanged state is never re-saved
+        self.version = 0
+
+    def reset(self):
+        """Forget every Q-value and recorded performance; version keeps counting"""
+        # Dense Q-table indexed [topic_id, level_idx, action + 1]; rows grow by doubling
+        self.topic_ids = {}
+        self.q_table = np.zeros((4, 3, 3), dtype=np.float32)
+        # Ring buffer of recent correct ratios per (topic, level) plus total counts
+        self.history = np.zeros((4, 3, self.HISTORY_SIZE), dtype=np.float32)
+        self.history_counts = np.zeros((4, 3), dtype=np.int64)
+
+    def topic_id(self, topic):
+        """Return the table row for a topic, allocating one the first time it is seen"""
+        tid = self.topic_ids.get(topic)
+        if tid is None:
+            tid = len(self.topic_ids)
+            if tid >= self.q_table.shape[0]:
+                self._grow(tid + 1)
+            self.topic_ids[topic] = tid
+        return tid
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * self.q_table.shape[0])
+        extra = capacity - self.q_table.shape[0]
+        self.q_table = np.concatenate([self.q_table, np.zeros((extra,) + self.q_table.shape[1:], dtype=np.float32)])
+        self.history = np.concatenate([self.history, np.zeros((extra,) + self.history.shape[1:], dtype=np.float32)])
+        self.history_counts = np.concatenate([self.history_counts, np.zeros((extra, 3), dtype=np.int64)])
+
+    def get_q_values(self, topic, level):
+        """Q-values for (-1, 0, +1) from a state; zeros for a topic never trained on"""
+        tid = self.topic_ids.get(topic)
+        if tid is None:
+            return np.zeros(3, dtype=np.float32)
+        return self.q_table[tid, self.level_indices[level]]
+
+    def set_q_value(self, topic, level, action, value):
+        """Set a single Q-value"""
+        self.q_table[self.topic_id(topic), self.level_indices[level], action + 1] = value
+
+    def record_performance(self, topic, level, correct_ratio):
+        """Append a correct ratio to the (topic, level) ring buffer"""
+        tid = self.topic_id(topic)
+        level_idx = self.level_indices[level]
+        count = self.history_counts[tid, level_idx]
+        self.history[tid, level_idx, count % self.history.shape[2]] = correct_ratio
+        self.history_counts[tid, level_idx] = count + 1
+
+    def history_length(self, topic, level):
+        """Number of quiz sessions recorded for a (topic, level)"""
+        tid = self.topic_ids.get(topic)
+        if tid is None:
+            return 0
+        return int(self.history_counts[tid, self.level_indices[level]])
+
+    def recent_performance(self, topic, level):
+        """Retained correct ratios for a (topic, level), oldest first"""
+        count = self.history_length(topic, level)
+        if not count:
+            return []
+        size = self.history.shape[2]
+        row = self.history[self.topic_ids[topic], self.level_indices[level]]
+        if count <= size:
+            return row[:count].tolist()
+        start = count % size
+        return np.concatenate([row[start:], row[:start]]).tolist()
+
+    def to_blob(self):
+        """Serialize the whole policy to a compressed .npz byte string"""
+        n = len(self.topic_ids)
+        topics = sorted(self.topic_ids, key=self.topic_ids.get)
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            topics=np.array(topics, dtype=str),
+            q_table=self.q_table[:n],
+            history=self.history[:n],
+            history_counts=self.history_counts[:n],
+        )
+        return buffer.getvalue()
+
+    def load_blob(self, blob):
+        """Replace the policy with one produced by to_blob()"""
+        with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+            topics = data['topics'].tolist()
+            q_table = data['q_table'].astype(np.float32)
+            history = data['history'].astype(np.float32)
+            history_counts = data['history_counts'].astype(np.int64)
+        self.topic_ids = {topic: i for i, topic in enumerate(topics)}
+        capacity = max(4, len(topics))
+        self.q_table = np.zeros((capacity, 3, 3), dtype=np.float32)
+        self.q_table[:len(topics)] = q_table
+        self.history = np.zeros((capacity, 3, history.shape[2]), dtype=np.float32)
+        self.history[:len(topics)] = history
+        self.history_counts = np.zeros((capacity, 3), dtype=np.int64)
+        self.history_counts[:len(topics)] = history_counts
     
     def get_state_features(self, current_level, correct_ratio, questions_asked):
         """Extract state features from the current context"""
@@ -738,36 +1632,26 @@ class RLLevelManager:
     def select_action(self, topic, current_level, correct_ratio, questions_asked):
         """Select whether to move up, stay, or move down a level"""
         
-        history_length = len(self.performance_history[(topic, current_level)])
+        history_length = self.history_length(topic, current_level)
         
         use_rules_probability = 0.8 if history_length < 5 else 0.3
         
         if np.random.random() < use_rules_probability:
             # Use rule-based action
             action = self.get_rule_based_action(current_level, correct_ratio)
-            print(f"Using rule-based action: {action} (performance={correct_ratio:.2f})")
+            rl_logger.debug("Using rule-based action: %s (performance=%.2f)", action, correct_ratio)
         elif np.random.random() < self.exploration_rate:
             # Explore: choose random action
             valid_actions = self.get_valid_actions(current_level)
             action = np.random.choice(valid_actions)
-            print(f"Exploring with random action: {action}")
+            rl_logger.debug("Exploring with random action: %s", action)
         else:
-            state_key = (topic, current_level)
-            
-            # Get Q-values for all possible actions from this state
-            valid_actions = self.get_valid_actions(current_level)
-            action_values = {
-                action: self.q_values[(state_key, action)] 
-                for action in valid_actions
-            }
-            
-            # Choose action with highest Q-value
-            if action_values:
-                action = max(action_values.items(), key=lambda x: x[1])[0]
-                print(f"Using Q-learned action: {action} (Q-values: {action_values})")
-            else:
-                action = self.get_rule_based_action(current_level, correct_ratio)
-                print(f"No Q-values found, falling back to rule-based: {action}")
+            # Choose the valid action with the highest Q-value (ties go to the lower action)
+            q_row = self.get_q_values(topic, current_level)
+            mask = self.action_mask[self.level_indices[current_level]]
+            action = int(np.argmax(np.where(mask, q_row, -np.inf))) - 1
+            action_values = {a: float(q_row[a + 1]) for a in self.actions if mask[a + 1]}
+            rl_logger.debug("Using Q-learned action: %s (Q-values: %s)", action, action_values)
         
         # Apply action to get new level
         current_idx = self.level_indices[current_level]
@@ -778,33 +1662,27 @@ class RLLevelManager:
     
     def get_valid_actions(self, current_level):
         """Get valid actions for the current level"""
-        valid_actions = self.actions.copy()
-        
-        if current_level == 'Easy':
-            valid_actions.remove(-1)  
-        elif current_level == 'Hard':
-            valid_actions.remove(1)   
-            
-        return valid_actions
+        mask = self.action_mask[self.level_indices[current_level]]
+        return [a for a in self.actions if mask[a + 1]]
     
     def update_q_value(self, topic, current_level, action, reward, new_level):
         """Update Q-value using Q-learning update rule"""
-        state_key = (topic, current_level)
-        new_state_key = (topic, new_level)
+        tid = self.topic_id(topic)
+        level_idx = self.level_indices[current_level]
+        new_level_idx = self.level_indices[new_level]
         
-        # Get max Q-value for next state
-        valid_next_actions = self.get_valid_actions(new_level)
-        next_q_values = [self.q_values[(new_state_key, a)] for a in valid_next_actions]
-        max_next_q = max(next_q_values) if next_q_values else 0
+        # Max Q-value over the valid actions of the next state
+        max_next_q = float(self.q_table[tid, new_level_idx][self.action_mask[new_level_idx]].max())
         
         # Q-learning update formula
-        current_q = self.q_values[(state_key, action)]
+        current_q = float(self.q_table[tid, level_idx, action + 1])
         new_q = current_q + self.learning_rate * (
             reward + self.discount_factor * max_next_q - current_q
         )
         
-        self.q_values[(state_key, action)] = new_q
-        print(f"Updated Q-value: {state_key}, action={action}, old={current_q:.3f}, new={new_q:.3f}, reward={reward:.3f}")
+        self.q_table[tid, level_idx, action + 1] = new_q
+        rl_logger.debug("Updated Q-value: %s, action=%s, old=%.3f, new=%.3f, reward=%.3f",
+                        (topic, current_level), action, current_q, new_q, reward)
     
     def calculate_reward(self, correct_ratio, current_level, new_level):
         """Calculate reward based on performance and level transition - Updated for your rules"""
@@ -842,7 +1720,8 @@ class RLLevelManager:
                 transition_reward = -0.1  # Slight penalty for moving with middle performance
             
         total_reward = performance_reward + transition_reward
-        print(f"Reward calculation: performance={performance_reward:.2f}, transition={transition_reward:.2f}, total={total_reward:.2f}")
+        rl_logger.debug("Reward calculation: performance=%.2f, transition=%.2f, total=%.2f",
+                        performance_reward, transition_reward, total_reward)
         return total_reward
     
     def update_from_quiz_session(self, topic, current_level, correct_count, total_questions, new_level):
@@ -850,7 +1729,7 @@ class RLLevelManager:
         correct_ratio = correct_count / total_questions if total_questions > 0 else 0
         
         # Store performance in history
-        self.performance_history[(topic, current_level)].append(correct_ratio)
+        self.record_performance(topic, current_level, correct_ratio)
         
         # Determine what action was taken
         current_idx = self.level_indices[current_level]
@@ -862,444 +1741,2594 @@ class RLLevelManager:
         
         # Update Q-value
         self.update_q_value(topic, current_level, action, reward, new_level)
+        self.version += 1
         
-        print(f"RL Update: {topic} {current_level}→{new_level}, performance={correct_count}/{total_questions} ({correct_ratio:.2f}), action={action}")
+        rl_logger.debug("RL Update: %s %s→%s, performance=%d/%d (%.2f), action=%s",
+                        topic, current_level, new_level, correct_count, total_questions, correct_ratio, action)
         return new_level
     
     def get_recommended_level(self, topic, current_level, correct_count, total_questions):
         """Get a recommended level based on current performance"""
         correct_ratio = correct_count / total_questions if total_questions > 0 else 0
         
-        print(f"RL Decision for {topic}: {current_level}, performance={correct_count}/{total_questions} ({correct_ratio:.2f})")
+        rl_logger.debug("RL Decision for %s: %s, performance=%d/%d (%.2f)",
+                        topic, current_level, correct_count, total_questions, correct_ratio)
         
         # Get the RL model's recommendation
         action, suggested_level = self.select_action(topic, current_level, correct_ratio, total_questions)
         
-        print(f"RL Recommendation: {current_level} → {suggested_level} (action={action})")
+        rl_logger.debug("RL Recommendation: %s → %s (action=%s)", current_level, suggested_level, action)
         return suggested_level
 
-# Initialize evaluator with safe fallback
-try:
-    evaluator = StudentAnswerEvaluator('./enhance_triplet', 'Dataset.xlsx')
-except Exception as e:
-    print(f"Failed to initialize evaluator: {str(e)}")
-    evaluator = None
-    
-genai.configure(api_key='Your-Key')
-gemini_model = genai.GenerativeModel('gemini-2.0-flash')    
-    
-def role_required(required_role):
-    def decorator(f):
-        @wraps(f)
-        def wrapped(*args, **kwargs):
-            id_token = request.headers.get('Authorization', '').split('Bearer ')[-1]
+class FeedbackBroker:
+    """
+    Runs deferred Gemini feedback in a small worker pool and holds each result by answer ID
+    until the client collects it over Server-Sent Events. Uncollected results expire.
+    """
+    def __init__(self, max_workers=4, ttl_seconds=300):
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='feedback')
+        self._pending = {}  # answer_id -> {'ready': Event, 'result': dict, 'created': float}
+        self._lock = threading.Lock()
+
+    def _register(self):
+        answer_id = uuid.uuid4().hex
+        entry = {'ready': threading.Event(), 'result': None, 'created': time.monotonic()}
+        with self._lock:
+            self._prune()
+            self._pending[answer_id] = entry
+        return answer_id, entry
+
+    def submit(self, fn, *args):
+        """Run fn(*args) in the background and return the answer ID its result will be published under"""
+        answer_id, entry = self._register()
+
+        def run():
             try:
-                decoded_token = auth.verify_id_token(id_token)
-                user_role = decoded_token.get('role', 'student')
-                if user_role != required_role:
-                    return jsonify({'error': 'Insufficient permissions'}), 403
-                g.user_id = decoded_token['uid']
-                g.user_role = user_role
-                return f(*args, **kwargs)
+                entry['result'] = fn(*args)
             except Exception as e:
-                return jsonify({'error': str(e)}), 401
-        return wrapped
-    return decorator
+                grading_logger.error(f"Deferred feedback failed: {str(e)}")
+                entry['result'] = {'error': str(e)}
+            entry['ready'].set()
 
-def init_firestore_collections(user_id):
-    collections = ['user_progress', 'quiz_attempts', 'exam_results', 'topic_mastery']
-    for collection in collections:
-        doc_ref = db.collection(collection).document(user_id)
-        if not doc_ref.get().exists:
-            doc_ref.set({})
+        self._executor.submit(run)
+        return answer_id
 
-@app.route('/')
-def home():
-    return jsonify({
-        'message': 'Student Quiz API',
-        'endpoints': {
-            'GET /api/topics': 'List all available topics',
-            'POST /api/quiz/start': 'Start a new quiz',
-            'POST /api/quiz/answer': 'Submit an answer',
-            'GET /api/quiz/status': 'Get quiz status',
-            'GET /api/quiz/results': 'Get quiz results'
-        }
-    })
+    def publish(self, result):
+        """Register a result that is already complete"""
+        answer_id, entry = self._register()
+        entry['result'] = result
+        entry['ready'].set()
+        return answer_id
 
-@app.route('/api/topics', methods=['GET'])
-def get_topics():
-    if not evaluator:
-        return jsonify({'error': 'Evaluator not initialized'}), 500
-    
-    try:
-        unique_topics = evaluator.df['Topic'].dropna().unique().tolist()
-        return jsonify({'topics': unique_topics})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    def wait(self, answer_id, timeout):
+        """
+        Wait for the result. Returns (found, result); result is None if it is not ready yet.
+        Delivered results are dropped so each answer is streamed once.
+        """
+        with self._lock:
+            entry = self._pending.get(answer_id)
+        if entry is None:
+            return False, None
+        if not entry['ready'].wait(timeout):
+            return True, None
+        with self._lock:
+            self._pending.pop(answer_id, None)
+        return True, entry['result']
 
-# Update in app.py - modify the start_quiz route
-@app.route('/api/quiz/start', methods=['POST'])
-def start_quiz():
-    data = request.json
-    topic_type = data.get('type')  # 'topic' or 'exam'
-    topics = data.get('topics', [])
-    
-    # Get user_id from request
-    user_id = data.get('user_id')
-    
-    global evaluator
-    if not evaluator:
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [answer_id for answer_id, entry in self._pending.items() if entry['created'] < cutoff]
+        for answer_id in expired:
+            del self._pending[answer_id]
+
+class GradingStats:
+    """Thread-safe counters and recent latencies for each grading tier"""
+    def __init__(self, window=1000):
+        self.window = window
+        self.decisions = defaultdict(int)
+        self.escalations = 0
+        self.stage_latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self.stage_counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record_stage(self, tier, seconds):
+        with self._lock:
+            self.stage_counts[tier] += 1
+            self.stage_latencies[tier].append(seconds * 1000)
+
+    def record_decision(self, tier, escalated=False):
+        with self._lock:
+            self.decisions[tier] += 1
+            if escalated:
+                self.escalations += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = sum(self.decisions.values())
+            stages = {}
+            for tier, latencies in self.stage_latencies.items():
+                recent = np.array(latencies) if latencies else np.zeros(1)
+                stages[tier] = {
+                    'count': self.stage_counts[tier],
+                    'p50_ms': round(float(np.percentile(recent, 50)), 2),
+                    'p95_ms': round(float(np.percentile(recent, 95)), 2),
+                    'max_ms': round(float(recent.max()), 2)
+                }
+            return {
+                'graded': total,
+                'decided_by': dict(self.decisions),
+                'escalations': self.escalations,
+                'escalation_rate': round(self.escalations / total, 4) if total else 0,
+                'latency': stages
+            }
+
+class GradingCache:
+    """
+    Bounded LRU cache of parsed Gemini results with a TTL and optional SQLite backing.
+    Keys combine the question ID, a hash of the question's current text and references
+    (so edited questions never serve stale verdicts) and a hash of the normalized answer.
+
+    The lock only guards the in-memory LRU. New entries are persisted write-behind: put()
+    queues them, and a background thread writes everything queued in one transaction every
+    flush_interval seconds and once more at shutdown. Disk lookups on a memory miss use the
+    connection's own lock, so they never hold up cache hits.
+    """
+    def __init__(self, max_entries=10000, ttl_seconds=7 * 24 * 3600, db_path=None, flush_interval=1.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._pending = {}  # key -> (expires_at, result) not yet written to SQLite
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS grading_cache '
+                    '(key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)'
+                )
+                self._db.execute('DELETE FROM grading_cache WHERE expires_at < ?', (time.time(),))
+                self._db.commit()
+            except Exception as e:
+                store_logger.warning(f"Grading cache persistence disabled: {str(e)}")
+                self._db = None
+        if self._db is not None:
+            self._writer = threading.Thread(target=self._run, daemon=True, name='grading-cache-writer')
+            self._writer.start()
+
+    @staticmethod
+    def normalize_answer(text):
+        """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key"""
+        text = re.sub(r'[^\w\s]', ' ', str(text).lower())
+        return ' '.join(text.split())
+
+    def make_key(self, question_id, row, student_answer):
+        question_version = hashlib.blake2b(digest_size=8)
+        for column in ('Anchor', 'Positive', 'Negative'):
+            question_version.update(str(row[column]).encode('utf-8') + b'\x00')
+        answer_hash = hashlib.blake2b(self.normalize_answer(student_answer).encode('utf-8'), digest_size=16)
+        return f"{question_id}:{question_version.hexdigest()}:{answer_hash.hexdigest()}"
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+
+            # Evicted from memory before the writer got to it
+            entry = self._pending.get(key)
+            if entry is not None and entry[0] >= now:
+                self._store(key, *entry)
+                self.hits += 1
+                return dict(entry[1])
+            if self._db is None:
+                self.misses += 1
+                return None
+
+        row = None
         try:
-            evaluator = StudentAnswerEvaluator('./enhance_triplet', 'Dataset.xlsx')
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT result, expires_at FROM grading_cache WHERE key = ?', (key,)
+                ).fetchone()
         except Exception as e:
-            return jsonify({'error': f'Failed to initialize evaluator: {str(e)}'}), 500
-    
-    if topic_type == 'exam':
-        question_count = evaluator.init_comprehensive_exam(topics if topics else None)
-        if question_count == 0:
-            return jsonify({'error': 'No questions available for selected topics'}), 400
-            
-        question = evaluator.get_next_quiz_question()
-        return jsonify({
-            'message': 'Exam started',
-            'question': question,
-            'total_questions': question_count,
-            'current_question': 1,
-            'quiz_type': 'exam'
-        })
-    else:
-        # Topic-based quiz
-        if not topics or len(topics) == 0:
-            return jsonify({'error': 'Please select at least one topic for topic quiz'}), 400
-        
-        topic = topics[0]  # Use the first topic if multiple are provided
-        
-        # Pass the user_id to init_topic_quiz - this is crucial for getting the correct level
-        question_count = evaluator.init_topic_quiz(topic, user_id)
-        if question_count == 0:
-            return jsonify({'error': f'No questions available for topic: {topic}'}), 400
-            
-        question = evaluator.get_next_quiz_question()
-        
-        # Include the actual current level in the response
-        current_level = evaluator.current_topic_levels.get(topic, 'Easy')
-        return jsonify({
-            'message': 'Topic quiz started',
-            'question': question,
-            'total_questions': question_count,
-            'current_question': 1,
-            'quiz_type': 'topic',
-            'current_level': current_level
-        })
-        
-# app.py - Updated /api/quiz/answer route
-@app.route('/api/quiz/answer', methods=['POST'])
-def submit_answer():
-    data = request.json
-    question_id = data.get('question_id')
-    answer = data.get('answer')
-    quiz_type = data.get('quiz_type', 'topic')  # Get quiz type from request, default to topic
-    
-    if not evaluator or question_id is None or not answer:
-        return jsonify({'error': 'Invalid request'}), 400
-    
-    # Extract user ID from auth token if available
-    user_id = None
-    id_token = request.headers.get('Authorization', '').split('Bearer ')[-1]
-    if id_token:
+            store_logger.error(f"Error reading grading cache entry: {str(e)}")
+
+        with self._lock:
+            if row is not None and row[1] >= now:
+                result = json.loads(row[0])
+                self._store(key, row[1], result)
+                self.disk_hits += 1
+                return dict(result)
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        expires_at = time.time() + self.ttl_seconds
+        result = {k: v for k, v in result.items() if k != 'tier'}
+        with self._lock:
+            self._store(key, expires_at, result)
+            if self._db is not None:
+                self._pending[key] = (expires_at, result)
+
+    def flush(self):
+        """Write every queued entry to SQLite in one transaction"""
+        if self._db is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        rows = [(key, json.dumps(result), expires_at) for key, (expires_at, result) in pending.items()]
         try:
-            decoded_token = auth.verify_id_token(id_token)
-            user_id = decoded_token.get('uid')
+            with self._db_lock:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO grading_cache (key, result, expires_at) VALUES (?, ?, ?)', rows
+                )
+                self._db.commit()
+            self.writes += len(rows)
         except Exception as e:
-            print(f"Auth error: {str(e)}")
-    
-    # Check if we're in exam mode
-    if quiz_type == 'exam' or evaluator.exam_mode:
-        # Process exam answer
-        evaluation = evaluator.evaluate_answer(question_id, answer, is_exam=True)
-        
-        # Move to next question
-        evaluator.current_quiz_index += 1
-        next_question = evaluator.get_next_quiz_question()
-        
-        # Calculate score if exam is complete
-        exam_score = None
-        if next_question is None:
-            exam_score = evaluator.calculate_exam_score()
-        
-        return jsonify({
-            'is_correct': evaluation['is_correct'],
-            'feedback': evaluation.get('feedback', ''),
-            'confidence': evaluation.get('confidence', 0),
-            'correct_answer': evaluation.get('correct_answer', ''),
-            'improvements': evaluation.get('improvements', []),
-            'next_question': next_question,
-            'current_question': evaluator.current_quiz_index + 1,
-            'total_questions': len(evaluator.quiz_questions),
-            'quiz_complete': next_question is None,
-            'quiz_type': 'exam',
-            'score': exam_score
-        })
-    else:
-        # Process topic quiz answer
-        result, next_question, quiz_complete = evaluator.process_answer_and_advance(question_id, answer)
-        
-        # Get the full evaluation details from the result
-        evaluation = result.get('evaluation', {})
-        
-        response = {
-            'is_correct': result['is_correct'],
-            'feedback': evaluation.get('feedback', ''),
-            'confidence': evaluation.get('confidence', 0),
-            'correct_answer': evaluation.get('correct_answer', ''),
-            'improvements': evaluation.get('improvements', []),
-            'level_complete': result.get('level_complete', False),
-            'quiz_complete': quiz_complete,
-            'next_question': next_question,
-            'quiz_type': 'topic',
-            'current_level': result.get('current_level', 'Easy')
-        }
-        
-        if result.get('level_complete') and not quiz_complete:
-            response['new_level'] = result.get('new_level')
-            response['level_performance'] = {
-                'questions_asked': evaluator.level_questions_asked,
-                'questions_correct': evaluator.level_questions_correct
-            }
-        
-        if next_question:
-            response['current_question'] = evaluator.current_quiz_index + 1
-            response['total_questions'] = len(evaluator.quiz_questions)
-            
-        # Add this before the return statement
-        if quiz_type == 'topic' and user_id:
-            evaluator.save_rl_model_state(user_id)
-        
-        return jsonify(response)
-    
-@app.route('/api/user/progress', methods=['GET'])
-def get_user_progress():
-    # Extract user ID from auth token
-    id_token = request.headers.get('Authorization', '').split('Bearer ')[-1]
-    
-    try:
-        if not id_token:
-            return jsonify({'error': 'Authentication required'}), 401
-            
-        decoded_token = auth.verify_id_token(id_token)
-        user_id = decoded_token.get('uid')
-        
-        # Get user document from Firestore
-        user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        
-        if not user_doc.exists:
-            return jsonify({'error': 'User not found'}), 404
-            
-        user_data = user_doc.to_dict()
-        topic_mastery = user_data.get('topicsMastery', {})
-        
-        # Prepare response data
-        progress_data = {
-            'topics': {},
-            'overall': {
-                'topic_quiz': {'correct': 0, 'incorrect': 0, 'total': 0, 'success_rate': 0},
-                'exam_quiz': {'correct': 0, 'incorrect': 0, 'total': 0, 'success_rate': 0},
-                'combined': {'correct': 0, 'incorrect': 0, 'total': 0, 'success_rate': 0}
-            }
-        }
-        
-        # Process each topic's data
-        for topic, data in topic_mastery.items():
-            # Extract stats for this topic
-            topic_quiz = data.get('topicQuiz', {'correct': 0, 'incorrect': 0})
-            exam_quiz = data.get('examQuiz', {'correct': 0, 'incorrect': 0})
-            combined = {
-                'correct': data.get('correct', 0),
-                'incorrect': data.get('incorrect', 0)
-            }
-            
-            # Calculate totals and success rates
-            topic_quiz_total = topic_quiz.get('correct', 0) + topic_quiz.get('incorrect', 0)
-            exam_quiz_total = exam_quiz.get('correct', 0) + exam_quiz.get('incorrect', 0)
-            combined_total = combined['correct'] + combined['incorrect']
-            
-            topic_quiz_rate = round((topic_quiz.get('correct', 0) / topic_quiz_total * 100)) if topic_quiz_total > 0 else 0
-            exam_quiz_rate = round((exam_quiz.get('correct', 0) / exam_quiz_total * 100)) if exam_quiz_total > 0 else 0
-            combined_rate = round((combined['correct'] / combined_total * 100)) if combined_total > 0 else 0
-            
-            # Add to topic data
-            progress_data['topics'][topic] = {
-                'current_level': data.get('currentLevel', 'Easy'),
-                'topic_quiz': {
-                    'correct': topic_quiz.get('correct', 0),
-                    'incorrect': topic_quiz.get('incorrect', 0),
-                    'total': topic_quiz_total,
-                    'success_rate': topic_quiz_rate
-                },
-                'exam_quiz': {
-                    'correct': exam_quiz.get('correct', 0),
-                    'incorrect': exam_quiz.get('incorrect', 0),
-                    'total': exam_quiz_total,
-                    'success_rate': exam_quiz_rate
-                },
-                'combined': {
-                    'correct': combined['correct'],
-                    'incorrect': combined['incorrect'],
-                    'total': combined_total,
-                    'success_rate': combined_rate
-                }
+            store_logger.error(f"Error persisting {len(rows)} grading cache entries: {str(e)}")
+            # Retry with the next flush, bounded so a broken disk cannot grow the queue forever
+            with self._lock:
+                for key, entry in pending.items():
+                    if len(self._pending) >= self.max_entries:
+                        break
+                    self._pending.setdefault(key, entry)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _store(self, key, expires_at, result):
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'pending_writes': len(self._pending),
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+                'persistent': self._db is not None
             }
-            
-            # Add to overall stats
-            progress_data['overall']['topic_quiz']['correct'] += topic_quiz.get('correct', 0)
-            progress_data['overall']['topic_quiz']['incorrect'] += topic_quiz.get('incorrect', 0)
-            progress_data['overall']['exam_quiz']['correct'] += exam_quiz.get('correct', 0)
-            progress_data['overall']['exam_quiz']['incorrect'] += exam_quiz.get('incorrect', 0)
-            progress_data['overall']['combined']['correct'] += combined['correct']
-            progress_data['overall']['combined']['incorrect'] += combined['incorrect']
-        
-        # Calculate overall totals and rates
-        progress_data['overall']['topic_quiz']['total'] = (
-            progress_data['overall']['topic_quiz']['correct'] + 
-            progress_data['overall']['topic_quiz']['incorrect']
-        )
-        progress_data['overall']['exam_quiz']['total'] = (
-            progress_data['overall']['exam_quiz']['correct'] + 
-            progress_data['overall']['exam_quiz']['incorrect']
-        )
-        progress_data['overall']['combined']['total'] = (
-            progress_data['overall']['combined']['correct'] + 
-            progress_data['overall']['combined']['incorrect']
-        )
-        
-        # Calculate success rates for overall stats
-        if progress_data['overall']['topic_quiz']['total'] > 0:
-            progress_data['overall']['topic_quiz']['success_rate'] = round(
-                (progress_data['overall']['topic_quiz']['correct'] / 
-                 progress_data['overall']['topic_quiz']['total']) * 100
-            )
-        
-        if progress_data['overall']['exam_quiz']['total'] > 0:
-            progress_data['overall']['exam_quiz']['success_rate'] = round(
-                (progress_data['overall']['exam_quiz']['correct'] / 
-                 progress_data['overall']['exam_quiz']['total']) * 100
-            )
-        
-        if progress_data['overall']['combined']['total'] > 0:
-            progress_data['overall']['combined']['success_rate'] = round(
-                (progress_data['overall']['combined']['correct'] / 
-                 progress_data['overall']['combined']['total']) * 100
-            )
-        
-        return jsonify(progress_data)
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
 
-@app.route('/api/test', methods=['GET'])
-def test_endpoint():
-    return jsonify({
-        'status': 'success',
-        'message': 'Test endpoint is working!',
-        'data': {
-            'version': '1.0',
-            'timestamp': datetime.datetime.now(datetime.UTC)
-        }
-    })
-    
-@app.route('/api/questions', methods=['GET'])
-def get_questions():
-    try:
-        # Get filter parameters
-        topic = request.args.get('topic', '')
-        difficulty = request.args.get('difficulty', '')
-        
-        if not evaluator:
-            return jsonify({'error': 'Evaluator not initialized'}), 500
+class AnswerEmbeddingIndex:
+    """Precomputed, memory-mapped embeddings of every reference answer in the question bank
 
-        # Filter questions
-        filtered_df = evaluator.df
-        if topic and topic != 'all':
-            filtered_df = filtered_df[filtered_df['Topic'] == topic]
-        if difficulty:
-            filtered_df = filtered_df[filtered_df['Difficulty Level'] == difficulty]
-
-        # Convert to list of questions
-        questions = []
-        for _, row in filtered_df.iterrows():
-            questions.append({
-                # Generate ID from index since no Unique ID column exists
-                'id': str(row.name),  
-                'topic': row['Topic'],
-                'difficulty': row['Difficulty Level'],
-                'text': row['Anchor'],
-                'correctAnswer': row['Positive'],
-                # Include both incorrect answers from your dataset
-                'incorrectAnswers': [
-                    row['Negative'],
-                    row['Incorrect Answer 2']
-                ]
-            })
+    Vectors are stored as an (n, 3, dim) float32 array, one row per question and one slot per
+    reference column, keyed by question ID. Each row carries a fingerprint of its reference
+    texts so a rebuild only re-encodes rows whose answers actually changed.
 
-        return jsonify({
-            'questions': questions,
-            'total': len(questions)
-        })
+    Readers use one immutable (positions, fingerprint positions, vectors) tuple that writers
+    replace in a single assignment. Given the question's record, get() looks the row up by
+    content, so a session pinned to an older bank snapshot grades with the reference answers
+    it was shown; sync() keeps such superseded and deleted rows until no pinned snapshot
+    still contains them.
+    """
+    ANSWER_COLUMNS = ['Positive', 'Negative', 'Incorrect Answer 2']
 
-    except Exception as e:
-        print(f"Error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    def __init__(self, index_dir, model, model_name, save_delay=5.0):
+        self.index_dir = index_dir
+        self.model = model
+        self.model_name = model_name
+        self.save_delay = save_delay
+        self.dim = model.get_sentence_embedding_dimension()
+        self.dataset_version = None
 
-@app.route('/api/questions/<string:question_id>', methods=['DELETE'])
-def delete_question(question_id):
-    try:
-        idx = int(question_id)
-        if idx >= len(evaluator.df) or idx < 0:
-            return jsonify({'error': 'Question not found'}), 404
-            
-        # Drop the row and reset index
-        evaluator.df = evaluator.df.drop(index=idx).reset_index(drop=True)
-        # Save to Excel
-        evaluator.df.to_excel('Dataset.xlsx', index=False)  # NEW LINE
-        return jsonify({'message': 'Question deleted successfully'})
-        
-    except ValueError:
-        return jsonify({'error': 'Invalid question ID format'}), 400
-    except Exception as e:
-        print(f"Error deleting question: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        # Written under the lock only; rows past size are spare capacity for upserts
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.vectors = np.zeros((0, len(self.ANSWER_COLUMNS), self.dim), dtype=np.float32)
+        self.size = 0
+        # What readers see: question ID -> current row, fingerprint -> row, and the vectors
+        self._view = ({}, {}, self.vectors)
 
-@app.route('/api/questions/<string:question_id>', methods=['PUT'])
-def update_question(question_id):
-    try:
-        data = request.json
-        idx = int(question_id)
-        
-        if idx >= len(evaluator.df) or idx < 0:
-            return jsonify({'error': 'Question not found'}), 404
+        self._lock = threading.RLock()
+        self._save_timer = None
+
+    @classmethod
+    def reference_texts(cls, row):
+        texts = []
+        for column in cls.ANSWER_COLUMNS:
+            value = row.get(column)
+            texts.append('' if value is None or pd.isna(value) else str(value).strip())
+        return texts
+
+    @classmethod
+    def fingerprint(cls, row):
+        digest = hashlib.blake2b('\x00'.join(cls.reference_texts(row)).encode('utf-8'), digest_size=8)
+        return int.from_bytes(digest.digest(), 'little')
+
+    def _encode_rows(self, rows):
+        """Encode the reference answers of several rows in a single batch"""
+        texts = [text for row in rows for text in self.reference_texts(row)]
+        if not texts:
+            return np.zeros((0, len(self.ANSWER_COLUMNS), self.dim), dtype=np.float32)
+        with metrics.time('learnsmart_model_encode_duration_seconds', kind='index'):
+            vectors = self.model.encode(
+                texts,
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).astype(np.float32).reshape(len(rows), len(self.ANSWER_COLUMNS), self.dim)
+        # Blank reference answers get a zero vector so they never match anything
+        blank = np.array([text == '' for text in texts]).reshape(len(rows), len(self.ANSWER_COLUMNS))
+        vectors[blank] = 0
+        return vectors
+
+    def _paths(self, version):
+        base = os.path.join(self.index_dir, f"answers-{version}")
+        return base + '.npy', base + '.meta.npz'
+
+    def _load_latest(self):
+        """Memory-map the most recently written index on disk, if it was built with this model"""
+        candidates = sorted(glob.glob(os.path.join(self.index_dir, 'answers-*.meta.npz')), key=os.path.getmtime)
+        if not candidates:
+            return
+        meta_path = candidates[-1]
+        version = os.path.basename(meta_path)[len('answers-'):-len('.meta.npz')]
+        vectors_path, _ = self._paths(version)
+        try:
+            meta = np.load(meta_path)
+            if str(meta['model_name']) != self.model_name:
+                store_logger.warning(f"Ignoring answer index built with model {meta['model_name']}")
+                return
+            vectors = np.load(vectors_path, mmap_mode='r')
+        except Exception as e:
+            store_logger.warning(f"Could not load answer index {meta_path}: {str(e)}")
+            return
+        self.ids = meta['ids']
+        self.fingerprints = meta['fingerprints']
+        self.vectors = vectors
+        self.size = len(self.ids)
+        self._publish_view({int(qid): pos for pos, qid in enumerate(self.ids)})
+        self.dataset_version = version
+
+    def _publish_view(self, positions):
+        """Swap in what readers see; positions maps question IDs to their current rows"""
+        fingerprint_positions = {int(fp): pos for pos, fp in enumerate(self.fingerprints[:self.size])}
+        self._view = (positions, fingerprint_positions, self.vectors)
+
+    def sync(self, df, pinned=None):
+        """
+        Bring the index in line with df, encoding only rows whose reference answers changed.
+        pinned returns the bank snapshots still in use; rows that are no longer in df but
+        that one of them still contains are kept, so those sessions can go on grading.
+        """
+        records = df[self.ANSWER_COLUMNS].to_dict('records') if len(df) else []
+        ids = df.index.to_numpy(dtype=np.int64)
+        fingerprints = np.array([self.fingerprint(record) for record in records], dtype=np.uint64)
+
+        with self._lock:
+            if self.dataset_version is None and self.size == 0:
+                self._load_latest()
+
+            # Rows df no longer has, kept while a pinned snapshot holds the same content
+            current = set(zip(ids.tolist(), fingerprints.tolist()))
+            stale = {}
+            for qid, fp in zip(self.ids[:self.size].tolist(), self.fingerprints[:self.size].tolist()):
+                if (qid, fp) not in current:
+                    stale.setdefault(fp, qid)
+            banks = pinned() if stale and pinned is not None else []
+            retained = [
+                (qid, fp) for fp, qid in stale.items()
+                if any(record is not None and self.fingerprint(record) == fp
+                       for record in (bank.index.get(qid) for bank in banks))
+            ]
+            if retained:
+                ids = np.concatenate([ids, np.array([qid for qid, _ in retained], dtype=np.int64)])
+                fingerprints = np.concatenate([fingerprints, np.array([fp for _, fp in retained], dtype=np.uint64)])
+
+            # Reuse vectors by content, so renumbered or unchanged rows are never re-encoded
+            known = {int(fp): pos for pos, fp in enumerate(self.fingerprints[:self.size])}
+            reuse = np.array([known.get(int(fp), -1) for fp in fingerprints], dtype=np.int64)
+            if (np.array_equal(self.ids[:self.size], ids) and
+                np.array_equal(self.fingerprints[:self.size], fingerprints)):
+                return False
+
+            vectors = np.empty((len(ids), len(self.ANSWER_COLUMNS), self.dim), dtype=np.float32)
+            hit = reuse >= 0
+            if hit.any():
+                vectors[hit] = self.vectors[reuse[hit]]
+            missing = np.flatnonzero(~hit)
+            if len(missing):
+                store_logger.info(f"Encoding reference answers for {len(missing)} of {len(ids)} questions")
+                vectors[missing] = self._encode_rows([records[i] for i in missing])
+
+            self.ids = ids
+            self.fingerprints = fingerprints
+            self.vectors = vectors
+            self.size = len(ids)
+            self._publish_view({int(qid): pos for pos, qid in enumerate(ids[:len(records)])})
+        return True
+
+    def upsert(self, question_id, row, publish=None):
+        """
+        Encode a single created or edited question. publish, if given, is called once the
+        vectors are readable and before sync() can run again, so the bank snapshot that
+        contains the new content is visible before a sync decides which rows are in use.
+        """
+        question_id = int(question_id)
+        fingerprint = self.fingerprint(row)
+        vectors = None
+        if fingerprint not in self._view[1]:
+            vectors = self._encode_rows([row])[0]
+
+        with self._lock:
+            positions, fingerprint_positions, _ = self._view
+            pos = fingerprint_positions.get(fingerprint)
+            if pos is None:
+                if vectors is None:
+                    vectors = self._encode_rows([row])[0]
+                # Copy out of the read-only memory map before the first write
+                if not self.vectors.flags.writeable:
+                    self.vectors = np.array(self.vectors)
+                # Always a fresh row, never an overwrite: pinned sessions may still grade
+                # with the old one. sync() drops it once no snapshot needs it.
+                pos = self.size
+                if pos >= len(self.vectors):
+                    capacity = max(16, 2 * len(self.vectors))
+                    self.vectors = np.resize(self.vectors, (capacity,) + self.vectors.shape[1:])
+                    self.ids = np.resize(self.ids, capacity)
+                    self.fingerprints = np.resize(self.fingerprints, capacity)
+                self.ids[pos] = question_id
+                self.fingerprints[pos] = fingerprint
+                self.vectors[pos] = vectors
+                self.size += 1
+            changed = positions.get(question_id) != pos
+            if changed:
+                # Published last, once the row is complete
+                positions = dict(positions)
+                positions[question_id] = pos
+                self._publish_view(positions)
+            if publish is not None:
+                publish()
+        if changed:
+            self.schedule_save()
+
+    def get(self, question_id, row=None):
+        """
+        Return the (3, dim) reference vectors for a question, or None if it is not indexed.
+        With row (the question's record from the grading session's snapshot) the vectors
+        for exactly that content are returned, even if the question was edited since.
+        """
+        positions, fingerprint_positions, vectors = self._view
+        if row is not None:
+            pos = fingerprint_positions.get(self.fingerprint(row))
+        else:
+            pos = positions.get(question_id)
+        if pos is None:
+            return None
+        return vectors[pos]
+
+    def schedule_save(self):
+        """Persist in the background so CRUD requests never wait on the index write"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.save_delay, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            ids = self.ids[:self.size].copy()
+            fingerprints = self.fingerprints[:self.size].copy()
+            vectors = np.ascontiguousarray(self.vectors[:self.size])
+        version = hashlib.blake2b(
+            ids.tobytes() + fingerprints.tobytes() + self.model_name.encode('utf-8'),
+            digest_size=6
+        ).hexdigest()
+        if version == self.dataset_version:
+            return
+
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            vectors_path, meta_path = self._paths(version)
+            np.save(vectors_path, vectors)
+            np.savez(meta_path, ids=ids, fingerprints=fingerprints, model_name=self.model_name)
+            # Drop superseded versions once the new one is fully on disk
+            for old_path in glob.glob(os.path.join(self.index_dir, 'answers-*')):
+                if old_path not in (vectors_path, meta_path):
+                    os.remove(old_path)
+            self.dataset_version = version
+        except Exception as e:
+            store_logger.error(f"Error saving answer embedding index: {str(e)}")
+
+class QuestionTextIndex:
+    """
+    Embeddings of every question's text (Anchor), one unit-length float32 row per question,
+    for semantic search and near-duplicate lookups. A query is one matrix-vector product over
+    the whole bank (about 20M multiply-adds at 50k questions, a few milliseconds with BLAS)
+    and an argpartition for the top k, no pairwise loop.
+
+    Like AnswerEmbeddingIndex, edits append a fresh row and repoint the question ID, so a
+    search running concurrently never sees a half-written row; sync() compacts. The index is
+    saved to index_dir next to the answer index, so restarts only encode texts that changed.
+    """
+    def __init__(self, model, index_dir=None, model_name=None, save_delay=5.0):
+        self.model = model
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.save_delay = save_delay
+        self.dim = model.get_sentence_embedding_dimension()
+        self.dataset_version = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.fingerprints = np.zeros(0, dtype=np.uint64)
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.live = np.zeros(0, dtype=bool)  # False for removed and superseded rows
+        self.positions = {}  # question ID -> row in self.vectors
+        self.size = 0
+        self._lock = threading.Lock()
+        self._save_timer = None
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(str(text).split()) if text is not None and not pd.isna(text) else ''
+
+    @classmethod
+    def fingerprint(cls, text):
+        digest = hashlib.blake2b(cls.normalize(text).lower().encode('utf-8'), digest_size=8)
+        return int.from_bytes(digest.digest(), 'little')
+
+    def encode(self, texts):
+        """Unit-length embeddings of several question texts, one batched encode"""
+        texts = [self.normalize(text) for text in texts]
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        with metrics.time('learnsmart_model_encode_duration_seconds', kind='question_text'):
+            return self.model.encode(
+                texts,
+                batch_size=64,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).astype(np.float32)
+
+    def sync(self, df, encoded=None):
+        """
+        Rebuild from df, encoding only texts that are not indexed already and not in
+        encoded (text fingerprint -> vector, for texts the caller has just embedded)
+        """
+        ids = df.index.to_numpy(dtype=np.int64)
+        texts = df['Anchor'].tolist() if len(df) else []
+        fingerprints = np.array([self.fingerprint(text) for text in texts], dtype=np.uint64)
+        with self._lock:
+            if self.dataset_version is None and self.size == 0:
+                self._load_latest()
+            live = np.flatnonzero(self.live[:self.size])
+            if (len(live) == len(ids) and np.array_equal(self.ids[live], ids) and
+                    np.array_equal(self.fingerprints[live], fingerprints)):
+                return False
+            known = {int(self.fingerprints[pos]): pos for pos in live}
+        reuse = np.array([known.get(int(fp), -1) for fp in fingerprints], dtype=np.int64)
+        vectors = np.empty((len(ids), self.dim), dtype=np.float32)
+        hit = reuse >= 0
+        if hit.any():
+            vectors[hit] = self.vectors[reuse[hit]]
+        if encoded:
+            for i in np.flatnonzero(~hit):
+                vector = encoded.get(int(fingerprints[i]))
+                if vector is not None:
+                    vectors[i] = vector
+                    hit[i] = True
+        missing = np.flatnonzero(~hit)
+        if len(missing):
+            store_logger.info(f"Encoding question texts for {len(missing)} of {len(ids)} questions")
+            vectors[missing] = self.encode([texts[i] for i in missing])
+
+        with self._lock:
+            self.vectors = vectors
+            self.ids = ids.copy()
+            self.fingerprints = fingerprints
+            self.live = np.ones(len(ids), dtype=bool)
+            self.size = len(ids)
+            self.positions = {int(qid): pos for pos, qid in enumerate(ids)}
+        return True
+
+    def upsert(self, question_id, text, vector=None):
+        question_id = int(question_id)
+        fingerprint = self.fingerprint(text)
+        with self._lock:
+            pos = self.positions.get(question_id)
+            if pos is not None and self.fingerprints[pos] == fingerprint:
+                return
+        if vector is None:
+            vector = self.encode([text])[0]
+
+        with self._lock:
+            # Copy out of the read-only memory map before the first write
+            if not self.vectors.flags.writeable:
+                self.vectors = np.array(self.vectors)
+            pos = self.size
+            if pos >= len(self.vectors):
+                capacity = max(16, 2 * len(self.vectors))
+                self.vectors = np.resize(self.vectors, (capacity, self.dim))
+                self.ids = np.resize(self.ids, capacity)
+                self.fingerprints = np.resize(self.fingerprints, capacity)
+                self.live = np.resize(self.live, capacity)
+            self.vectors[pos] = vector
+            self.ids[pos] = question_id
+            self.fingerprints[pos] = fingerprint
+            self.live[pos] = True
+            self.size += 1
+            previous = self.positions.get(question_id)
+            self.positions[question_id] = pos
+            if previous is not None:
+                self.live[previous] = False
+        self.schedule_save()
+
+    def remove(self, question_id):
+        with self._lock:
+            pos = self.positions.pop(int(question_id), None)
+            if pos is not None:
+                self.live[pos] = False
+        if pos is not None:
+            self.schedule_save()
+
+    def nearest(self, vectors, k=1, allowed=None):
+        """
+        The k most similar indexed questions for each query vector: (ids, similarities),
+        both shaped (len(vectors), k) and best first. Missing slots have ID -1.
+        allowed restricts the candidates to an array of question IDs.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            size = self.size
+            matrix, ids, live = self.vectors, self.ids, self.live[:size].copy()
+        if allowed is not None:
+            live &= np.isin(ids[:size], allowed)
+        similarities = vectors @ matrix[:size].T
+        if not live.all():
+            similarities[:, ~live] = -np.inf
+
+        k = min(k, size)
+        if k == 0:
+            return (np.full((len(vectors), 0), -1, dtype=np.int64),
+                    np.zeros((len(vectors), 0), dtype=np.float32))
+        if k < size:
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(size), (len(vectors), 1))
+        top_sims = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_sims = np.take_along_axis(top_sims, order, axis=1)
+        top_ids = np.where(np.isfinite(top_sims), ids[:size][top], -1)
+        return top_ids, top_sims
+
+    def _paths(self, version):
+        base = os.path.join(self.index_dir, f"questions-{version}")
+        return base + '.npy', base + '.meta.npz'
+
+    def _load_latest(self):
+        """Memory-map the most recently saved index, if it was built with this model"""
+        if not self.index_dir:
+            return
+        candidates = sorted(glob.glob(os.path.join(self.index_dir, 'questions-*.meta.npz')), key=os.path.getmtime)
+        if not candidates:
+            return
+        meta_path = candidates[-1]
+        version = os.path.basename(meta_path)[len('questions-'):-len('.meta.npz')]
+        vectors_path, _ = self._paths(version)
+        try:
+            meta = np.load(meta_path)
+            if str(meta['model_name']) != self.model_name:
+                store_logger.warning(f"Ignoring question text index built with model {meta['model_name']}")
+                return
+            vectors = np.load(vectors_path, mmap_mode='r')
+        except Exception as e:
+            store_logger.warning(f"Could not load question text index {meta_path}: {str(e)}")
+            return
+        self.ids = meta['ids']
+        self.fingerprints = meta['fingerprints']
+        self.vectors = vectors
+        self.size = len(self.ids)
+        self.live = np.ones(self.size, dtype=bool)
+        self.positions = {int(qid): pos for pos, qid in enumerate(self.ids)}
+        self.dataset_version = version
+
+    def schedule_save(self):
+        """Persist in the background so CRUD requests never wait on the index write"""
+        if not self.index_dir:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+            self._save_timer = threading.Timer(self.save_delay, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def save(self):
+        if not self.index_dir:
+            return
+        with self._lock:
+            live = np.flatnonzero(self.live[:self.size])
+            ids = self.ids[live]
+            fingerprints = self.fingerprints[live]
+            vectors = np.ascontiguousarray(self.vectors[live])
+        version = hashlib.blake2b(
+            ids.tobytes() + fingerprints.tobytes() + str(self.model_name).encode('utf-8'),
+            digest_size=6
+        ).hexdigest()
+        if version == self.dataset_version:
+            return
+
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            vectors_path, meta_path = self._paths(version)
+            np.save(vectors_path, vectors)
+            np.savez(meta_path, ids=ids, fingerprints=fingerprints, model_name=str(self.model_name))
+            # Drop superseded versions once the new one is fully on disk
+            for old_path in glob.glob(os.path.join(self.index_dir, 'questions-*')):
+                if old_path not in (vectors_path, meta_path):
+                    os.remove(old_path)
+            self.dataset_version = version
+        except Exception as e:
+            store_logger.error(f"Error saving question text index: {str(e)}")
+
+class QuestionIndex:
+    """
+    Precomputed (topic, difficulty) -> NumPy array of question IDs, plus a hash index of
+    full records by stable question ID, so drawing k questions costs O(k) instead of a
+    scan of the whole bank and looking up a question is O(1).
+
+    Bucket arrays are never modified in place (add and remove build new arrays), so a
+    shallow copy() is enough to edit a new index while readers keep using the old one.
+    """
+    RECORD_COLUMNS = ['Unique ID', 'Anchor', 'Positive', 'Negative', 'Incorrect Answer 2', 'Difficulty Level', 'Topic']
+
+    def __init__(self, df=None):
+        self.buckets = {}
+        self.records = {}
+        if df is not None:
+            self.rebuild(df)
+
+    def copy(self):
+        index = QuestionIndex()
+        index.buckets = dict(self.buckets)
+        index.records = dict(self.records)
+        return index
+
+    def rebuild(self, df):
+        buckets = {}
+        for key, positions in df.groupby(['Topic', 'Difficulty Level'], sort=False).indices.items():
+            buckets[key] = df.index.to_numpy(dtype=np.int64)[positions]
+        self.buckets = buckets
+        self.records = {int(idx): record for idx, record in df[self.RECORD_COLUMNS].to_dict('index').items()}
+
+    def get(self, question_id):
+        """Return the record for a question, or None"""
+        return self.records.get(question_id)
+
+    def ids(self, topic, difficulty):
+        """Question IDs for a topic and difficulty; a None topic means every topic"""
+        if topic is not None:
+            return self.buckets.get((topic, difficulty), np.zeros(0, dtype=np.int64))
+        arrays = [ids for (_, level), ids in self.buckets.items() if level == difficulty]
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+
+    def matches(self, question_id, topic, difficulty):
+        record = self.records.get(question_id)
+        return (record is not None and record['Difficulty Level'] == difficulty and
+                (topic is None or record['Topic'] == topic))
+
+    def sample(self, topic, difficulty, k, exclude=frozenset()):
+        """
+        Draw up to k distinct questions, preferring IDs not in exclude. If fewer than k
+        unexcluded questions exist, draw from the whole bucket instead (repeats allowed).
+        """
+        ids = self.ids(topic, difficulty)
+        if len(ids) == 0:
+            return []
+
+        # Rejection sampling is O(k) while most of the bucket is still unexcluded
+        picked = []
+        seen = set()
+        for _ in range(4 * k + 8):
+            if len(picked) == k:
+                return picked
+            question_id = int(ids[random.randrange(len(ids))])
+            if question_id in seen:
+                continue
+            seen.add(question_id)
+            if question_id not in exclude:
+                picked.append(question_id)
+
+        # Mostly excluded bucket: scan just this bucket
+        unasked = [int(idx) for idx in ids if int(idx) not in exclude]
+        if len(unasked) < k:
+            unasked = [int(idx) for idx in ids]
+        random.shuffle(unasked)
+        return unasked[:k]
+
+    def sample_with_replacement(self, difficulty, k, topics=None):
+        """Draw k questions uniformly (with replacement) across the selected topics' buckets"""
+        buckets = [
+            ids for (topic, level), ids in self.buckets.items()
+            if level == difficulty and len(ids) and (not topics or topic in topics)
+        ]
+        if not buckets:
+            return []
+        chosen = random.choices(buckets, weights=[len(ids) for ids in buckets], k=k)
+        return [int(ids[random.randrange(len(ids))]) for ids in chosen]
+
+    def add(self, question_id, record):
+        question_id = int(question_id)
+        self.records[question_id] = {column: record.get(column) for column in self.RECORD_COLUMNS}
+        key = (record.get('Topic'), record.get('Difficulty Level'))
+        self.buckets[key] = np.append(self.buckets.get(key, np.zeros(0, dtype=np.int64)), question_id)
+
+    def remove(self, question_id):
+        question_id = int(question_id)
+        record = self.records.pop(question_id, None)
+        if record is None:
+            return
+        key = (record['Topic'], record['Difficulty Level'])
+        ids = self.buckets.get(key)
+        if ids is not None:
+            self.buckets[key] = ids[ids != question_id]
+
+    def update(self, question_id, record):
+        self.remove(question_id)
+        self.add(question_id, record)
+
+class QuestionBankSnapshot:
+    """
+    One immutable version of the question bank: a base frame, the edits made since that
+    frame was built (overlay: question ID -> record, or None once deleted) and a
+    QuestionIndex that already includes them. Nothing is modified after construction;
+    with_changes() returns the next version and shares everything it did not change, so an
+    edit costs a dict copy instead of a copy of the frame. The merged frame is only built
+    when something asks for it, and compaction folds the overlay into a new base.
+    """
+    def __init__(self, version, base, overlay=None, index=None):
+        self.version = version
+        self.base = base
+        self.overlay = overlay or {}
+        self.index = index if index is not None else QuestionIndex(base)
+        self._frame = None if self.overlay else base
+        self._frame_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index.records)
+
+    def with_changes(self, upserts=None, deletes=()):
+        index = self.index.copy()
+        overlay = dict(self.overlay)
+        for question_id, record in (upserts or {}).items():
+            question_id = int(question_id)
+            record = dict(record, **{'Unique ID': question_id})
+            index.update(question_id, record)
+            overlay[question_id] = record
+        for question_id in deletes:
+            question_id = int(question_id)
+            index.remove(question_id)
+            overlay[question_id] = None
+        return QuestionBankSnapshot(self.version + 1, self.base, overlay, index)
+
+    def frame(self):
+        """The bank as a DataFrame indexed by Unique ID; built once per snapshot, never modify it"""
+        if self._frame is None:
+            with self._frame_lock:
+                if self._frame is None:
+                    frame = self.base.drop(index=list(self.overlay), errors='ignore')
+                    added = {qid: record for qid, record in self.overlay.items() if record is not None}
+                    if added:
+                        rows = pd.DataFrame.from_dict(added, orient='index').reindex(columns=self.base.columns)
+                        frame = pd.concat([frame, rows]).sort_index()
+                    self._frame = frame
+        return self._frame
+
+    def folded(self):
+        """The same content and version with the overlay folded into the base frame"""
+        return QuestionBankSnapshot(self.version, self.frame(), index=self.index)
+
+class QuestionBankStore:
+    """
+    SQLite-backed question bank. The database runs in WAL mode, so every edit is a single
+    appended row write; a background thread checkpoints the log into the main file and
+    vacuums after heavy deletes. Excel is only used as an import/export format.
+    """
+    # DataFrame column -> SQLite column
+    COLUMNS = {
+        'Unique ID': 'id',
+        'Anchor': 'anchor',
+        'Positive': 'positive',
+        'Negative': 'negative',
+        'Incorrect Answer 2': 'incorrect_answer_2',
+        'Difficulty Level': 'difficulty',
+        'Topic': 'topic'
+    }
+
+    def __init__(self, db_path, seed_excel_path=None, compact_interval=60, tombstone_retention=24 * 3600):
+        self.db_path = db_path
+        self.compact_interval = compact_interval
+        self.tombstone_retention = tombstone_retention
+        self._lock = threading.Lock()
+        self._edits_since_compaction = 0
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS questions ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, anchor TEXT, positive TEXT, negative TEXT, '
+            'incorrect_answer_2 TEXT, difficulty TEXT, topic TEXT, deleted_at REAL)'
+        )
+        # Databases created before deletes became tombstones lack the column
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(questions)')]
+        if 'deleted_at' not in columns:
+            self._conn.execute('ALTER TABLE questions ADD COLUMN deleted_at REAL')
+        self._conn.commit()
+
+        if self.count() == 0 and seed_excel_path and os.path.exists(seed_excel_path):
+            imported = self.import_excel(seed_excel_path)
+            store_logger.info(f"Imported {imported} questions from {seed_excel_path} into {db_path}")
+
+        self._compactor = threading.Thread(target=self._compact_loop, daemon=True)
+        self._compactor.start()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM questions WHERE deleted_at IS NULL').fetchone()[0]
+
+    def load_dataframe(self):
+        """
+        Load the live bank in one query, in the same column layout as Dataset.xlsx.
+        The frame is indexed by the stable Unique ID, which also stays available as a column.
+        """
+        with self._lock:
+            df = pd.read_sql_query(
+                f"SELECT {', '.join(self.COLUMNS.values())} FROM questions WHERE deleted_at IS NULL ORDER BY id",
+                self._conn
+            )
+        df = df.rename(columns={sql: name for name, sql in self.COLUMNS.items()})
+        df.index = pd.Index(df['Unique ID'].to_numpy(dtype=np.int64))
+        return df
+
+    @classmethod
+    def _values(cls, record):
+        values = []
+        for name in cls.COLUMNS:
+            if name == 'Unique ID':
+                continue
+            value = record.get(name)
+            values.append(None if value is None or pd.isna(value) else str(value))
+        return values
+
+    def insert(self, record):
+        """Insert one question and return its new Unique ID"""
+        columns = [sql for name, sql in self.COLUMNS.items() if name != 'Unique ID']
+        with self._lock:
+            cursor = self._conn.execute(
+                f"INSERT INTO questions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                self._values(record)
+            )
+            self._conn.commit()
+            self._edits_since_compaction += 1
+            return cursor.lastrowid
+
+    def update(self, question_uid, record):
+        assignments = ', '.join(f"{sql} = ?" for name, sql in self.COLUMNS.items() if name != 'Unique ID')
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE questions SET {assignments} WHERE id = ?",
+                self._values(record) + [int(question_uid)]
+            )
+            self._conn.commit()
+            self._edits_since_compaction += 1
+
+    def delete(self, question_uid):
+        """Tombstone the question; the row itself is purged later by compaction"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE questions SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL',
+                (time.time(), int(question_uid))
+            )
+            self._conn.commit()
+            self._edits_since_compaction += 1
+
+    @classmethod
+    def check_columns(cls, df):
+        missing = [name for name in cls.COLUMNS if name != 'Unique ID' and name not in df.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    def import_excel(self, path, replace=False):
+        """Bulk-load questions from an xlsx file; rows keep their Unique ID when it has one"""
+        return self.import_frame(pd.read_excel(path), replace=replace)
+
+    def import_frame(self, df, replace=False):
+        self.check_columns(df)
+        records = df.to_dict('records')
+        with self._lock:
+            if replace:
+                self._conn.execute('DELETE FROM questions')
+            for record in records:
+                uid = record.get('Unique ID')
+                has_uid = uid is not None and not pd.isna(uid)
+                columns = list(self.COLUMNS.values()) if has_uid else list(self.COLUMNS.values())[1:]
+                values = ([int(uid)] if has_uid else []) + self._values(record)
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO questions ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    values
+                )
+            self._conn.commit()
+            self._edits_since_compaction += len(records)
+        return len(records)
+
+    def export_excel(self, path_or_buffer):
+        self.load_dataframe().to_excel(path_or_buffer, index=False)
+
+    def compact(self):
+        """Purge old tombstones and fold the write-ahead log back into the database file"""
+        with self._lock:
+            purged = self._conn.execute(
+                'DELETE FROM questions WHERE deleted_at IS NOT NULL AND deleted_at < ?',
+                (time.time() - self.tombstone_retention,)
+            ).rowcount
+            self._conn.commit()
+            if not self._edits_since_compaction and not purged:
+                return
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            page_count = self._conn.execute('PRAGMA page_count').fetchone()[0]
+            free_pages = self._conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if page_count and free_pages / page_count > 0.25:
+                self._conn.execute('VACUUM')
+            self._edits_since_compaction = 0
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except Exception as e:
+                store_logger.error(f"Question bank compaction failed: {str(e)}")
+
+class QuestionListCache:
+    """
+    Serialized /api/questions responses for the current bank version, keyed by the query's
+    filters, projection and page. Entries from older versions are dropped as soon as a
+    request for a newer version arrives, so edits never serve stale pages.
+    """
+    # Public field -> DataFrame columns it is built from; 'id' is always included
+    FIELDS = OrderedDict([
+        ('id', []),
+        ('topic', ['Topic']),
+        ('difficulty', ['Difficulty Level']),
+        ('text', ['Anchor']),
+        ('correctAnswer', ['Positive']),
+        ('incorrectAnswers', ['Negative', 'Incorrect Answer 2'])
+    ])
+    MAX_LIMIT = 1000
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries = OrderedDict()  # query key -> (etag, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(version, key):
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).hexdigest()
+        return f'"{version}-{digest}"'
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, version, key, body):
+        entry = (self.etag(version, key), body)
+        with self._lock:
+            # A page built while an edit landed is still returned, just not cached
+            if version == self.version:
+                self._entries[key] = entry
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    @classmethod
+    def build_page(cls, df, fields, offset=0, after=None, limit=None):
+        """
+        One page of the question list as a JSON document. Rows are ordered by Unique ID;
+        `after` continues from a cursor (the last ID of the previous page), `offset` skips rows.
+        """
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        total = len(df)
+        start = int(np.searchsorted(df.index.to_numpy(), after, side='right')) if after is not None else 0
+        start += offset
+        stop = total if limit is None else min(total, start + limit)
+        page = df.iloc[start:stop]
+
+        columns = [column for field in fields for column in cls.FIELDS[field]]
+        values = page[columns].astype(object)
+        values = values.where(values.notna(), None)
+        built = {'id': [str(idx) for idx in page.index]}
+        for field in fields:
+            if field == 'id':
+                continue
+            field_columns = cls.FIELDS[field]
+            if len(field_columns) == 1:
+                built[field] = values[field_columns[0]].tolist()
+            else:
+                built[field] = [list(row) for row in zip(*(values[column].tolist() for column in field_columns))]
+        questions = [dict(zip(built, row)) for row in zip(*built.values())]
+
+        return json.dumps({
+            'questions': questions,
+            'total': total,
+            'offset': start,
+            'limit': limit,
+            'nextCursor': str(page.index[-1]) if stop < total and len(page) else None
+        })
+
+class VerdictLog:
+    """
+    Append-only JSONL file of fresh Gemini verdicts, the labelled data that distill.py turns
+    into training triplets. The grading path only queues a record; a background thread
+    appends queued records to the file every flush_interval seconds.
+
+    Records hold students' raw answers, so the log is bounded: once the file would grow past
+    max_bytes it is rotated to path.1 (older files shift to path.2 and so on) and only
+    `backups` rotated files are kept. max_bytes=0 disables rotation.
+    """
+    def __init__(self, path, flush_interval=5, max_bytes=100 * 2**20, backups=5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.records = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name='verdict-log')
+        self._thread.start()
+
+    def record(self, question_idx, row, student_answer, evaluation):
+        negatives = []
+        for column in ('Negative', 'Incorrect Answer 2'):
+            value = row.get(column)
+            if value is not None and not pd.isna(value) and str(value).strip():
+                negatives.append(str(value).strip())
+        entry = {
+            'timestamp': time.time(),
+            'question_id': int(question_idx),
+            'topic': row.get('Topic'),
+            'difficulty': row.get('Difficulty Level'),
+            'question': str(row['Anchor']),
+            'correct_answer': str(row['Positive']),
+            'incorrect_answers': negatives,
+            'student_answer': student_answer,
+            'correct': bool(evaluation['correct']),
+            'score': float(evaluation['score'])
+        }
+        with self._lock:
+            self._pending.append(entry)
+
+    def flush(self):
+        with self._lock:
+            entries, self._pending = self._pending, []
+        if not entries:
+            return
+        data = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in entries)
+        with self._write_lock:
+            if self.max_bytes and os.path.exists(self.path) and \
+                    os.path.getsize(self.path) + len(data.encode('utf-8')) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+            self.records += len(entries)
+
+    def _rotate(self):
+        if self.backups < 1:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        grading_logger.info(f"Rotated Gemini verdict log {self.path}")
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                grading_logger.error(f"Error writing Gemini verdict log: {str(e)}")
+
+class RLStateWriter:
+    """
+    Write-behind buffer for per-user RL model state. Answers only mark a user dirty; a
+    background thread coalesces those marks and writes each dirty user at most once per
+    flush: right away after a level completes, every flush_interval seconds otherwise,
+    and a final time at shutdown.
+    """
+    def __init__(self, flush_interval=30):
+        self.flush_interval = flush_interval
+        self._dirty = {}  # user_id -> QuizSession
+        self._urgent = False
+        self._cond = threading.Condition()
+        self.marks = 0
+        self.writes = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name='rl-state-writer')
+        self._thread.start()
+
+    def mark_dirty(self, user_id, session, flush_now=False):
+        if not user_id or user_id == "default_user":
+            return
+        with self._cond:
+            self.marks += 1
+            self._dirty[user_id] = session
+            if flush_now:
+                self._urgent = True
+                self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            dirty, self._dirty = self._dirty, {}
+        for user_id, session in dirty.items():
+            if session.save_rl_model_state(user_id):
+                self.writes += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._urgent, timeout=self.flush_interval)
+                self._urgent = False
+            try:
+                self.flush()
+            except Exception as e:
+                rl_logger.error(f"Error flushing RL model state: {str(e)}")
+
+class ProgressRollups:
+    """
+    Per-user progress counters kept as one compact rollup document (progressRollups/<uid>)
+    and updated as answers are graded, instead of recomputing every total from the users
+    document on each /api/user/progress call. A user's first read seeds the rollup from
+    topicsMastery.
+
+    The API is the only writer of these counters. Graded answers are collected as deltas,
+    and a background thread writes them every flush_interval seconds (and once more at
+    shutdown) as Firestore increments, so several workers never overwrite each other. The
+    same batch mirrors the topic quiz counts into users.topicsMastery, which the dashboards
+    read. Cached rollups include this worker's unwritten deltas and are dropped after each
+    flush, so the next read also picks up what other workers wrote.
+    """
+    # counts layout per topic: topic quiz, exam quiz and combined, each (correct, incorrect)
+    SECTIONS = ('topic_quiz', 'exam_quiz', 'combined')
+    # Field names of the six counts in the rollup document
+    COUNT_FIELDS = tuple(f"{section}_{outcome}" for section in SECTIONS for outcome in ('correct', 'incorrect'))
+
+    def __init__(self, flush_interval=10, max_users=10000, collection='progressRollups'):
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        self.collection = collection
+        self._rollups = OrderedDict()  # user_id -> {topic: {'level': str, 'counts': [6 ints]}}
+        self._responses = {}  # user_id -> progress response
+        self._deltas = {}  # user_id -> {topic: [6 ints]} not yet written
+        self._levels = {}  # user_id -> {topic: level} not yet written
+        self._inflight = ({}, {})  # deltas and levels of the flush in progress
+        self._seeded = set()  # users whose rollup document is known to exist
+        self._generation = 0  # bumped whenever a flush lands
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name='progress-rollup-writer')
+        self._thread.start()
+
+    @staticmethod
+    def from_topics_mastery(topic_mastery):
+        """Seed rollup from the legacy per-topic fields of the users document"""
+        rollup = {}
+        for topic, data in topic_mastery.items():
+            data = data or {}
+            topic_quiz = data.get('topicQuiz') or {}
+            exam_quiz = data.get('examQuiz') or {}
+            rollup[topic] = {
+                'level': data.get('currentLevel', 'Easy'),
+                'counts': [
+                    int(topic_quiz.get('correct', 0)), int(topic_quiz.get('incorrect', 0)),
+                    int(exam_quiz.get('correct', 0)), int(exam_quiz.get('incorrect', 0)),
+                    int(data.get('correct', 0)), int(data.get('incorrect', 0))
+                ]
+            }
+        return rollup
+
+    @staticmethod
+    def summarize(correct, incorrect):
+        total = correct + incorrect
+        return {
+            'correct': correct,
+            'incorrect': incorrect,
+            'total': total,
+            'success_rate': round(correct / total * 100) if total > 0 else 0
+        }
+
+    @classmethod
+    def build_progress(cls, rollup):
+        """The /api/user/progress response for a rollup"""
+        overall = [0] * 6
+        topics = {}
+        for topic, entry in rollup.items():
+            counts = entry['counts']
+            topics[topic] = {'current_level': entry['level']}
+            for i, section in enumerate(cls.SECTIONS):
+                topics[topic][section] = cls.summarize(counts[2 * i], counts[2 * i + 1])
+            overall = [total + count for total, count in zip(overall, counts)]
+        return {
+            'topics': topics,
+            'overall': {
+                section: cls.summarize(overall[2 * i], overall[2 * i + 1])
+                for i, section in enumerate(cls.SECTIONS)
+            }
+        }
+
+    @classmethod
+    def parse_document(cls, data):
+        rollup = {}
+        for topic, entry in (data.get('topics') or {}).items():
+            counts = entry.get('counts') or {}
+            if isinstance(counts, dict):
+                counts = [int(counts.get(field, 0)) for field in cls.COUNT_FIELDS]
+            rollup[topic] = {'level': entry.get('level', 'Easy'), 'counts': list(counts)}
+        return rollup
+
+    @staticmethod
+    def count(counts, correct, is_exam):
+        miss = 0 if correct else 1
+        counts[(2 if is_exam else 0) + miss] += 1
+        counts[4 + miss] += 1
+
+    def _load(self, user_id):
+        """Read or seed a user's rollup; None when neither it nor the user exists"""
+        doc_ref = db.collection(self.collection).document(user_id)
+        with metrics.time('learnsmart_firestore_duration_seconds', op='read'):
+            doc = doc_ref.get()
+        if doc.exists:
+            self._seeded.add(user_id)
+            return self.parse_document(doc.to_dict())
+        with metrics.time('learnsmart_firestore_duration_seconds', op='read'):
+            user_doc = db.collection('users').document(user_id).get()
+        if not user_doc.exists:
+            return None
+        rollup = self.from_topics_mastery(user_doc.to_dict().get('topicsMastery', {}))
+        try:
+            # create() fails if another worker seeded the document first; theirs is kept
+            with metrics.time('learnsmart_firestore_duration_seconds', op='write'):
+                doc_ref.create({
+                    'topics': {
+                        topic: {'level': entry['level'], 'counts': dict(zip(self.COUNT_FIELDS, entry['counts']))}
+                        for topic, entry in rollup.items()
+                    },
+                    'updatedAt': firestore.SERVER_TIMESTAMP
+                })
+        except Exception as e:
+            with metrics.time('learnsmart_firestore_duration_seconds', op='read'):
+                doc = doc_ref.get()
+            if not doc.exists:
+                raise
+            api_logger.debug(f"Progress rollup for {user_id} was seeded by another worker: {str(e)}")
+            rollup = self.parse_document(doc.to_dict())
+        self._seeded.add(user_id)
+        return rollup
+
+    def _rollup(self, user_id):
+        while True:
+            with self._lock:
+                rollup = self._rollups.get(user_id)
+                if rollup is not None:
+                    self._rollups.move_to_end(user_id)
+                    return rollup
+                generation = self._generation
+            rollup = self._load(user_id)
+            if rollup is None:
+                return None
+            with self._lock:
+                if user_id in self._rollups:
+                    return self._rollups[user_id]
+                # A flush landed while reading: the document may or may not hold its deltas
+                if self._generation != generation:
+                    continue
+                for deltas, levels in (self._inflight, (self._deltas, self._levels)):
+                    for topic, counts in deltas.get(user_id, {}).items():
+                        entry = rollup.setdefault(topic, {'level': 'Easy', 'counts': [0] * 6})
+                        entry['counts'] = [total + count for total, count in zip(entry['counts'], counts)]
+                    for topic, level in levels.get(user_id, {}).items():
+                        rollup.setdefault(topic, {'level': level, 'counts': [0] * 6})['level'] = level
+                self._rollups[user_id] = rollup
+                while len(self._rollups) > self.max_users:
+                    evicted, _ = self._rollups.popitem(last=False)
+                    self._responses.pop(evicted, None)
+            return rollup
+
+    def record(self, user_id, topic, correct, is_exam=False, level=None):
+        """Count one graded answer"""
+        if not user_id or user_id == "default_user" or db is None:
+            return
+        with self._lock:
+            self.count(self._deltas.setdefault(user_id, {}).setdefault(topic, [0] * 6), correct, is_exam)
+            if level:
+                self._levels.setdefault(user_id, {})[topic] = level
+            rollup = self._rollups.get(user_id)
+            if rollup is not None:
+                entry = rollup.setdefault(topic, {'level': 'Easy', 'counts': [0] * 6})
+                self.count(entry['counts'], correct, is_exam)
+                if level:
+                    entry['level'] = level
+            self._responses.pop(user_id, None)
+
+    def progress(self, user_id):
+        """Cached progress response for a user, or None if the user does not exist"""
+        with self._lock:
+            response = self._responses.get(user_id)
+            if response is not None:
+                self.hits += 1
+                return response
+            self.misses += 1
+        rollup = self._rollup(user_id)
+        if rollup is None:
+            return None
+        with self._lock:
+            response = self.build_progress(rollup)
+            self._responses[user_id] = response
+        return response
+
+    def _write(self, user_id, deltas, levels):
+        """Apply one user's deltas as increments, to the rollup and the users document together"""
+        # Seed before the first increment; a user without a users document gets no mirror
+        user_exists = user_id in self._seeded or self._load(user_id) is not None
+        topics = {}
+        mastery = {}
+        for topic in set(deltas) | set(levels):
+            entry = topics[topic] = {}
+            counts = deltas.get(topic)
+            if counts:
+                entry['counts'] = {
+                    field: firestore.Increment(count) for field, count in zip(self.COUNT_FIELDS, counts) if count
+                }
+                if counts[0] or counts[1]:
+                    mastery[topic] = {
+                        'topicQuiz': {
+                            'correct': firestore.Increment(counts[0]),
+                            'incorrect': firestore.Increment(counts[1]),
+                            'lastUpdated': firestore.SERVER_TIMESTAMP
+                        },
+                        'lastUpdated': firestore.SERVER_TIMESTAMP
+                    }
+            if topic in levels:
+                entry['level'] = levels[topic]
+        batch = db.batch()
+        batch.set(db.collection(self.collection).document(user_id),
+                  {'topics': topics, 'updatedAt': firestore.SERVER_TIMESTAMP}, merge=True)
+        if mastery and user_exists:
+            batch.set(db.collection('users').document(user_id), {'topicsMastery': mastery}, merge=True)
+        with metrics.time('learnsmart_firestore_duration_seconds', op='write'):
+            batch.commit()
+
+    def flush(self):
+        if db is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                deltas, levels = self._deltas, self._levels
+                self._deltas, self._levels = {}, {}
+                self._inflight = (deltas, levels)
+            failed = {}
+            for user_id in set(deltas) | set(levels):
+                try:
+                    self._write(user_id, deltas.get(user_id, {}), levels.get(user_id, {}))
+                    self.writes += 1
+                except Exception as e:
+                    api_logger.error(f"Error saving progress rollup for {user_id}: {str(e)}")
+                    failed[user_id] = (deltas.get(user_id, {}), levels.get(user_id, {}))
+            with self._lock:
+                self._inflight = ({}, {})
+                # Unwritten deltas go back in front of anything recorded since
+                for user_id, (user_deltas, user_levels) in failed.items():
+                    pending = self._deltas.setdefault(user_id, {})
+                    for topic, counts in user_deltas.items():
+                        pending[topic] = [a + b for a, b in zip(counts, pending.get(topic, [0] * 6))]
+                    self._levels[user_id] = dict(user_levels, **self._levels.get(user_id, {}))
+                # Reread written users on their next request, to include other workers' answers
+                for user_id in set(deltas) | set(levels):
+                    if user_id not in failed:
+                        self._rollups.pop(user_id, None)
+                        self._responses.pop(user_id, None)
+                if deltas or levels:
+                    self._generation += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                api_logger.error(f"Error flushing progress rollups: {str(e)}")
+
+class VerifiedTokenCache:
+    """
+    In-process cache of decoded Firebase ID tokens, keyed by a SHA-256 of the token and kept
+    until the token's own 'exp' claim, with LRU eviction beyond max_entries. Failed
+    verifications are never cached.
+
+    Google's signing certificates are already cached by firebase_admin's HTTP session
+    (it honours the key endpoint's Cache-Control), so once a token has been seen neither
+    the signature check nor a key fetch is on the request path.
+
+    With check_revoked, revocation needs a user lookup, so a cached token is verified
+    again at most every revocation_check_interval seconds; that bounds how long a revoked
+    token keeps working. verify mirrors auth.verify_id_token(id_token, check_revoked=...);
+    local_auth.LocalTokenSigner provides one for offline use and tests.
+    """
+    def __init__(self, verify=None, max_entries=10000, check_revoked=False, revocation_check_interval=300,
+                 clock=time.time):
+        self.verify = verify or (lambda id_token, check_revoked=False:
+                                 auth.verify_id_token(id_token, check_revoked=check_revoked))
+        self.max_entries = max_entries
+        self.check_revoked = check_revoked
+        self.revocation_check_interval = revocation_check_interval
+        self.clock = clock
+        self._entries = OrderedDict()  # token hash -> (expires_at, verified_at, decoded token)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def verify_id_token(self, id_token):
+        key = hashlib.sha256(id_token.encode('utf-8')).digest()
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, verified_at, decoded_token = entry
+                revocation_due = self.check_revoked and now - verified_at >= self.revocation_check_interval
+                if expires_at > now and not revocation_due:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return decoded_token
+                del self._entries[key]
+            self.misses += 1
+
+        # Raises for invalid, expired or revoked tokens, exactly like auth.verify_id_token
+        with metrics.time('learnsmart_verify_id_token_duration_seconds'):
+            if self.check_revoked:
+                decoded_token = self.verify(id_token, check_revoked=True)
+            else:
+                decoded_token = self.verify(id_token)
+        expires_at = decoded_token.get('exp', 0)
+        if expires_at > now:
+            with self._lock:
+                self._entries[key] = (expires_at, now, decoded_token)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return decoded_token
+
+class Metrics:
+    """
+    In-process counters and latency histograms rendered in the Prometheus text format.
+    Recording is a bisect and two additions under a lock, so it is cheap enough for the
+    request path; values owned by other components are read only when /metrics is scraped.
+    """
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}          # name -> (type, help)
+        self._histograms = {}    # name -> {label tuple: [bucket counts..., sum, count]}
+        self._buckets = {}       # name -> bucket upper bounds
+        self._counters = {}      # name -> {label tuple: value}
+        self._collectors = []    # (name, type, help, fn returning [(labels, value)])
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._help[name] = ('histogram', help_text)
+        self._histograms[name] = {}
+        self._buckets[name] = tuple(buckets)
+
+    def counter(self, name, help_text):
+        self._help[name] = ('counter', help_text)
+        self._counters[name] = {}
+
+    def collect(self, name, metric_type, help_text, fn):
+        """Register a metric whose [(labels, value)] samples are read from fn at scrape time"""
+        self._collectors.append((name, metric_type, help_text, fn))
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self._buckets[name], value)
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = [0] * (len(self._buckets[name]) + 3)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _labels(pairs):
+        if not pairs:
+            return ''
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{key}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = {name: {k: list(v) for k, v in series.items()} for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+
+        for name, series in histograms.items():
+            lines.append(f"# HELP {name} {self._help[name][1]}")
+            lines.append(f"# TYPE {name} histogram")
+            bounds = self._buckets[name]
+            for key, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(bounds + (float('inf'),), values):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{self._labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(key)} {values[-2]}")
+                lines.append(f"{name}_count{self._labels(key)} {values[-1]}")
+
+        for name, series in counters.items():
+            lines.append(f"# HELP {name} {self._help[name][1]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{self._labels(key)} {value}")
+
+        for name, metric_type, help_text, fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                api_logger.error(f"Error collecting metric {name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{name}{self._labels(tuple(sorted(labels.items())))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+class StartupLoader:
+    """
+    Loads the slow components (Firebase, Gemini, the model and question bank) on background
+    threads so a worker answers lightweight routes as soon as it is imported. Each component
+    records its status, how long it took and any error, and a failed one can be retried.
+    """
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self._components = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """loader() does the work; it may return a dict of sub-step timings"""
+        self._components[name] = {
+            'loader': loader,
+            'status': 'pending',
+            'seconds': None,
+            'stages': None,
+            'error': None,
+            'lock': threading.Lock(),
+            'done': threading.Event()
+        }
+
+    def start(self, wait=False):
+        """Load every component in parallel; with wait=True block until all have finished"""
+        threads = []
+        for name in self._components:
+            thread = threading.Thread(target=self.load, args=(name,), daemon=True, name=f'startup-{name}')
+            thread.start()
+            threads.append(thread)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def load(self, name):
+        """Run a component's loader unless it is already loaded; returns True when it is ready"""
+        component = self._components[name]
+        with component['lock']:
+            if component['status'] == 'ready':
+                return True
+            component['status'] = 'loading'
+            start = time.perf_counter()
+            try:
+                stages = component['loader']()
+                status, error = 'ready', None
+            except Exception as e:
+                stages, status, error = None, 'failed', str(e)
+            seconds = time.perf_counter() - start
+            with self._lock:
+                component.update(status=status, seconds=seconds, error=error,
+                                 stages={k: round(v, 3) for k, v in stages.items()} if stages else None)
+            component['done'].set()
+
+        if error:
+            startup_logger.error(f"Startup: failed to load {name} after {seconds:.2f}s: {error}")
+        else:
+            startup_logger.info(f"Startup: loaded {name} in {seconds:.2f}s")
+        return error is None
+
+    def failed(self, *names):
+        """Those of names whose loader failed; routes using them run in a reduced mode"""
+        with self._lock:
+            return [name for name in names
+                    if name in self._components and self._components[name]['status'] == 'failed']
+
+    def is_loading(self, name):
+        component = self._components.get(name)
+        return component is not None and component['status'] in ('pending', 'loading')
+
+    def error(self, name):
+        component = self._components.get(name)
+        return component['error'] if component else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'ready': all(c['status'] == 'ready' for c in self._components.values()),
+                'uptime_seconds': round(time.monotonic() - self.started_at, 3),
+                'components': {
+                    name: {
+                        'status': c['status'],
+                        'seconds': round(c['seconds'], 3) if c['seconds'] is not None else None,
+                        'stages': c['stages'],
+                        'error': c['error']
+                    }
+                    for name, c in self._components.items()
+                }
+            }
+
+class QuizSessionStore:
+    """Thread-safe store of quiz sessions keyed by session ID with LRU and idle-TTL eviction"""
+    def __init__(self, session_factory, max_sessions=1000, ttl_seconds=3600):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Return the live session for this ID, or None if it never existed or has expired"""
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def get_or_create(self, session_id):
+        """Return the session for this ID, creating it if needed"""
+        with self._lock:
+            self._evict_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self.session_factory(session_id)
+                self._sessions[session_id] = session
+                # Evict least recently used sessions beyond capacity
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def _evict_expired(self):
+        # Sessions are kept in access order, so expired ones are always at the front
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_access >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+def evaluator_options():
+    """Grading settings that can be tuned per deployment without code changes"""
+    return {
+        'grading_mode': os.environ.get('GRADING_MODE', 'gemini'),
+        'accept_threshold': float(os.environ.get('GRADING_ACCEPT_THRESHOLD', 0.75)),
+        'reject_threshold': float(os.environ.get('GRADING_REJECT_THRESHOLD', 0.45)),
+        'min_margin': float(os.environ.get('GRADING_MIN_MARGIN', 0.1)),
+        'gemini_batch_size': int(os.environ.get('GEMINI_BATCH_SIZE', 10)),
+        # MODEL_PRECISION=int8 serves the dynamically quantized model on CPU-only hosts
+        'quantize': os.environ.get('MODEL_PRECISION', 'fp32').lower() == 'int8',
+        'verdict_log': verdict_log,
+        'duplicate_threshold': float(os.environ.get('DUPLICATE_QUESTION_THRESHOLD', 0.9)),
+        # 'warn' creates near-duplicates and reports them, 'reject' refuses them
+        'duplicate_policy': os.environ.get('DUPLICATE_QUESTION_POLICY', 'warn'),
+        'grading_cache': grading_cache,
+        'feedback_broker': feedback_broker
+    }
+
+# Served at /metrics; histograms are declared up front, scrape-time values are collected below
+metrics = Metrics()
+metrics.histogram('learnsmart_http_request_duration_seconds', 'Request latency by route, method and status')
+metrics.histogram('learnsmart_gemini_request_duration_seconds', 'Gemini generate_content latency (single or batch)')
+metrics.histogram('learnsmart_model_encode_duration_seconds', 'SentenceTransformer encode latency by call kind')
+metrics.histogram('learnsmart_firestore_duration_seconds', 'Firestore document read/write latency')
+metrics.histogram('learnsmart_question_store_duration_seconds', 'Question bank write, import and xlsx export latency')
+metrics.histogram('learnsmart_verify_id_token_duration_seconds', 'Firebase ID token verification latency on token cache misses')
+metrics.counter('learnsmart_grading_fallback_total', 'Answers graded by similarity because Gemini failed')
+metrics.counter('learnsmart_grading_disagreement_total',
+                'Deferred feedback whose verdict differs from the one already returned')
+
+# Shared across evaluator re-initialization so cached verdicts survive it
+grading_cache = GradingCache(
+    max_entries=int(os.environ.get('GRADING_CACHE_SIZE', 10000)),
+    ttl_seconds=int(os.environ.get('GRADING_CACHE_TTL', 7 * 24 * 3600)),
+    db_path=os.environ.get('GRADING_CACHE_PATH') or None,
+    flush_interval=float(os.environ.get('GRADING_CACHE_FLUSH_INTERVAL', 1.0))
+)
+atexit.register(grading_cache.flush)
+feedback_broker = FeedbackBroker(max_workers=int(os.environ.get('FEEDBACK_WORKERS', 4)))
+
+# Gemini verdicts kept for distillation into the local model. The log holds students' raw
+# answers, so it is only written when VERDICT_LOG_PATH is set, and rotated by size.
+verdict_log_path = os.environ.get('VERDICT_LOG_PATH')
+verdict_log = VerdictLog(
+    verdict_log_path,
+    max_bytes=int(float(os.environ.get('VERDICT_LOG_MAX_MB', 100)) * 2**20),
+    backups=int(os.environ.get('VERDICT_LOG_BACKUPS', 5))
+) if verdict_log_path and not OFFLINE else None
+if verdict_log:
+    atexit.register(verdict_log.flush)
+
+# Set by the startup loaders below; both stay None until their component is ready
+evaluator = None
+gemini_model = None
+# Opened by the first evaluator load and reused by every later one, along with its compaction thread
+question_store = None
+
+def load_firebase():
+    """Initialize the Firebase app and the Firestore client"""
+    global db
+    cred = credentials.Certificate('your-file.json')
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+
+def load_gemini():
+    """Import and configure the Gemini client"""
+    global genai, gemini_model
+    import google.generativeai as genai
+    genai.configure(api_key='Your-Key')
+    gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+
+def load_evaluator():
+    """Load the answer model, question bank and answer index"""
+    global evaluator, question_store
+    if question_store is None:
+        question_store = QuestionBankStore('./questions.db', seed_excel_path='Dataset.xlsx')
+    evaluator = StudentAnswerEvaluator('./enhance_triplet', 'Dataset.xlsx', question_store=question_store,
+                                       **evaluator_options())
+    # In-flight quizzes finish on the evaluator and snapshot they started with; their next
+    # quiz starts on this one
+    return evaluator.load_timings
+
+token_cache = VerifiedTokenCache(
+    max_entries=int(os.environ.get('TOKEN_CACHE_SIZE', 10000)),
+    # TOKEN_CHECK_REVOKED=1 rejects revoked tokens within TOKEN_REVOCATION_CHECK_SECONDS
+    check_revoked=os.environ.get('TOKEN_CHECK_REVOKED') == '1',
+    revocation_check_interval=int(os.environ.get('TOKEN_REVOCATION_CHECK_SECONDS', 300))
+)
+
+# RL state is written behind the answer path and flushed once more on shutdown
+rl_state_writer = RLStateWriter(flush_interval=int(os.environ.get('RL_STATE_FLUSH_INTERVAL', 30)))
+atexit.register(rl_state_writer.flush)
+progress_rollups = ProgressRollups(flush_interval=int(os.environ.get('PROGRESS_FLUSH_INTERVAL', 10)))
+atexit.register(progress_rollups.flush)
+
+# Per-student quiz sessions all share the single loaded evaluator
+quiz_sessions = QuizSessionStore(
+    lambda session_id: QuizSession(evaluator, session_id),
+    max_sessions=int(os.environ.get('QUIZ_SESSION_MAX', 1000)),
+    ttl_seconds=int(os.environ.get('QUIZ_SESSION_TTL', 3600))
+)
+
+metrics.collect('learnsmart_active_sessions', 'gauge', 'Quiz sessions held in memory',
+                lambda: [({}, len(quiz_sessions))])
+metrics.collect('learnsmart_grading_cache_lookups_total', 'counter', 'Grading cache lookups by result',
+                lambda: [({'result': result}, grading_cache.stats()[key])
+                         for result, key in (('hit', 'hits'), ('disk_hit', 'disk_hits'), ('miss', 'misses'))])
+metrics.collect('learnsmart_question_list_cache_lookups_total', 'counter', 'Cached /api/questions responses by result',
+                lambda: [({'result': 'hit'}, evaluator.question_list_cache.hits),
+                         ({'result': 'miss'}, evaluator.question_list_cache.misses)] if evaluator else [])
+metrics.collect('learnsmart_progress_cache_lookups_total', 'counter', 'Cached /api/user/progress responses by result',
+                lambda: [({'result': 'hit'}, progress_rollups.hits), ({'result': 'miss'}, progress_rollups.misses)])
+metrics.collect('learnsmart_token_cache_lookups_total', 'counter', 'Verified ID token cache lookups by result',
+                lambda: [({'result': 'hit'}, token_cache.hits), ({'result': 'miss'}, token_cache.misses)])
+metrics.collect('learnsmart_grading_decisions_total', 'counter', 'Graded answers by deciding tier',
+                lambda: [({'tier': tier}, count) for tier, count in dict(evaluator.grading_stats.decisions).items()]
+                if evaluator else [])
+metrics.collect('learnsmart_component_ready', 'gauge', 'Whether each startup component has loaded',
+                lambda: [({'component': name}, int(info['status'] == 'ready'))
+                         for name, info in startup.snapshot()['components'].items()])
+
+# Heavy components load in the background; EAGER_STARTUP=1 restores blocking startup
+startup = StartupLoader()
+if not OFFLINE:
+    startup.register('firebase', load_firebase)
+    startup.register('gemini', load_gemini)
+    startup.register('evaluator', load_evaluator)
+    startup.start(wait=os.environ.get('EAGER_STARTUP') == '1')
+    
+def role_required(required_role):
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            # Tokens cannot be verified before Firebase is up; that is not the caller's fault
+            if startup.is_loading('firebase'):
+                return starting_up_response(['firebase'])
+            id_token = request.headers.get('Authorization', '').split('Bearer ')[-1]
+            try:
+                decoded_token = token_cache.verify_id_token(id_token)
+                user_role = decoded_token.get('role', 'student')
+                if user_role != required_role:
+                    return jsonify({'error': 'Insufficient permissions'}), 403
+                g.user_id = decoded_token['uid']
+                g.user_role = user_role
+                return f(*args, **kwargs)
+            except Exception as e:
+                return jsonify({'error': str(e)}), 401
+        return wrapped
+    return decorator
+
+def requires_components(*names):
+    """Answer 503 while a component the route needs is still loading in the background"""
+    def decorator(f):
+        @wraps(f)
+        def wrapped(*args, **kwargs):
+            loading = [name for name in names if startup.is_loading(name)]
+            if loading:
+                return starting_up_response(loading)
+            return f(*args, **kwargs)
+        return wrapped
+    return decorator
+
+def starting_up_response(loading):
+    response = jsonify({'error': 'Service is starting up', 'loading': loading})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
+def init_firestore_collections(user_id):
+    collections = ['user_progress', 'quiz_attempts', 'exam_results', 'topic_mastery']
+    for collection in collections:
+        doc_ref = db.collection(collection).document(user_id)
+        with metrics.time('learnsmart_firestore_duration_seconds', op='read'):
+            exists = doc_ref.get().exists
+        if not exists:
+            with metrics.time('learnsmart_firestore_duration_seconds', op='write'):
+                doc_ref.set({})
+
+def request_session_id(data, verified_user_id):
+    """
+    Session key for a request. Signed-in students are keyed by their verified UID; clients
+    without a token can only name a server-issued anonymous session, which lives in its own
+    namespace, so no body-supplied ID can reach a signed-in student's quiz.
+    """
+    if verified_user_id:
+        return f"user:{verified_user_id}"
+    session_id = data.get('session_id')
+    if isinstance(session_id, str) and session_id.startswith('anon:'):
+        return session_id
+    return None
+
+def get_request_user_id():
+    """Return the verified Firebase UID from the Authorization header, or None"""
+    id_token = request.headers.get('Authorization', '').split('Bearer ')[-1]
+    if not id_token:
+        return None
+    try:
+        decoded_token = token_cache.verify_id_token(id_token)
+        return decoded_token.get('uid')
+    except Exception as e:
+        api_logger.warning(f"Auth error: {str(e)}")
+        return None
+
+@app.route('/')
+def home():
+    return jsonify({
+        'message': 'Student Quiz API',
+        'endpoints': {
+            'GET /api/topics': 'List all available topics',
+            'POST /api/quiz/start': 'Start a new quiz',
+            'POST /api/quiz/answer': 'Submit an answer',
+            'GET /api/quiz/status': 'Get quiz status',
+            'GET /api/quiz/results': 'Get quiz results'
+        }
+    })
+
+@app.route('/api/topics', methods=['GET'])
+@requires_components('evaluator')
+def get_topics():
+    if not evaluator:
+        return jsonify({'error': 'Evaluator not initialized'}), 500
+    
+    try:
+        unique_topics = evaluator.live_questions()['Topic'].dropna().unique().tolist()
+        return jsonify({'topics': unique_topics})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Update in app.py - modify the start_quiz route
+@app.route('/api/quiz/start', methods=['POST'])
+@requires_components('evaluator', 'firebase')
+def start_quiz():
+    data = request.json
+    topic_type = data.get('type')  # 'topic' or 'exam'
+    topics = data.get('topics', [])
+    
+    # A verified token decides whose quiz this is; body identifiers are only used without one
+    verified_user_id = get_request_user_id()
+    user_id = verified_user_id or data.get('user_id')
+    
+    if not evaluator:
+        # A failed background load is retried on demand
+        if not startup.load('evaluator'):
+            return jsonify({'error': f"Failed to initialize evaluator: {startup.error('evaluator')}"}), 500
+    
+    # Each student gets their own session; anonymous clients get a server-issued ID to send back
+    session_id = request_session_id(data, verified_user_id) or f"anon:{uuid.uuid4()}"
+    session = quiz_sessions.get_or_create(session_id)
+    
+    with session.lock:
+        # Sessions from before an evaluator reload move to the current one with their next quiz
+        session.evaluator = evaluator
+        if topic_type == 'exam':
+            question_count = session.init_comprehensive_exam(topics if topics else None)
+            if question_count == 0:
+                return jsonify({'error': 'No questions available for selected topics'}), 400
+                
+            question = session.get_next_quiz_question()
+            return jsonify({
+                'message': 'Exam started',
+                'question': question,
+                'total_questions': question_count,
+                'current_question': 1,
+                'quiz_type': 'exam',
+                'session_id': session_id
+            })
+        else:
+            # Topic-based quiz
+            if not topics or len(topics) == 0:
+                return jsonify({'error': 'Please select at least one topic for topic quiz'}), 400
+            
+            topic = topics[0]  # Use the first topic if multiple are provided
+            
+            # Pass the user_id to init_topic_quiz - this is crucial for getting the correct level
+            question_count = session.init_topic_quiz(topic, user_id)
+            if question_count == 0:
+                return jsonify({'error': f'No questions available for topic: {topic}'}), 400
+                
+            question = session.get_next_quiz_question()
+            
+            # Include the actual current level in the response
+            current_level = session.current_topic_levels.get(topic, 'Easy')
+            return jsonify({
+                'message': 'Topic quiz started',
+                'question': question,
+                'total_questions': question_count,
+                'current_question': 1,
+                'quiz_type': 'topic',
+                'current_level': current_level,
+                'session_id': session_id
+            })
+        
+# app.py - Updated /api/quiz/answer route
+@app.route('/api/quiz/answer', methods=['POST'])
+@requires_components('evaluator', 'gemini', 'firebase')
+def submit_answer():
+    data = request.json
+    question_id = parse_question_id(data.get('question_id'))
+    answer = data.get('answer')
+    quiz_type = data.get('quiz_type', 'topic')  # Get quiz type from request, default to topic
+    # Return the verdict right away and stream detailed feedback from /api/quiz/feedback/<answer_id>
+    stream_feedback = bool(data.get('stream_feedback', False))
+    
+    if not evaluator or question_id is None or not answer:
+        return jsonify({'error': 'Invalid request'}), 400
+    
+    # Extract user ID from auth token if available
+    user_id = get_request_user_id()
+    
+    session = quiz_sessions.get(request_session_id(data, user_id))
+    if not session:
+        return jsonify({'error': 'No active quiz session'}), 404
+    
+    with session.lock:
+        # Check if we're in exam mode
+        if quiz_type == 'exam' or session.exam_mode:
+            # Each exam question is graded once
+            error = session.exam_answer_error(question_id)
+            if error is not None:
+                return jsonify({'error': error}), 404 if error == 'Question not found' else 409
+            
+            # Process exam answer
+            evaluation = session.evaluate_answer(question_id, answer, is_exam=True, defer_feedback=stream_feedback)
+            if 'error' in evaluation:
+                return jsonify({'error': evaluation['error']}), 400
+            
+            # Move to next question
+            session.mark_exam_answered(question_id)
+            next_question = session.get_next_quiz_question()
+            
+            # Calculate score if exam is complete
+            exam_score = None
+            if next_question is None:
+                exam_score = session.calculate_exam_score()
+            
+            response = {
+                'is_correct': evaluation['is_correct'],
+                'feedback': evaluation.get('feedback', ''),
+                'confidence': evaluation.get('confidence', 0),
+                'correct_answer': evaluation.get('correct_answer', ''),
+                'improvements': evaluation.get('improvements', []),
+                'next_question': next_question,
+                'current_question': session.current_quiz_index + 1,
+                'total_questions': len(session.quiz_questions),
+                'quiz_complete': next_question is None,
+                'quiz_type': 'exam',
+                'score': exam_score
+            }
+            add_feedback_stream_fields(response, evaluation)
+            add_degraded_fields(response)
+            if 'topic' in evaluation:
+                progress_rollups.record(user_id, evaluation['topic'], evaluation['is_correct'], is_exam=True)
+            return jsonify(response)
+        else:
+            # Process topic quiz answer
+            result, next_question, quiz_complete = session.process_answer_and_advance(
+                question_id, answer, defer_feedback=stream_feedback
+            )
+            
+            # Get the full evaluation details from the result
+            evaluation = result.get('evaluation', {})
+            
+            response = {
+                'is_correct': result['is_correct'],
+                'feedback': evaluation.get('feedback', ''),
+                'confidence': evaluation.get('confidence', 0),
+                'correct_answer': evaluation.get('correct_answer', ''),
+                'improvements': evaluation.get('improvements', []),
+                'level_complete': result.get('level_complete', False),
+                'quiz_complete': quiz_complete,
+                'next_question': next_question,
+                'quiz_type': 'topic',
+                'current_level': result.get('current_level', 'Easy')
+            }
+            add_feedback_stream_fields(response, evaluation)
+            add_degraded_fields(response)
+            
+            if result.get('level_complete') and not quiz_complete:
+                response['new_level'] = result.get('new_level')
+                response['level_performance'] = {
+                    'questions_asked': session.level_questions_asked,
+                    'questions_correct': session.level_questions_correct
+                }
+            
+            if next_question:
+                response['current_question'] = session.current_quiz_index + 1
+                response['total_questions'] = len(session.quiz_questions)
+                
+            if 'topic' in evaluation:
+                progress_rollups.record(user_id, evaluation['topic'], result['is_correct'],
+                                        level=response.get('new_level') or response['current_level'])
+            
+            # Persist the RL model in the background; level completion is when it actually changes
+            if quiz_type == 'topic' and user_id:
+                rl_state_writer.mark_dirty(user_id, session, flush_now=result.get('level_complete', False))
+            
+            return jsonify(response)
+    
+@app.route('/api/quiz/answers/batch', methods=['POST'])
+@requires_components('evaluator', 'gemini', 'firebase')
+def submit_exam_answers():
+    """Grade every answer of an exam in one request and return the exam score"""
+    data = request.json or {}
+    answers = data.get('answers')
+    
+    if not evaluator or not isinstance(answers, list) or not answers:
+        return jsonify({'error': 'Invalid request'}), 400
+    
+    user_id = get_request_user_id()
+    
+    session = quiz_sessions.get(request_session_id(data, user_id))
+    if not session:
+        return jsonify({'error': 'No active quiz session'}), 404
+    
+    pairs = []
+    for item in answers:
+        item = item if isinstance(item, dict) else {}
+        pairs.append((parse_question_id(item.get('question_id')), item.get('answer')))
+    
+    with session.lock:
+        if not session.exam_mode:
+            return jsonify({'error': 'Batch grading is only available for exams'}), 400
+        
+        results = session.evaluate_exam_answers(pairs)
+        next_question = session.get_next_quiz_question()
+        for result in results:
+            if 'topic' in result:
+                progress_rollups.record(user_id, result['topic'], result['is_correct'], is_exam=True)
+        
+        return jsonify(add_degraded_fields({
+            'results': results,
+            'answered': sum(1 for result in results if 'error' not in result),
+            'total_questions': len(session.quiz_questions),
+            'quiz_complete': next_question is None,
+            'next_question': next_question,
+            'quiz_type': 'exam',
+            'score': session.calculate_exam_score()
+        }))
+
+def parse_question_id(value):
+    """Question IDs arrive as JSON numbers or numeric strings; anything else is None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    return None
+
+def add_degraded_fields(response):
+    """Tell clients when answers are graded by similarity alone because Gemini failed to load"""
+    degraded = startup.failed('gemini')
+    if degraded:
+        response['degraded'] = degraded
+    return response
+
+def add_feedback_stream_fields(response, evaluation):
+    """Point streaming clients at the SSE endpoint that will deliver this answer's feedback"""
+    if 'answer_id' in evaluation:
+        response['answer_id'] = evaluation['answer_id']
+        response['feedback_pending'] = evaluation['feedback_pending']
+        response['feedback_url'] = f"/api/quiz/feedback/{evaluation['answer_id']}"
+
+@app.route('/api/quiz/feedback/<string:answer_id>', methods=['GET'])
+def get_feedback_stream(answer_id):
+    """Server-Sent Events stream that emits one 'feedback' event once Gemini has responded"""
+    found, result = feedback_broker.wait(answer_id, timeout=0)
+    if not found:
+        return jsonify({'error': 'Unknown or expired answer ID'}), 404
+
+    def events(result):
+        waited = 0
+        while result is None and waited < 60:
+            # Comment lines keep proxies from closing an idle connection
+            yield ": waiting\n\n"
+            _, result = feedback_broker.wait(answer_id, timeout=10)
+            waited += 10
+
+        if result is None:
+            payload = {'answer_id': answer_id, 'error': 'Feedback timed out'}
+        elif 'error' in result:
+            payload = {'answer_id': answer_id, 'error': result['error']}
+        else:
+            payload = {
+                'answer_id': answer_id,
+                # The verdict the answer was graded with, and the tiers that produced the
+                # verdict and then the feedback; see deferred_feedback for disagreements
+                'correct': result.get('correct'),
+                'grading_path': result.get('grading_path', [result.get('tier')]),
+                'feedback_superseded': result.get('feedback_superseded', False),
+                'feedback': result.get('feedback', ''),
+                'improvements': result.get('improvements', []),
+                'confidence': result.get('score', 0),
+                'correct_answer': result.get('correct_answer', '')
+            }
+        yield f"event: feedback\ndata: {json.dumps(payload)}\n\n"
+
+    return Response(events(result), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/grading/stats', methods=['GET'])
+@requires_components('evaluator')
+def get_grading_stats():
+    if not evaluator:
+        return jsonify({'error': 'Evaluator not initialized'}), 500
+    return jsonify({
+        'mode': evaluator.grading_mode,
+        'band': {
+            'accept_threshold': evaluator.accept_threshold,
+            'reject_threshold': evaluator.reject_threshold,
+            'min_margin': evaluator.min_margin
+        },
+        **evaluator.grading_stats.snapshot(),
+        'cache': evaluator.grading_cache.stats()
+    })
+
+@app.route('/api/user/progress', methods=['GET'])
+@requires_components('firebase')
+def get_user_progress():
+    # Extract user ID from auth token
+    id_token = request.headers.get('Authorization', '').split('Bearer ')[-1]
+    
+    try:
+        if not id_token:
+            return jsonify({'error': 'Authentication required'}), 401
+            
+        decoded_token = token_cache.verify_id_token(id_token)
+        user_id = decoded_token.get('uid')
+        
+        # Served from the user's rollup, which grading keeps current
+        progress_data = progress_rollups.progress(user_id)
+        if progress_data is None:
+            return jsonify({'error': 'User not found'}), 404
+        
+        return jsonify(progress_data)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests, whatever is still loading"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: every component has loaded; includes per-component startup timings"""
+    snapshot = startup.snapshot()
+    return jsonify(snapshot), 200 if snapshot['ready'] else 503
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/test', methods=['GET'])
+def test_endpoint():
+    return jsonify({
+        'status': 'success',
+        'message': 'Test endpoint is working!',
+        'data': {
+            'version': '1.0',
+            'timestamp': datetime.datetime.now(datetime.UTC)
+        }
+    })
+    
+@app.route('/api/questions', methods=['GET'])
+@requires_components('evaluator')
+def get_questions():
+    """
+    Questions in the bank, optionally filtered by topic and difficulty.
+      fields=id,text        project the listed fields only (default: all of them)
+      limit=50&offset=100   offset pagination; without limit every matching question is returned
+      limit=50&cursor=<id>  cursor pagination; pass the previous page's nextCursor
+    Responses carry an ETag that changes with the bank, and If-None-Match gets a 304.
+    """
+    try:
+        # Get filter parameters
+        topic = request.args.get('topic', '')
+        difficulty = request.args.get('difficulty', '')
+        
+        if not evaluator:
+            return jsonify({'error': 'Evaluator not initialized'}), 500
+
+        fields = QuestionListCache.FIELDS
+        requested = request.args.get('fields')
+        if requested:
+            names = [name.strip() for name in requested.split(',') if name.strip()]
+            unknown = [name for name in names if name not in QuestionListCache.FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+            fields = ['id'] + [name for name in QuestionListCache.FIELDS if name in names and name != 'id']
+        fields = tuple(fields)
+
+        try:
+            limit = int(request.args['limit']) if request.args.get('limit') else None
+            offset = int(request.args.get('offset') or 0)
+            after = int(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError:
+            return jsonify({'error': 'limit, offset and cursor must be integers'}), 400
+        if limit is not None and not 1 <= limit <= QuestionListCache.MAX_LIMIT:
+            return jsonify({'error': f"limit must be between 1 and {QuestionListCache.MAX_LIMIT}"}), 400
+        if offset < 0:
+            return jsonify({'error': 'offset must not be negative'}), 400
+
+        topic = topic if topic != 'all' else ''
+        # One snapshot for the whole request, so the ETag always matches the body
+        bank = evaluator.bank
+        version = evaluator.bank_version_tag(bank)
+        key = (topic, difficulty, fields, offset, after, limit)
+        cache = evaluator.question_list_cache
+        entry = cache.get(version, key)
+        if entry is None:
+            # Filter questions
+            filtered_df = bank.frame()
+            if topic:
+                filtered_df = filtered_df[filtered_df['Topic'] == topic]
+            if difficulty:
+                filtered_df = filtered_df[filtered_df['Difficulty Level'] == difficulty]
+            entry = cache.put(version, key, QuestionListCache.build_page(filtered_df, fields, offset, after, limit))
+
+        etag, body = entry
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match.strip() == '*' or etag in (tag.strip() for tag in if_none_match.split(',')):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.headers['ETag'] = etag
+        # The list is per-deployment data behind auth: revalidate every time, never share
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    except Exception as e:
+        api_logger.error(f"Error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/questions/search', methods=['GET'])
+@requires_components('evaluator')
+def search_questions():
+    """Semantic search: ?q=<text>&limit=10, optionally narrowed by topic and difficulty"""
+    if not evaluator:
+        return jsonify({'error': 'Evaluator not initialized'}), 500
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    try:
+        limit = int(request.args.get('limit') or 10)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit must be between 1 and 100'}), 400
+    topic = request.args.get('topic', '')
+    try:
+        results = evaluator.search_questions(
+            query,
+            k=limit,
+            topic=topic if topic != 'all' else None,
+            difficulty=request.args.get('difficulty') or None
+        )
+        
+        def value(record, column):
+            return None if pd.isna(record[column]) else record[column]
+        
+        return jsonify({
+            'query': query,
+            'results': [{
+                'id': str(question_id),
+                'topic': value(record, 'Topic'),
+                'difficulty': value(record, 'Difficulty Level'),
+                'text': value(record, 'Anchor'),
+                'correctAnswer': value(record, 'Positive'),
+                'incorrectAnswers': [value(record, 'Negative'), value(record, 'Incorrect Answer 2')],
+                'similarity': round(similarity, 4)
+            } for question_id, record, similarity in results],
+            'total': len(results)
+        })
+    except Exception as e:
+        api_logger.error(f"Error searching questions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/questions/<string:question_id>', methods=['DELETE'])
+@requires_components('evaluator')
+def delete_question(question_id):
+    try:
+        idx = int(question_id)
+        if idx not in evaluator.question_index.records:
+            return jsonify({'error': 'Question not found'}), 404
+            
+        # IDs are stable, so nothing is renumbered; quizzes in progress keep their snapshot
+        evaluator.delete_question(idx)
+        return jsonify({'message': 'Question deleted successfully'})
+        
+    except ValueError:
+        return jsonify({'error': 'Invalid question ID format'}), 400
+    except Exception as e:
+        api_logger.error(f"Error deleting question: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/questions/<string:question_id>', methods=['PUT'])
+@requires_components('evaluator')
+def update_question(question_id):
+    try:
+        data = request.json
+        idx = int(question_id)
+        
+        if idx not in evaluator.question_index.records:
+            return jsonify({'error': 'Question not found'}), 404
             
-        evaluator.df.at[idx, 'Topic'] = data.get('topic')
-        evaluator.df.at[idx, 'Difficulty Level'] = data.get('difficulty')
-        evaluator.df.at[idx, 'Anchor'] = data.get('text')
-        evaluator.df.at[idx, 'Positive'] = data.get('correctAnswer')
-        evaluator.df.at[idx, 'Negative'] = data.get('incorrectAnswers')[0]
-        evaluator.df.at[idx, 'Incorrect Answer 2'] = data.get('incorrectAnswers')[1]
+        updated_question = {
+            'Unique ID': idx,
+            'Anchor': data.get('text'),
+            'Positive': data.get('correctAnswer'),
+            'Negative': data.get('incorrectAnswers')[0],
+            'Incorrect Answer 2': data.get('incorrectAnswers')[1],
+            'Difficulty Level': data.get('difficulty'),
+            'Topic': data.get('topic')
+        }
         
-        # Save to Excel  # NEW SECTION
-        evaluator.df.to_excel('Dataset.xlsx', index=False)
+        evaluator.update_question(idx, updated_question)
         
-        updated_question = evaluator.df.iloc[idx].to_dict()
         updated_question['id'] = str(idx)
         return jsonify(updated_question)
         
     except ValueError:
         return jsonify({'error': 'Invalid question ID format'}), 400
     except Exception as e:
-        print(f"Error updating question: {str(e)}")
+        api_logger.error(f"Error updating question: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/questions', methods=['POST'])
+@requires_components('evaluator')
 def create_question():
     try:
         data = request.json
@@ -1312,31 +4341,125 @@ def create_question():
             'Topic': data.get('topic')
         }
         
-        new_df = pd.DataFrame([new_question])
-        evaluator.df = pd.concat([evaluator.df, new_df], ignore_index=True)
-        # Save to Excel  # NEW LINE
-        evaluator.df.to_excel('Dataset.xlsx', index=False)
+        on_duplicate = request.args.get('on_duplicate', evaluator.duplicate_policy)
+        if on_duplicate not in ('warn', 'reject', 'allow'):
+            return jsonify({'error': 'on_duplicate must be warn, reject or allow'}), 400
         
-        return jsonify({
-            'id': str(len(evaluator.df)-1),
+        # Embedded once, for the duplicate lookup and the question text index
+        text_vector = evaluator.question_text_index.encode([new_question['Anchor']])[0]
+        duplicates = [] if on_duplicate == 'allow' else evaluator.duplicate_matches([text_vector])[0]
+        if duplicates and on_duplicate == 'reject':
+            return jsonify({
+                'error': 'A near-duplicate of this question already exists',
+                'duplicates': duplicates
+            }), 409
+        
+        question_uid = evaluator.add_question(new_question, text_vector=text_vector)
+        new_question['Unique ID'] = question_uid
+        
+        response = {
+            'id': str(question_uid),
             **new_question
-        }), 201
+        }
+        if duplicates:
+            response['duplicates'] = duplicates
+        return jsonify(response), 201
         
     except Exception as e:
-        print(f"Error creating question: {str(e)}")
+        api_logger.error(f"Error creating question: {str(e)}")
         return jsonify({'error': str(e)}), 500
     
+@app.route('/api/questions/export', methods=['GET'])
+@role_required('teacher')
+@requires_components('evaluator')
+def export_questions():
+    if not evaluator:
+        return jsonify({'error': 'Evaluator not initialized'}), 500
+    try:
+        buffer = io.BytesIO()
+        with metrics.time('learnsmart_question_store_duration_seconds', op='export_xlsx'):
+            evaluator.question_store.export_excel(buffer)
+        buffer.seek(0)
+        return send_file(
+            buffer,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name='Dataset.xlsx'
+        )
+    except Exception as e:
+        api_logger.error(f"Error exporting questions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/questions/import', methods=['POST'])
+@role_required('teacher')
+@requires_components('evaluator')
+def import_questions():
+    if not evaluator:
+        return jsonify({'error': 'Evaluator not initialized'}), 500
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'error': 'Upload an xlsx file in the "file" field'}), 400
+    on_duplicate = request.args.get('on_duplicate', evaluator.duplicate_policy)
+    if on_duplicate not in ('warn', 'reject', 'allow'):
+        return jsonify({'error': 'on_duplicate must be warn, reject or allow'}), 400
+    try:
+        replace = request.form.get('mode', 'append') == 'replace'
+        imported, duplicates, bank = evaluator.import_questions(upload, replace=replace, on_duplicate=on_duplicate)
+        return jsonify({
+            'imported': imported,
+            'total': len(bank),
+            'version': bank.version,
+            'duplicates': duplicates,
+            'skipped': len(duplicates) if on_duplicate == 'reject' else 0
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        api_logger.error(f"Error importing questions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/questions/reload', methods=['POST'])
+@role_required('teacher')
+@requires_components('evaluator')
+def reload_questions():
+    """Hot-reload the bank from the question store, e.g. after editing questions.db directly"""
+    if not evaluator:
+        return jsonify({'error': 'Evaluator not initialized'}), 500
+    try:
+        bank = evaluator.reload_bank()
+        return jsonify({'total': len(bank), 'version': bank.version})
+    except Exception as e:
+        api_logger.error(f"Error reloading questions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/questions/count', methods=['GET'])
+@requires_components('evaluator')
 def get_question_count():
     if not evaluator:
         return jsonify({'error': 'Evaluator not initialized'}), 500
     try:
-        # Assuming evaluator.df contains all questions
-        total_count = len(evaluator.df)
+        total_count = len(evaluator.question_index.records)
         return jsonify({'total': total_count})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        metrics.observe(
+            'learnsmart_http_request_duration_seconds',
+            time.perf_counter() - started,
+            route=request.url_rule.rule if request.url_rule else 'unmatched',
+            method=request.method,
+            status=str(response.status_code)
+        )
+    return response
+
 @app.after_request
 def after_request(response):
     # Ensure all API responses have proper CORS headers
@@ -0,0 +1,253 @@
+"""
+Distill logged Gemini verdicts into the local grading model.
+
+When VERDICT_LOG_PATH is set, the API appends every fresh Gemini verdict to that JSONL log,
+rotating it by size into numbered backups that are read here as well. This script turns
+those verdicts into triplets, fine-tunes a candidate from the current model with the
+early-stopping trainer in model-training.py, and reports how often the local tier agrees
+with Gemini on a held-out slice of questions, for both the current and the candidate model.
+Early stopping and the best-epoch choice use a separate validation slice, so the held-out
+slice only ever decides promotion. With --promote the candidate replaces the current model
+when the local tier resolves more answers without losing agreement.
+
+Meant to run periodically, e.g. nightly:
+
+    python distill.py --log gemini_verdicts.jsonl --model ./enhance_triplet --promote
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sentence_transformers import SentenceTransformer
+
+# model-training.py is not importable by name because of the hyphen
+_spec = importlib.util.spec_from_file_location(
+    'model_training', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model-training.py')
+)
+model_training = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(model_training)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def verdict_log_files(path: str) -> List[str]:
+    """The log and its rotated backups (path.1 is the newest backup), oldest first"""
+    backups = [name for name in glob.glob(glob.escape(path) + '.*') if name[len(path) + 1:].isdigit()]
+    backups.sort(key=lambda name: int(name[len(path) + 1:]), reverse=True)
+    return backups + ([path] if os.path.exists(path) else [])
+
+
+def load_verdicts(path: str) -> pd.DataFrame:
+    """Logged verdicts, keeping only the latest one for each (question, answer) pair"""
+    records = []
+    for log_file in verdict_log_files(path):
+        with open(log_file, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed line {line_number} in {log_file}")
+
+    df = pd.DataFrame.from_records(records)
+    if df.empty:
+        return df
+    df['question'] = df['question'].astype(str).str.strip()
+    df['student_answer'] = df['student_answer'].astype(str).str.strip()
+    df['correct_answer'] = df['correct_answer'].astype(str).str.strip()
+    df['incorrect_answers'] = df['incorrect_answers'].apply(lambda v: v if isinstance(v, list) else [])
+    df = df[(df['question'] != '') & (df['student_answer'] != '') & (df['correct_answer'] != '')]
+    df = df.sort_values('timestamp').drop_duplicates(['question', 'student_answer'], keep='last')
+    df['question_key'] = df['question'].str.lower().str.split().str.join(' ')
+    return df.reset_index(drop=True)
+
+
+def question_buckets(verdicts: pd.DataFrame) -> pd.Series:
+    """
+    A stable bucket in 0-99 per question. Slices are bucket ranges, so a question stays in
+    the same slice from run to run and evaluation questions never leak into training later.
+    """
+    return verdicts['question_key'].map(
+        lambda key: int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=4).digest(), 'little') % 100
+    )
+
+
+def verdict_triplets(verdicts: pd.DataFrame) -> pd.DataFrame:
+    """
+    Triplets in the same (question, positive, negative) layout as model-training.py:
+    an answer Gemini accepted is a positive against each reference wrong answer, and an
+    answer Gemini rejected is a negative against the reference answer.
+    """
+    accepted = verdicts[verdicts['correct']].explode('incorrect_answers').dropna(subset=['incorrect_answers'])
+    rejected = verdicts[~verdicts['correct']]
+    triplets = pd.concat([
+        pd.DataFrame({
+            'question': accepted['question_key'],
+            'anchor': accepted['question'],
+            'positive': accepted['student_answer'],
+            'negative': accepted['incorrect_answers'].astype(str).str.strip(),
+        }),
+        pd.DataFrame({
+            'question': rejected['question_key'],
+            'anchor': rejected['question'],
+            'positive': rejected['correct_answer'],
+            'negative': rejected['student_answer'],
+        }),
+    ], ignore_index=True)
+    triplets = triplets[(triplets['negative'] != '') & (triplets['positive'] != triplets['negative'])]
+    return triplets[model_training.TRIPLET_COLUMNS].drop_duplicates(ignore_index=True)
+
+
+def agreement(model: SentenceTransformer, verdicts: pd.DataFrame, accept: float, reject: float,
+              min_margin: float, batch_size: int = 64) -> Dict:
+    """
+    Apply the API's local-tier rule to each held-out answer. Coverage is the share it decides
+    without Gemini; agreement is how often those decisions match Gemini's verdict.
+    """
+    negatives = verdicts['incorrect_answers'].tolist()
+    texts = sorted(set(verdicts['student_answer']) | set(verdicts['correct_answer']) |
+                   {text for answers in negatives for text in answers})
+    vectors = model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                           normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+    positions = {text: i for i, text in enumerate(texts)}
+
+    student = vectors[verdicts['student_answer'].map(positions).to_numpy()]
+    reference = vectors[verdicts['correct_answer'].map(positions).to_numpy()]
+    positive_sim = np.sum(student * reference, axis=1)
+    negative_sim = np.array([
+        max((float(vectors[positions[text]] @ vec) for text in answers), default=0.0)
+        for answers, vec in zip(negatives, student)
+    ])
+    margin = positive_sim - negative_sim
+
+    accepted = (positive_sim >= accept) & (margin >= min_margin)
+    rejected = ~accepted & ((positive_sim <= reject) | (margin <= -min_margin))
+    resolved = accepted | rejected
+    matches = resolved & (accepted == verdicts['correct'].to_numpy())
+
+    return {
+        'answers': int(len(verdicts)),
+        'coverage': float(resolved.mean()),
+        'agreement': float(matches.sum() / resolved.sum()) if resolved.any() else 0.0,
+        'resolved_correctly': float(matches.mean()),
+    }
+
+
+def print_agreement(label: str, report: Dict):
+    print(f"{label:<10} coverage {report['coverage']:.2%}, agreement {report['agreement']:.2%}, "
+          f"resolved correctly {report['resolved_correctly']:.2%} of {report['answers']} held-out answers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the local grading model on logged Gemini verdicts")
+    parser.add_argument('--log', default=os.environ.get('VERDICT_LOG_PATH', 'gemini_verdicts.jsonl'))
+    parser.add_argument('--model', default='./enhance_triplet', help="current model, also the promotion target")
+    parser.add_argument('--base-model', default='all-MiniLM-L6-v2', help="used when --model does not exist yet")
+    parser.add_argument('--dataset', default='Dataset.xlsx', help="original triplets mixed in to avoid forgetting ('' to skip)")
+    parser.add_argument('--candidate', default='./enhance_triplet-candidate')
+    parser.add_argument('--holdout-pct', type=int, default=20, help="questions for the promotion comparison")
+    parser.add_argument('--validation-pct', type=int, default=10, help="questions for early stopping")
+    parser.add_argument('--min-new', type=int, default=200, help="skip training until this many new verdicts arrived")
+    parser.add_argument('--state', default='distill_state.json')
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--patience', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--accept-threshold', type=float, default=float(os.environ.get('GRADING_ACCEPT_THRESHOLD', 0.75)))
+    parser.add_argument('--reject-threshold', type=float, default=float(os.environ.get('GRADING_REJECT_THRESHOLD', 0.45)))
+    parser.add_argument('--min-margin', type=float, default=float(os.environ.get('GRADING_MIN_MARGIN', 0.1)))
+    parser.add_argument('--report-only', action='store_true', help="only report the current model's agreement")
+    parser.add_argument('--promote', action='store_true', help="replace --model with the candidate when it is better")
+    args = parser.parse_args()
+
+    verdicts = load_verdicts(args.log)
+    if verdicts.empty:
+        logger.info(f"No verdicts in {args.log} yet")
+        return
+
+    buckets = question_buckets(verdicts)
+    holdout = buckets < args.holdout_pct
+    validation = ~holdout & (buckets < args.holdout_pct + args.validation_pct)
+    held_out = verdicts[holdout].reset_index(drop=True)
+    validation_verdicts = verdicts[validation].reset_index(drop=True)
+    train_verdicts = verdicts[~holdout & ~validation]
+    logger.info(f"{len(verdicts)} verdicts: {len(train_verdicts)} for training, "
+                f"{len(validation_verdicts)} for validation, {len(held_out)} held out")
+    if held_out.empty:
+        logger.info("No held-out verdicts yet; nothing to evaluate against")
+        return
+
+    current_path = args.model if os.path.exists(args.model) else args.base_model
+    thresholds = (args.accept_threshold, args.reject_threshold, args.min_margin)
+    baseline = agreement(SentenceTransformer(current_path), held_out, *thresholds)
+    print_agreement('current', baseline)
+    if args.report_only:
+        return
+
+    state = {}
+    if os.path.exists(args.state):
+        with open(args.state) as f:
+            state = json.load(f)
+    # Counted by timestamp, since rotation drops the oldest verdicts from the log
+    if 'latest_timestamp' in state:
+        new_verdicts = int((verdicts['timestamp'] > state['latest_timestamp']).sum())
+    else:
+        new_verdicts = len(verdicts) - state.get('verdicts', 0)
+    if new_verdicts < args.min_new:
+        logger.info(f"Only {new_verdicts} new verdicts since the last run; waiting for {args.min_new}")
+        return
+
+    train_triplets = verdict_triplets(train_verdicts)
+    if args.dataset and os.path.exists(args.dataset):
+        train_triplets = pd.concat([train_triplets, model_training.load_triplets(args.dataset)], ignore_index=True)
+    val_triplets = verdict_triplets(validation_verdicts)
+    if val_triplets.empty:
+        logger.info("No validation triplets yet; not training without a way to stop early")
+        return
+    logger.info(f"Fine-tuning {current_path} on {len(train_triplets)} triplets ({len(val_triplets)} for validation)")
+
+    trainer = model_training.AnswerEvaluationModel(
+        base_model=current_path,
+        batch_size=args.batch_size,
+        epochs=args.epochs,
+        patience=args.patience
+    )
+    # Each run starts from the current model, so checkpoints from earlier runs are not resumed
+    trainer.train(train_triplets, val_triplets, output_path=args.candidate,
+                  checkpoint_dir=args.candidate + '-checkpoint', resume=False, save_as=None)
+
+    candidate = agreement(SentenceTransformer(args.candidate), held_out, *thresholds)
+    print_agreement('candidate', candidate)
+
+    better = (candidate['resolved_correctly'] > baseline['resolved_correctly'] and
+              candidate['agreement'] >= baseline['agreement'] - 0.005)
+    promoted = False
+    if better and args.promote:
+        if os.path.exists(args.model):
+            backup = args.model.rstrip('/\\') + '.prev'
+            shutil.rmtree(backup, ignore_errors=True)
+            shutil.move(args.model, backup)
+            logger.info(f"Previous model kept in {backup}")
+        shutil.copytree(args.candidate, args.model)
+        promoted = True
+        logger.info(f"Promoted the candidate to {args.model}; restart the API to load it")
+    elif not better:
+        logger.info("Candidate did not beat the current model; keeping the current model")
+
+    state.update(verdicts=len(verdicts), latest_timestamp=float(verdicts['timestamp'].max()), baseline=baseline, candidate=candidate, promoted=promoted)
+    with open(args.state, 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Offline stand-in for Firebase ID tokens: signs tokens with Firebase's claim layout and
+verifies them the way auth.verify_id_token does, raising the same firebase_admin errors.
+
+Tokens are HS256-signed with a local secret instead of Google's RS256 keys, so nothing here
+touches the network. Only meant for tests and local runs, never for a deployed API.
+
+    signer = LocalTokenSigner('learnsmart-test')
+    token = signer.sign('student-1', {'role': 'student'})
+    cache = VerifiedTokenCache(verify=signer.verify_id_token)
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from firebase_admin import auth
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+class LocalTokenSigner:
+    def __init__(self, project_id, secret=None, clock=time.time):
+        self.project_id = project_id
+        self.secret = secret or os.urandom(32)
+        self.clock = clock
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self._valid_after = {}  # uid -> tokens issued before this second are revoked
+
+    def sign(self, uid, claims=None, expires_in=3600, audience=None):
+        """An ID token for uid carrying any custom claims (e.g. role), valid for expires_in seconds"""
+        now = int(self.clock())
+        payload = dict(claims or {})
+        payload.update({
+            'iss': self.issuer,
+            'aud': audience or self.project_id,
+            'auth_time': now,
+            'user_id': uid,
+            'sub': uid,
+            'iat': now,
+            'exp': now + expires_in,
+        })
+        header = _encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode('utf-8'))
+        body = _encode(json.dumps(payload).encode('utf-8'))
+        return f"{header}.{body}.{self._signature(header, body)}"
+
+    def revoke(self, uid):
+        """Like auth.revoke_refresh_tokens: tokens issued to uid so far stop passing check_revoked"""
+        self._valid_after[uid] = int(self.clock())
+
+    def verify_id_token(self, id_token, check_revoked=False):
+        """Decoded claims plus 'uid', or the firebase_admin error auth.verify_id_token would raise"""
+        try:
+            header, body, signature = id_token.split('.')
+            claims = json.loads(_decode(body))
+        except (AttributeError, ValueError) as e:
+            raise auth.InvalidIdTokenError(f"Malformed ID token: {str(e)}")
+        if not hmac.compare_digest(signature, self._signature(header, body)):
+            raise auth.InvalidIdTokenError('ID token has an invalid signature')
+        if claims.get('aud') != self.project_id:
+            raise auth.InvalidIdTokenError(
+                f"ID token has incorrect \"aud\" (audience) claim. Expected \"{self.project_id}\" "
+                f"but got \"{claims.get('aud')}\"")
+        if claims.get('iss') != self.issuer:
+            raise auth.InvalidIdTokenError(f"ID token has incorrect \"iss\" (issuer) claim: {claims.get('iss')}")
+        if not claims.get('sub'):
+            raise auth.InvalidIdTokenError('ID token has no "sub" (subject) claim')
+        if claims.get('exp', 0) <= self.clock():
+            raise auth.ExpiredIdTokenError('Token expired', None)
+        if check_revoked and claims['iat'] < self._valid_after.get(claims['sub'], 0):
+            raise auth.RevokedIdTokenError('The Firebase ID token has been revoked.')
+        claims['uid'] = claims['sub']
+        return claims
+
+    def _signature(self, header, body):
+        digest = hmac.new(self.secret, f"{header}.{body}".encode('ascii'), hashlib.sha256).digest()
+        return _encode(digest)
@@ -1,22 +1,119 @@
 import torch
 import pandas as pd
-import numpy as np
 from sentence_transformers import SentenceTransformer, InputExample, losses
+from sentence_transformers.evaluation import TripletEvaluator
 from torch.utils.data import DataLoader, Dataset
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import GroupShuffleSplit
 import logging
-from typing import List, Tuple
+from typing import Dict, Iterator, Optional, Tuple, Union
+import hashlib
+import inspect
+import json
 import os
+import shutil
+
+TEXT_COLUMNS = ['Anchor', 'Positive', 'Negative', 'Incorrect Answer 2']
+# Every non-empty wrong answer becomes its own triplet
+NEGATIVE_COLUMNS = ['Negative', 'Incorrect Answer 2']
+TRIPLET_COLUMNS = ['question', 'anchor', 'positive', 'negative']
+# fit() restores optimizer and scheduler state from checkpoint_path since sentence-transformers 3
+FIT_CAN_RESUME = 'resume_from_checkpoint' in inspect.signature(SentenceTransformer.fit).parameters
+
+class EarlyStopping(Exception):
+    """Raised from fit()'s evaluation callback to end training once validation accuracy plateaus."""
+
+def clean_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Text columns as stripped strings, with missing values and missing columns as ''."""
+    cleaned = pd.DataFrame(index=df.index)
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            values = df[column]
+            cleaned[column] = values.where(values.notna(), '').astype(str).str.strip()
+        else:
+            cleaned[column] = ''
+    return cleaned
+
+def build_triplets(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Expand rows into (anchor, positive, negative) triplets, one per available negative.
+    'question' is a normalized form of the anchor, used to keep a question's triplets together.
+    """
+    cleaned = clean_columns(df)
+    has_pair = (cleaned['Anchor'] != '') & (cleaned['Positive'] != '')
+
+    frames = []
+    for column in NEGATIVE_COLUMNS:
+        negative = cleaned[column]
+        mask = has_pair & (negative != '') & (negative != cleaned['Positive'])
+        frames.append(pd.DataFrame({
+            'anchor': cleaned.loc[mask, 'Anchor'],
+            'positive': cleaned.loc[mask, 'Positive'],
+            'negative': negative[mask],
+        }))
+
+    triplets = pd.concat(frames, ignore_index=True)
+    triplets.insert(0, 'question', triplets['anchor'].str.lower().str.split().str.join(' '))
+    return triplets.drop_duplicates(ignore_index=True)
+
+def iter_chunks(path: str, chunksize: int = 50000) -> Iterator[pd.DataFrame]:
+    """Stream an xlsx, CSV or Parquet file in DataFrame chunks of at most chunksize rows."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=lambda c: c in TEXT_COLUMNS, dtype=str)
+    elif extension == '.parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        columns = [c for c in TEXT_COLUMNS if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif extension in ('.xlsx', '.xlsm'):
+        # openpyxl's read-only mode streams rows instead of loading the whole sheet
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunksize:
+                    yield pd.DataFrame.from_records(chunk, columns=header)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame.from_records(chunk, columns=header)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Unsupported file type: {path}")
+
+def load_triplets(path: str, chunksize: int = 50000) -> pd.DataFrame:
+    """Build triplets chunk by chunk, so only the compact triplet frame is ever held in memory."""
+    frames = [build_triplets(chunk) for chunk in iter_chunks(path, chunksize)]
+    if not frames:
+        return pd.DataFrame(columns=TRIPLET_COLUMNS)
+    return pd.concat(frames, ignore_index=True).drop_duplicates(ignore_index=True)
+
+def split_by_question(triplets: pd.DataFrame, test_size: float = 0.2,
+                      random_state: int = 42) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Train/validation split in which all triplets of a question land on the same side."""
+    if triplets['question'].nunique() < 2:
+        raise ValueError("Need at least two distinct questions to split")
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    train_idx, val_idx = next(splitter.split(triplets, groups=triplets['question']))
+    return triplets.iloc[train_idx].reset_index(drop=True), triplets.iloc[val_idx].reset_index(drop=True)
 
 class AnswerEvaluationDataset(Dataset):
-    def __init__(self, examples: List[InputExample]):
-        self.examples = examples
+    """Triplets kept as string arrays; InputExample objects are built one at a time on access."""
+    def __init__(self, triplets: pd.DataFrame):
+        self.anchors = triplets['anchor'].to_numpy()
+        self.positives = triplets['positive'].to_numpy()
+        self.negatives = triplets['negative'].to_numpy()
 
     def __len__(self) -> int:
-        return len(self.examples)
+        return len(self.anchors)
 
     def __getitem__(self, idx: int) -> InputExample:
-        return self.examples[idx]
+        return InputExample(texts=[self.anchors[idx], self.positives[idx], self.negatives[idx]])
 
 class AnswerEvaluationModel:
     def __init__(
@@ -24,11 +121,16 @@ class AnswerEvaluationModel:
         base_model: str = 'all-MiniLM-L6-v2',
         device: str = None,
         batch_size: int = 16,
-        epochs: int = 5
+        epochs: int = 5,
+        patience: int = 2,
+        min_delta: float = 0.001
     ):
         self.base_model = base_model
         self.batch_size = batch_size
         self.epochs = epochs
+        # Stop after this many epochs without a validation gain of at least min_delta
+        self.patience = patience
+        self.min_delta = min_delta
         self.device = device if device else ('cuda' if torch.cuda.is_available() else 'cpu')
         self.model = None
         
@@ -42,47 +144,71 @@ class AnswerEvaluationModel:
 
     def prepare_data(
         self,
-        df: pd.DataFrame,
-        test_size: float = 0.2
-    ) -> Tuple[List[InputExample], List[InputExample]]:
-        """Prepare training and validation datasets."""
-        examples = []
-        
-        for idx, row in df.iterrows():
-            try:
-                # Convert to string and handle NaN values
-                anchor = str(row['Anchor']).strip() if pd.notna(row['Anchor']) else ""
-                positive = str(row['Positive']).strip() if pd.notna(row['Positive']) else ""
-                negative = str(row['Negative']).strip() if pd.notna(row['Negative']) else ""
-
-                if anchor and positive and negative:
-                    example = InputExample(texts=[anchor, positive, negative])
-                    examples.append(example)
-                    
-            except Exception as e:
-                self.logger.warning(f"Skipping row {idx} due to error: {str(e)}")
-
-        if not examples:
+        data: Union[pd.DataFrame, str],
+        test_size: float = 0.2,
+        chunksize: int = 50000
+    ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Prepare training and validation triplets from a DataFrame or an xlsx/CSV/Parquet path.
+        Files are streamed in chunks; the split keeps each question on one side.
+        """
+        triplets = load_triplets(data, chunksize) if isinstance(data, str) else build_triplets(data)
+
+        if triplets.empty:
             raise ValueError("No valid examples found in the dataset")
 
         # Split into training and validation sets
-        train_examples, val_examples = train_test_split(
-            examples,
-            test_size=test_size,
-            random_state=42
-        )
+        train_triplets, val_triplets = split_by_question(triplets, test_size=test_size)
 
-        self.logger.info(f"Created {len(train_examples)} training and {len(val_examples)} validation examples")
-        return train_examples, val_examples
+        self.logger.info(
+            f"Created {len(train_triplets)} training and {len(val_triplets)} validation triplets "
+            f"from {triplets['question'].nunique()} questions"
+        )
+        return train_triplets, val_triplets
 
-    def train(self, train_examples: List[InputExample], val_examples: List[InputExample]):
-        """Train the model with validation."""
+    def train(
+        self,
+        train_triplets: pd.DataFrame,
+        val_triplets: pd.DataFrame,
+        output_path: str = 'answer_evaluation_model',
+        checkpoint_dir: str = 'training_checkpoint',
+        resume: bool = True,
+        save_as: Optional[str] = 'triplet1'
+    ):
+        """
+        Train with a single fit() call, so the optimizer state and the warmup/decay schedule
+        run across all epochs. fit() scores triplet accuracy on the validation split after
+        each epoch and checkpoints into checkpoint_dir. The evaluation callback alone picks
+        the best model: it saves an epoch to output_path when accuracy gains at least
+        min_delta, and stops training once that has not happened for `patience` epochs.
+        An interrupted run resumes from checkpoint_dir when its data and settings match.
+        """
+        run_id = self.run_signature(train_triplets, val_triplets)
+        state = self.load_checkpoint(checkpoint_dir, run_id) if resume else None
+        if state and not FIT_CAN_RESUME:
+            self.logger.warning("This sentence-transformers version cannot resume fit(); starting over")
+            state = None
+        if state and not os.path.isdir(output_path):
+            self.logger.warning(f"Cannot resume: the best model so far is missing from {output_path}")
+            state = None
+        if state:
+            self.logger.info(f"Resuming after epoch {state['epoch']} (best validation accuracy {state['best_score']:.4f})")
+        else:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+            state = {
+                'run_id': run_id,
+                'base_model': self.base_model,
+                'train_size': len(train_triplets),
+                'epoch': 0,
+                'best_score': None,
+                'best_epoch': None,
+                'epochs_without_improvement': 0
+            }
         self.model = SentenceTransformer(self.base_model)
         self.model.to(self.device)
 
-        # Create data loaders
-        train_dataset = AnswerEvaluationDataset(train_examples)
-        val_dataset = AnswerEvaluationDataset(val_examples)
+        # Create data loader
+        train_dataset = AnswerEvaluationDataset(train_triplets)
 
         train_dataloader = DataLoader(
             train_dataset,
@@ -91,10 +217,14 @@ class AnswerEvaluationModel:
             drop_last=False
         )
 
-        val_dataloader = DataLoader(
-            val_dataset,
-            shuffle=False,
-            batch_size=self.batch_size
+        # Validation: how often the positive is closer to the anchor than the negative
+        val_evaluator = TripletEvaluator(
+            anchors=val_triplets['anchor'].tolist(),
+            positives=val_triplets['positive'].tolist(),
+            negatives=val_triplets['negative'].tolist(),
+            name='validation',
+            batch_size=self.batch_size,
+            show_progress_bar=False
         )
 
         # Define loss with distance metric
@@ -104,19 +234,110 @@ class AnswerEvaluationModel:
             triplet_margin=0.5
         )
 
-        # Train with validation
-        self.model.fit(
-            train_objectives=[(train_dataloader, train_loss)],
-            evaluator=None,  # Custom evaluator could be added here
-            epochs=self.epochs,
-            warmup_steps=100,
-            show_progress_bar=True,
-            output_path='answer_evaluation_model'
+        if state['best_score'] is None:
+            # The untrained model is the best until an epoch beats it
+            state['best_score'] = self.validation_score(val_evaluator)
+            state['best_epoch'] = 0
+            self.model.save(output_path)
+            self.logger.info(f"Validation accuracy before training: {state['best_score']:.4f}")
+        self.save_state(checkpoint_dir, state)
+        resumed_epoch = state['epoch']
+
+        def on_evaluation(score: float, epoch: int, steps: int):
+            # Called by fit() after each epoch's evaluation; counted here because the
+            # meaning of epoch differs between sentence-transformers versions
+            state['epoch'] += 1
+            if score >= state['best_score'] + self.min_delta:
+                state.update(best_score=float(score), best_epoch=state['epoch'], epochs_without_improvement=0)
+                self.model.save(output_path)
+            else:
+                state['epochs_without_improvement'] += 1
+            self.save_state(checkpoint_dir, state)
+            self.logger.info(
+                f"Epoch {state['epoch']}/{self.epochs}: validation accuracy {score:.4f} "
+                f"(best {state['best_score']:.4f} at epoch {state['best_epoch']})"
+            )
+            if state['epochs_without_improvement'] >= self.patience:
+                raise EarlyStopping()
+
+        fit_options = {'resume_from_checkpoint': True} if resume and resumed_epoch else {}
+        try:
+            self.model.fit(
+                train_objectives=[(train_dataloader, train_loss)],
+                evaluator=val_evaluator,
+                epochs=self.epochs,
+                warmup_steps=min(100, len(train_dataloader) * self.epochs // 10),
+                # The best model is saved by on_evaluation, not by fit()
+                output_path=None,
+                save_best_model=False,
+                callback=on_evaluation,
+                checkpoint_path=checkpoint_dir,
+                checkpoint_save_steps=len(train_dataloader),
+                checkpoint_save_total_limit=1,
+                show_progress_bar=True,
+                **fit_options
+            )
+        except EarlyStopping:
+            self.logger.info(f"Stopped early after epoch {state['epoch']}: no improvement for {self.patience} epochs")
+
+        # Save the best model as 'triplet1'
+        self.model = SentenceTransformer(output_path)
+        self.model.to(self.device)
+        if save_as:
+            self.model.save(save_as)
+        self.logger.info(
+            f"Best model (epoch {state['best_epoch']}, accuracy {state['best_score']:.4f}) "
+            f"saved as '{save_as or output_path}'"
         )
 
-        # Save the trained model as 'triplet1'
-        self.model.save('triplet1')
-        self.logger.info("Model saved as 'triplet1'")
+    def run_signature(self, train_triplets: pd.DataFrame, val_triplets: pd.DataFrame) -> str:
+        """Identifies a training run by its base model, settings and the exact triplets."""
+        digest = hashlib.blake2b(digest_size=16)
+        settings = {
+            'base_model': self.base_model,
+            'batch_size': self.batch_size,
+            'epochs': self.epochs,
+            'patience': self.patience,
+            'min_delta': self.min_delta
+        }
+        digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+        for triplets in (train_triplets, val_triplets):
+            hashes = pd.util.hash_pandas_object(triplets[['anchor', 'positive', 'negative']], index=False)
+            digest.update(hashes.to_numpy().tobytes())
+        return digest.hexdigest()
+
+    def validation_score(self, val_evaluator: TripletEvaluator) -> float:
+        """Triplet accuracy; newer sentence-transformers return a dict of metrics instead of a float"""
+        score = val_evaluator(self.model)
+        if isinstance(score, dict):
+            metric = getattr(val_evaluator, 'primary_metric', None)
+            score = score[metric] if metric in score else max(score.values())
+        return float(score)
+
+    def save_state(self, checkpoint_dir: str, state: Dict):
+        """Save the training state next to fit()'s checkpoints; the file is replaced atomically."""
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        state_path = os.path.join(checkpoint_dir, 'state.json')
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(state_path + '.tmp', state_path)
+
+    def load_checkpoint(self, checkpoint_dir: str, run_id: str) -> Optional[Dict]:
+        """Training state to resume from, or None when there is no checkpoint for this run."""
+        state_path = os.path.join(checkpoint_dir, 'state.json')
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path) as f:
+            state = json.load(f)
+        # Same base model, settings, training and validation data; anything else starts over
+        if state.get('run_id') != run_id:
+            self.logger.warning(f"Ignoring checkpoint in {checkpoint_dir}: it belongs to a different training run")
+            return None
+        # Nothing to resume before the first epoch finished, or once the run is over
+        if (not state['epoch'] or state['epoch'] >= self.epochs or
+                state['epochs_without_improvement'] >= self.patience):
+            return None
+        return state
 
     def evaluate_answer(self, question: str, student_answer: str, correct_answer: str) -> float:
         """
@@ -156,15 +377,12 @@ def main():
             epochs=5
         )
         
-        # Load data
-        # Update this path to where your Excel file is located
-        df = pd.read_excel("Final_100_Questions.xlsx")
-        
-        # Prepare data
-        train_examples, val_examples = evaluator.prepare_data(df)
+        # Load and prepare data
+        # Update this path to where your Excel, CSV or Parquet file is located
+        train_triplets, val_triplets = evaluator.prepare_data("Final_100_Questions.xlsx")
         
         # Train model
-        evaluator.train(train_examples, val_examples)
+        evaluator.train(train_triplets, val_triplets)
         
         # Test the model
         test_question = "What is object-oriented programming?"
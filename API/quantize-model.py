@@ -0,0 +1,169 @@
+"""
+Export an int8 dynamically quantized copy of the grading model and check its parity
+against the fp32 original on the question bank.
+
+The export is the quantized state_dict, written next to the model directory
+(./enhance_triplet -> ./enhance_triplet-int8.pt) and picked up by StudentAnswerEvaluator when
+MODEL_PRECISION=int8. The app rebuilds the architecture from the model directory, so keep both.
+
+    python quantize-model.py --model ./enhance_triplet --dataset Dataset.xlsx
+"""
+import os
+
+# Only the quantization helpers are needed from the app, not Firebase, Gemini or the bank
+os.environ['LEARNSMART_OFFLINE'] = '1'
+
+import argparse
+import io
+import logging
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import torch
+from sentence_transformers import SentenceTransformer
+
+from app import AnswerEmbeddingIndex, local_tier, quantize_model, quantized_model_path
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_texts(dataset_path: str) -> pd.DataFrame:
+    """Questions and their reference answers, blanks as empty strings"""
+    df = pd.read_excel(dataset_path)
+    columns = ['Anchor'] + AnswerEmbeddingIndex.ANSWER_COLUMNS
+    for column in columns:
+        df[column] = df[column].where(df[column].notna(), '').astype(str).str.strip()
+    return df[columns]
+
+
+def encode(model: SentenceTransformer, texts: List[str], batch_size: int) -> Dict:
+    start = time.perf_counter()
+    with torch.no_grad():
+        vectors = model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32)
+    return {'vectors': vectors, 'seconds': time.perf_counter() - start}
+
+
+def serialized_mb(model) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def answer_similarities(vectors: np.ndarray, df: pd.DataFrame, positions: Dict) -> np.ndarray:
+    """
+    (positive_sim, negative_sim) for each stand-in student answer, as local_verdict computes them.
+    The bank's wrong answers and question texts stand in for students; a stand-in is left out of
+    its own negatives, which would otherwise make every such decision a trivial reject.
+    """
+    negative_columns = AnswerEmbeddingIndex.ANSWER_COLUMNS[1:]
+    pairs = []
+    for _, row in df.iterrows():
+        if not row['Positive']:
+            continue
+        positive = vectors[positions[row['Positive']]]
+        for column in negative_columns + ['Anchor']:
+            if not row[column]:
+                continue
+            student = vectors[positions[row[column]]]
+            negatives = [float(vectors[positions[row[other]]] @ student)
+                         for other in negative_columns if other != column and row[other]]
+            pairs.append((float(positive @ student), max(negatives) if negatives else 0.0))
+    return np.array(pairs, dtype=np.float64).reshape(-1, 2)
+
+
+def parity_report(df: pd.DataFrame, fp32: Dict, int8: Dict, positions: Dict,
+                  accept: float, reject: float, min_margin: float) -> Dict:
+    a, b = fp32['vectors'], int8['vectors']
+    cosine = np.sum(a * b, axis=1)
+
+    # Drift is measured on the similarities the grading path actually compares
+    sims_fp32 = answer_similarities(a, df, positions)
+    sims_int8 = answer_similarities(b, df, positions)
+    drift = np.abs(sims_fp32[:, 0] - sims_int8[:, 0])
+    tiers_fp32 = local_tier(sims_fp32[:, 0], sims_fp32[:, 1], accept, reject, min_margin)
+    tiers_int8 = local_tier(sims_int8[:, 0], sims_int8[:, 1], accept, reject, min_margin)
+
+    return {
+        'texts': int(cosine.size),
+        'embedding_cosine': {
+            'mean': float(cosine.mean()),
+            'p1': float(np.percentile(cosine, 1)),
+            'min': float(cosine.min()),
+        },
+        'similarity_drift': {
+            'pairs': int(drift.size),
+            'mean': float(drift.mean()),
+            'p99': float(np.percentile(drift, 99)),
+            'max': float(drift.max()),
+        },
+        'tier_agreement': float(np.mean(tiers_fp32 == tiers_int8)),
+        'speedup': fp32['seconds'] / int8['seconds'] if int8['seconds'] else float('inf'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an int8 grading model and check parity with fp32")
+    parser.add_argument('--model', default='./enhance_triplet')
+    parser.add_argument('--dataset', default='Dataset.xlsx')
+    parser.add_argument('--output', default=None, help="default: <model>-int8.pt")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--accept-threshold', type=float, default=float(os.environ.get('GRADING_ACCEPT_THRESHOLD', 0.75)))
+    parser.add_argument('--reject-threshold', type=float, default=float(os.environ.get('GRADING_REJECT_THRESHOLD', 0.45)))
+    parser.add_argument('--min-margin', type=float, default=float(os.environ.get('GRADING_MIN_MARGIN', 0.1)))
+    parser.add_argument('--min-cosine', type=float, default=0.97,
+                        help="fail if any text's int8 embedding is further than this from fp32")
+    parser.add_argument('--min-agreement', type=float, default=0.98,
+                        help="fail if fewer local-tier decisions than this fraction stay the same")
+    parser.add_argument('--check-only', action='store_true', help="run the parity check without writing the export")
+    args = parser.parse_args()
+
+    output = args.output or quantized_model_path(args.model)
+
+    df = load_texts(args.dataset)
+    texts = sorted({text for text in df.to_numpy().ravel() if text})
+    positions = {text: i for i, text in enumerate(texts)}
+    logger.info(f"Loaded {len(texts)} distinct texts from {args.dataset}")
+
+    model = SentenceTransformer(args.model, device='cpu')
+    model.eval()
+    fp32_mb = serialized_mb(model)
+    fp32 = encode(model, texts, args.batch_size)
+
+    # Quantizes in place, so the fp32 model is gone after this
+    model = quantize_model(model)
+    int8_mb = serialized_mb(model)
+    int8 = encode(model, texts, args.batch_size)
+
+    report = parity_report(df, fp32, int8, positions, args.accept_threshold, args.reject_threshold, args.min_margin)
+    cosine, drift = report['embedding_cosine'], report['similarity_drift']
+    print(f"Embedding cosine fp32 vs int8: mean {cosine['mean']:.4f}, p1 {cosine['p1']:.4f}, min {cosine['min']:.4f}")
+    print(f"Answer similarity drift over {drift['pairs']} pairs: mean {drift['mean']:.4f}, "
+          f"p99 {drift['p99']:.4f}, max {drift['max']:.4f}")
+    print(f"Local-tier decisions unchanged: {report['tier_agreement']:.2%}")
+    print(f"Encode time for {report['texts']} texts: fp32 {fp32['seconds']:.2f}s, int8 {int8['seconds']:.2f}s "
+          f"({report['speedup']:.1f}x)")
+    print(f"Serialized weights: fp32 {fp32_mb:.1f} MB, int8 {int8_mb:.1f} MB")
+
+    passed = cosine['min'] >= args.min_cosine and report['tier_agreement'] >= args.min_agreement
+    if not passed:
+        logger.error("Parity check failed; the int8 model was not exported")
+        sys.exit(1)
+
+    if not args.check_only:
+        # Weights only: the app rebuilds the model from --model and loads these with weights_only=True
+        torch.save(model.state_dict(), output)
+        logger.info(f"Quantized model saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
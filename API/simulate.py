@@ -0,0 +1,390 @@
+"""
+Offline simulator and benchmark for the adaptive quiz loop.
+
+Drives synthetic students with configurable skill profiles through
+QuizSession.init_topic_quiz and QuizSession.process_answer_and_advance, using a
+stub grader instead of the model/Gemini and an in-memory stand-in for Firestore.
+Reports throughput, per-stage latency, memory growth and policy convergence.
+
+    python simulate.py --students 2000 --profiles weak:1,average:2,strong:1
+    python simulate.py --students 500 --rounds 3 --json bench.json
+"""
+import os
+
+# Must be set before app is imported so no Firebase, model or Gemini client is created
+os.environ['LEARNSMART_OFFLINE'] = '1'
+# The engine logs on every answer; keep that cost in the measurement but off the terminal
+os.environ.setdefault('LOG_FILE', os.devnull)
+
+import argparse
+import contextlib
+import datetime
+import json
+import random
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+import app
+
+LEVELS = ['Easy', 'Medium', 'Hard']
+
+# Skill on the same 0-2 scale as the difficulty levels, plus how much each answered
+# question improves it
+PROFILES = {
+    'weak': {'skill': 0.2, 'learning_rate': 0.01},
+    'average': {'skill': 1.0, 'learning_rate': 0.02},
+    'strong': {'skill': 1.8, 'learning_rate': 0.03},
+}
+
+
+class FakeSnapshot:
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, store, path):
+        self._store = store
+        self._path = path
+
+    def get(self):
+        data = self._store.docs.get(self._path)
+        self._store.reads += 1
+        return FakeSnapshot(data)
+
+    def set(self, data, merge=False):
+        doc = dict(self._store.docs.get(self._path) or {}) if merge else {}
+        for key, value in data.items():
+            if value is app.firestore.DELETE_FIELD:
+                doc.pop(key, None)
+            elif value is app.firestore.SERVER_TIMESTAMP:
+                doc[key] = datetime.datetime.now()
+            else:
+                doc[key] = value
+        self._store.docs[self._path] = doc
+        self._store.writes += 1
+        self._store.bytes_written += sum(len(v) for v in doc.values() if isinstance(v, bytes))
+
+
+class FakeCollection:
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self._store, (self._name, doc_id))
+
+
+class FakeFirestore:
+    """Just enough of the Firestore client for QuizSession: collection().document().get/set"""
+    def __init__(self):
+        self.docs = {}
+        self.reads = 0
+        self.writes = 0
+        self.bytes_written = 0
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+
+class StubEvaluator:
+    """
+    Stands in for StudentAnswerEvaluator: shares the real bank snapshot but grades by
+    comparing the answer to the reference answer instead of calling the model or Gemini.
+    """
+    def __init__(self, dataset_path: str, grader_latency: float = 0.0):
+        df = pd.read_excel(dataset_path)
+        df.index = pd.Index(df['Unique ID'].to_numpy(dtype=np.int64))
+        self.bank = app.QuestionBankSnapshot(0, df)
+        self.grader_latency = grader_latency
+
+    def grade_answer(self, question_idx, student_answer, defer_feedback=False, bank=None):
+        row = (bank or self.bank).index.get(question_idx)
+        if row is None:
+            return None, {'error': 'Invalid question'}
+        if self.grader_latency:
+            time.sleep(self.grader_latency)
+
+        correct = student_answer.lower().strip() == str(row['Positive']).lower().strip()
+        return row, {
+            'correct': correct,
+            'score': 90.0 if correct else 20.0,
+            'feedback': 'Simulated verdict',
+            'improvements': [],
+            'tier': 'stub'
+        }
+
+
+class SyntheticStudent:
+    """Answers correctly with a probability that falls off with difficulty and grows with practice"""
+    def __init__(self, profile: str, rng: random.Random):
+        self.profile = profile
+        self.skill = PROFILES[profile]['skill']
+        self.learning_rate = PROFILES[profile]['learning_rate']
+        self.rng = rng
+
+    def p_correct(self, difficulty: str) -> float:
+        gap = self.skill - LEVELS.index(difficulty)
+        return 1.0 / (1.0 + np.exp(-3.0 * (gap + 0.5)))
+
+    def answer(self, row: Dict, difficulty: str) -> str:
+        correct = self.rng.random() < self.p_correct(difficulty)
+        self.skill += self.learning_rate
+        return str(row['Positive']) if correct else str(row['Negative'])
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    @contextlib.contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - start)
+
+    def wrap(self, obj, name: str, stage: str):
+        """Time every call to a method on a class without changing its behaviour"""
+        original = getattr(obj, name)
+        timer = self
+
+        def timed(*args, **kwargs):
+            with timer.time(stage):
+                return original(*args, **kwargs)
+
+        setattr(obj, name, timed)
+        return original
+
+    def summary(self) -> Dict:
+        report = {}
+        for stage, values in self.samples.items():
+            ms = np.array(values) * 1000
+            report[stage] = {
+                'count': int(ms.size),
+                'mean_ms': float(ms.mean()),
+                'p50_ms': float(np.percentile(ms, 50)),
+                'p95_ms': float(np.percentile(ms, 95)),
+                'p99_ms': float(np.percentile(ms, 99)),
+                'total_s': float(ms.sum() / 1000),
+            }
+        return report
+
+
+def parse_profiles(spec: str) -> List[str]:
+    """'weak:1,average:2' -> ['weak', 'average', 'average'] (students cycle through the list)"""
+    weighted = []
+    for part in spec.split(','):
+        name, _, weight = part.partition(':')
+        name = name.strip()
+        if name not in PROFILES:
+            raise ValueError(f"Unknown profile '{name}', expected one of {', '.join(PROFILES)}")
+        weighted.extend([name] * int(weight or 1))
+    return weighted
+
+
+def run_student(student, session, user_id, topic, max_steps, timer):
+    """Run one topic quiz to completion (or max_steps); returns convergence details"""
+    with timer.time('init_topic_quiz'):
+        num_questions = session.init_topic_quiz(topic, user_id)
+    if num_questions == 0:
+        return None
+
+    start_level = session.current_topic_levels[topic]
+    levels_to_hard = 0 if start_level == 'Hard' else None
+    level_transitions = 0
+    correct = 0
+    steps = 0
+    completed = False
+
+    question = session.get_next_quiz_question()
+    while question is not None and steps < max_steps:
+        row = session.bank.index.get(question['id'])
+        answer = student.answer(row, question['difficulty'])
+        with timer.time('process_answer_and_advance'):
+            result, question, completed = session.process_answer_and_advance(question['id'], answer)
+        steps += 1
+        correct += int(result['is_correct'])
+
+        if result['level_complete']:
+            level_transitions += 1
+            if levels_to_hard is None and result['new_level'] == 'Hard':
+                levels_to_hard = level_transitions
+        if completed:
+            break
+
+    with timer.time('save_rl_model_state'):
+        session.save_rl_model_state(user_id)
+
+    return {
+        'steps': steps,
+        'correct': correct,
+        'completed': completed,
+        'levels_completed': level_transitions,
+        'levels_to_hard': levels_to_hard,
+        'final_level': session.current_topic_levels.get(topic),
+    }
+
+
+def describe(values) -> Dict:
+    if not values:
+        return {'count': 0}
+    arr = np.array(values, dtype=np.float64)
+    return {
+        'count': int(arr.size),
+        'mean': float(arr.mean()),
+        'p50': float(np.percentile(arr, 50)),
+        'p90': float(np.percentile(arr, 90)),
+        'max': float(arr.max()),
+    }
+
+
+def simulate(args) -> Dict:
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    rng = random.Random(args.seed)
+
+    fake_db = FakeFirestore()
+    app.db = fake_db
+    evaluator = StubEvaluator(args.dataset, grader_latency=args.grader_latency_ms / 1000.0)
+
+    topics = [args.topic] if args.topic else sorted(evaluator.bank.frame()['Topic'].dropna().unique())
+    profiles = parse_profiles(args.profiles)
+
+    timer = StageTimer()
+    timer.wrap(evaluator, 'grade_answer', 'grade_answer')
+    timer.wrap(app.RLLevelManager, 'get_recommended_level', 'rl_select')
+    timer.wrap(app.RLLevelManager, 'update_from_quiz_session', 'rl_update')
+
+    tracemalloc.start()
+    baseline_mem, _ = tracemalloc.get_traced_memory()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    by_profile = defaultdict(list)
+    total_steps = 0
+    start = time.perf_counter()
+
+    for i in range(args.students):
+        profile = profiles[i % len(profiles)]
+        student = SyntheticStudent(profile, rng)
+        user_id = f"sim-{i}"
+        topic = topics[i % len(topics)]
+
+        # Each round is a fresh session, so the RL policy round-trips through the fake store
+        for _ in range(args.rounds):
+            session = app.QuizSession(evaluator, user_id)
+            outcome = run_student(student, session, user_id, topic, args.max_steps, timer)
+            if outcome is not None:
+                by_profile[profile].append(outcome)
+                total_steps += outcome['steps']
+
+    elapsed = time.perf_counter() - start
+    current_mem, peak_mem = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    convergence = {}
+    for profile, outcomes in sorted(by_profile.items()):
+        reached = [o['levels_to_hard'] for o in outcomes if o['levels_to_hard'] is not None]
+        convergence[profile] = {
+            'quizzes': len(outcomes),
+            'completion_rate': sum(o['completed'] for o in outcomes) / len(outcomes),
+            'reached_hard_rate': len(reached) / len(outcomes),
+            'levels_to_hard': describe(reached),
+            'steps_per_quiz': describe([o['steps'] for o in outcomes]),
+            'accuracy': sum(o['correct'] for o in outcomes) / max(1, sum(o['steps'] for o in outcomes)),
+            'final_levels': {
+                level: sum(o['final_level'] == level for o in outcomes) for level in LEVELS
+            },
+        }
+
+    return {
+        'config': vars(args),
+        'throughput': {
+            'students': args.students,
+            'steps': total_steps,
+            'elapsed_s': elapsed,
+            'steps_per_sec': total_steps / elapsed if elapsed else 0.0,
+        },
+        'stages': timer.summary(),
+        'memory': {
+            'traced_growth_mb': (current_mem - baseline_mem) / 2**20,
+            'traced_peak_mb': peak_mem / 2**20,
+            # ru_maxrss is reported in kilobytes on Linux
+            'max_rss_growth_mb': (rss_after - rss_before) / 1024,
+        },
+        'firestore': {
+            'reads': fake_db.reads,
+            'writes': fake_db.writes,
+            'documents': len(fake_db.docs),
+            'policy_bytes_written': fake_db.bytes_written,
+        },
+        'convergence': convergence,
+    }
+
+
+def print_report(report: Dict):
+    t = report['throughput']
+    print(f"Simulated {t['students']} students, {t['steps']} answers in {t['elapsed_s']:.2f}s "
+          f"({t['steps_per_sec']:.0f} steps/sec)")
+
+    print("\nStage latency (ms):")
+    print(f"  {'stage':<28}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, s in sorted(report['stages'].items()):
+        print(f"  {stage:<28}{s['count']:>8}{s['mean_ms']:>10.3f}{s['p50_ms']:>10.3f}"
+              f"{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}")
+
+    m = report['memory']
+    print(f"\nMemory: traced growth {m['traced_growth_mb']:.1f} MB, traced peak {m['traced_peak_mb']:.1f} MB, "
+          f"max RSS growth {m['max_rss_growth_mb']:.1f} MB")
+
+    f = report['firestore']
+    print(f"Firestore (fake): {f['reads']} reads, {f['writes']} writes, {f['documents']} documents")
+
+    print("\nConvergence:")
+    for profile, c in report['convergence'].items():
+        lth = c['levels_to_hard']
+        to_hard = (f"mean {lth['mean']:.2f}, p50 {lth['p50']:.0f}, p90 {lth['p90']:.0f}"
+                   if lth['count'] else "never")
+        print(f"  {profile:<8} quizzes={c['quizzes']} accuracy={c['accuracy']:.2f} "
+              f"completed={c['completion_rate']:.0%} reached Hard={c['reached_hard_rate']:.0%} "
+              f"levels to Hard: {to_hard}")
+        print(f"           steps/quiz mean {c['steps_per_quiz']['mean']:.1f}, final levels {c['final_levels']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-student benchmark for the adaptive quiz loop")
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--profiles', default='weak:1,average:2,strong:1',
+                        help="comma-separated profile[:weight] list; profiles: " + ', '.join(PROFILES))
+    parser.add_argument('--topic', default=None, help="quiz a single topic (default: spread over all topics)")
+    parser.add_argument('--rounds', type=int, default=1, help="topic quizzes per student, each in a fresh session")
+    parser.add_argument('--max-steps', type=int, default=60, help="answers before a quiz is abandoned")
+    parser.add_argument('--grader-latency-ms', type=float, default=0.0, help="simulated grading delay per answer")
+    parser.add_argument('--dataset', default='Dataset.xlsx')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', default=None, help="also write the full report to this file")
+    args = parser.parse_args()
+
+    report = simulate(args)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
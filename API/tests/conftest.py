@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app module is imported without Firebase, Gemini or the question bank
+os.environ.setdefault('LEARNSMART_OFFLINE', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
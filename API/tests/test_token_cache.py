@@ -0,0 +1,128 @@
+import pytest
+from firebase_admin import auth
+
+from app import VerifiedTokenCache
+from local_auth import LocalTokenSigner
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class CountingSigner(LocalTokenSigner):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+
+    def verify_id_token(self, id_token, check_revoked=False):
+        self.calls += 1
+        return super().verify_id_token(id_token, check_revoked=check_revoked)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def signer(clock):
+    return CountingSigner('learnsmart-test', clock=clock)
+
+
+def test_valid_token_is_verified_once_then_served_from_cache(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, clock=clock)
+    token = signer.sign('student-1', {'role': 'teacher'})
+
+    first = cache.verify_id_token(token)
+    second = cache.verify_id_token(token)
+
+    assert first['uid'] == 'student-1' and first['role'] == 'teacher'
+    assert second == first
+    assert signer.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_token_is_rejected_and_never_cached(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, clock=clock)
+    token = signer.sign('student-1', expires_in=-1)
+
+    for _ in range(2):
+        with pytest.raises(auth.ExpiredIdTokenError):
+            cache.verify_id_token(token)
+    assert signer.calls == 2
+
+
+def test_cached_token_stops_working_at_its_exp(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, clock=clock)
+    token = signer.sign('student-1', expires_in=60)
+    cache.verify_id_token(token)
+
+    clock.now += 60
+    with pytest.raises(auth.ExpiredIdTokenError):
+        cache.verify_id_token(token)
+    assert signer.calls == 2
+
+
+def test_wrong_audience_is_rejected_and_never_cached(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, clock=clock)
+    token = signer.sign('student-1', audience='another-project')
+
+    for _ in range(2):
+        with pytest.raises(auth.InvalidIdTokenError):
+            cache.verify_id_token(token)
+    assert signer.calls == 2
+
+
+def test_tampered_token_is_rejected(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, clock=clock)
+    forged = LocalTokenSigner('learnsmart-test', clock=clock).sign('student-1', {'role': 'admin'})
+
+    with pytest.raises(auth.InvalidIdTokenError):
+        cache.verify_id_token(forged)
+
+
+def test_revoked_token_is_rejected_after_the_revocation_check_interval(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, check_revoked=True,
+                               revocation_check_interval=300, clock=clock)
+    token = signer.sign('student-1')
+    cache.verify_id_token(token)
+
+    clock.now += 1
+    signer.revoke('student-1')
+    # Still inside the interval, so the cached verification is served
+    assert cache.verify_id_token(token)['uid'] == 'student-1'
+
+    clock.now += 300
+    with pytest.raises(auth.RevokedIdTokenError):
+        cache.verify_id_token(token)
+    with pytest.raises(auth.RevokedIdTokenError):
+        cache.verify_id_token(token)
+
+    # A token issued after the revocation is accepted again
+    assert cache.verify_id_token(signer.sign('student-1'))['uid'] == 'student-1'
+
+
+def test_revocation_is_not_checked_unless_enabled(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, clock=clock)
+    token = signer.sign('student-1')
+
+    clock.now += 1
+    signer.revoke('student-1')
+    clock.now += 300
+    assert cache.verify_id_token(token)['uid'] == 'student-1'
+
+
+def test_least_recently_used_tokens_are_evicted(signer, clock):
+    cache = VerifiedTokenCache(verify=signer.verify_id_token, max_entries=2, clock=clock)
+    tokens = [signer.sign(f"student-{i}") for i in range(3)]
+    for token in tokens:
+        cache.verify_id_token(token)
+
+    cache.verify_id_token(tokens[2])
+    assert signer.calls == 3
+    cache.verify_id_token(tokens[0])
+    assert signer.calls == 4
@@ -87,6 +87,7 @@ function QuizNavBar() {
     localStorage.removeItem('authToken');
     localStorage.removeItem('enrollmentId');
     localStorage.removeItem('userEmail');
+    localStorage.removeItem('quizSessionId');
 
     // Navigate to home page after logout
     navigate('/');
@@ -3,7 +3,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuthState } from 'react-firebase-hooks/auth';
 import { auth, db } from '../firebase';
-import { doc, collection, addDoc, updateDoc, increment, getDoc } from 'firebase/firestore';
+import { doc, collection, addDoc, updateDoc, getDoc } from 'firebase/firestore';
 import {
   CheckCircle,
   XCircle,
@@ -100,17 +100,7 @@ function QuizScreen() {
         timestamp: new Date(),
       });
   
-      const topicPath = `topicsMastery.${question.topic}`;
-  
-      // Only update topicQuiz for topic quizzes (not exams)
-      if (quizType === 'topic') {
-        await updateDoc(userRef, {
-          [`${topicPath}.topicQuiz.correct`]: increment(isCorrect ? 1 : 0),
-          [`${topicPath}.topicQuiz.incorrect`]: increment(isCorrect ? 0 : 1),
-          [`${topicPath}.topicQuiz.lastUpdated`]: new Date(),
-          [`${topicPath}.lastUpdated`]: new Date(),
-        });
-      }
+      // topicsMastery.<topic>.topicQuiz counts are kept by the API from the graded answer
     } catch (error) {
       console.error("Error saving attempt:", error);
     }
@@ -135,7 +125,8 @@ function QuizScreen() {
         body: JSON.stringify({
           question_id: currentQuestion.id,
           answer: answer,
-          quiz_type: quizType
+          quiz_type: quizType,
+          session_id: localStorage.getItem('quizSessionId')
         })
       });
   
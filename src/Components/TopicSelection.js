@@ -276,7 +276,9 @@ function TopicSelection() {
         body: JSON.stringify({
           type: quizType, // Uses current quiz type (exam or topic)
           topics: [topic],
-          user_id: userId
+          user_id: userId,
+          // Anonymous quizzes reuse the session the API issued last time
+          session_id: localStorage.getItem('quizSessionId')
         }),
         credentials: 'include'
       });
@@ -288,6 +290,8 @@ function TopicSelection() {
 
       const data = await response.json();
 
+      // Sent back with every answer; without a sign-in it is the only link to this quiz
+      localStorage.setItem('quizSessionId', data.session_id);
       localStorage.setItem('currentQuiz', JSON.stringify({
         currentQuestion: data.question,
         totalQuestions: data.total_questions,
@@ -322,7 +326,9 @@ function TopicSelection() {
         body: JSON.stringify({
           type: quizType,
           topics: selectedTopic ? [selectedTopic] : undefined,
-          user_id: userId
+          user_id: userId,
+          // Anonymous quizzes reuse the session the API issued last time
+          session_id: localStorage.getItem('quizSessionId')
         }),
         credentials: 'include'
       });
@@ -334,6 +340,8 @@ function TopicSelection() {
 
       const data = await response.json();
 
+      // Sent back with every answer; without a sign-in it is the only link to this quiz
+      localStorage.setItem('quizSessionId', data.session_id);
       localStorage.setItem('currentQuiz', JSON.stringify({
         currentQuestion: data.question,
         totalQuestions: data.total_questions,